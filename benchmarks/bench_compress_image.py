@@ -0,0 +1,106 @@
+# 截图压缩基准测试：对比逐步降低质量的旧算法与二分查找的Screenshot.compress_image
+#
+# 用法: python benchmarks/bench_compress_image.py [--frames 10] [--width 1920] [--height 1080]
+# 输出每种图片大小上限下的平均编码次数、平均耗时和平均输出字节数。
+
+import os
+import sys
+import time
+import random
+import argparse
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image, ImageDraw
+
+from client.screenshot import Screenshot, PILLOW_AVAILABLE
+from client.config import SCREENSHOT_QUALITY
+
+def render_frames(count, width, height, seed=1):
+    """生成类似桌面截图的PNG帧：窗口色块、文字行和少量噪点，相邻帧只有局部变化"""
+    rng = random.Random(seed)
+    base = Image.new('RGB', (width, height), (32, 64, 96))
+    draw = ImageDraw.Draw(base)
+    for _ in range(12):
+        x, y = rng.randrange(width - 200), rng.randrange(height - 150)
+        draw.rectangle((x, y, x + rng.randrange(200, 800), y + rng.randrange(150, 600)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)), outline=(0, 0, 0))
+    for line in range(0, height, 18):
+        draw.text((rng.randrange(40), line), ''.join(rng.choice('abcdefghij 0123456789') for _ in range(150)),
+                  fill=(230, 230, 230))
+    # 噪点使JPEG无法把整幅图压得很小
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    base = Image.blend(base, noise, 0.15)
+
+    frames = []
+    for index in range(count):
+        frame = base.copy()
+        ImageDraw.Draw(frame).text((width - 120, height - 20), '12:%02d:%02d' % (index // 60, index % 60),
+                                   fill=(255, 255, 255))
+        buffer = BytesIO()
+        frame.save(buffer, 'PNG')
+        frames.append(buffer.getvalue())
+    return frames
+
+def legacy_compress(image_data, max_size):
+    """旧算法：从SCREENSHOT_QUALITY开始每次降低5，直到不超过上限或质量降到10"""
+    image = Image.open(BytesIO(image_data))
+    if image.mode == 'RGBA':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    quality = SCREENSHOT_QUALITY
+    while True:
+        buffer.seek(0)
+        buffer.truncate()
+        image.save(buffer, format='JPEG', quality=quality)
+        compressed_data = buffer.getvalue()
+        if len(compressed_data) <= max_size or quality <= 10:
+            return compressed_data
+        quality -= 5
+
+def measure(compress, frames, max_size):
+    """依次压缩所有帧，返回(平均编码次数, 平均耗时毫秒, 平均字节数, 超过上限的帧数)"""
+    encodes = [0]
+    original_save = Image.Image.save
+
+    def counting_save(self, *args, **kwargs):
+        encodes[0] += 1
+        return original_save(self, *args, **kwargs)
+
+    Image.Image.save = counting_save
+    try:
+        sizes = []
+        started = time.perf_counter()
+        for frame in frames:
+            sizes.append(len(compress(frame, max_size)))
+        elapsed = time.perf_counter() - started
+    finally:
+        Image.Image.save = original_save
+    count = len(frames)
+    return (encodes[0] / count, elapsed * 1000 / count, sum(sizes) / count,
+            sum(1 for size in sizes if size > max_size))
+
+def main():
+    parser = argparse.ArgumentParser(description='截图压缩基准测试')
+    parser.add_argument('--frames', type=int, default=10)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+    if not PILLOW_AVAILABLE:
+        sys.exit('需要安装Pillow')
+
+    frames = render_frames(args.frames, args.width, args.height)
+    reference = len(legacy_compress(frames[0], 1 << 40))
+    print('帧: %d x %dx%d，质量%d时JPEG大小: %d字节' % (args.frames, args.width, args.height,
+                                                  SCREENSHOT_QUALITY, reference))
+    print('%-10s %-8s %10s %12s %12s %8s' % ('上限', '算法', '编码次数', '耗时(ms)', '大小(字节)', '超限'))
+    for ratio in (1.2, 0.6, 0.3, 0.1):
+        max_size = int(reference * ratio)
+        Screenshot._last_quality, Screenshot._last_scale = None, 1.0
+        for name, compress in (('legacy', legacy_compress), ('adaptive', Screenshot.compress_image)):
+            passes, elapsed, size, over = measure(compress, frames, max_size)
+            print('%-10d %-8s %10.1f %12.1f %12d %8d' % (max_size, name, passes, elapsed, size, over))
+
+if __name__ == '__main__':
+    main()
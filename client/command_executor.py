@@ -2,11 +2,19 @@
 
 import os
 import sys
+import codecs
+import signal
 import subprocess
 import shutil
+import threading
 import time
 from .logger import logger
-from .config import COMMAND_TIMEOUT, UPDATE_TEMP_DIR, BACKUP_DIR, ROLLBACK_TIMEOUT
+from .output_stream import OutputTail
+from .config import (
+    COMMAND_TIMEOUT, FILE_OPERATION_TIMEOUT, SCRIPT_UPDATE_TIMEOUT,
+    COMMAND_OUTPUT_INTERVAL, COMMAND_OUTPUT_TAIL,
+    UPDATE_TEMP_DIR, BACKUP_DIR, ROLLBACK_TIMEOUT
+)
 
 # 兼容Python 2.7和3.x
 PY2 = sys.version_info[0] == 2
@@ -14,21 +22,33 @@ PY2 = sys.version_info[0] == 2
 class CommandExecutor:
     """命令执行类"""
     
+    # 各类型命令的默认超时时间（秒）
+    TIMEOUTS = {
+        'shell': COMMAND_TIMEOUT,
+        'script_update': SCRIPT_UPDATE_TIMEOUT,
+        'file_operation': FILE_OPERATION_TIMEOUT
+    }
+    
     @staticmethod
-    def execute_command(command_id, command_type, command_content):
-        """执行命令"""
+    def execute_command(command_id, command_type, command_content, timeout=None, output=None):
+        """执行命令，timeout为本条命令的超时时间（秒），缺省使用该类型的默认值
+
+        output为可选的输出上报对象（OutputStreamer），shell命令的输出边执行边写入并定期上报，
+        此时返回的结果只包含退出状态说明。
+        """
         logger.info('开始执行命令，命令ID: %s，类型: %s，内容: %s', command_id, command_type, command_content)
         
         result = ''
         status = 'executed'
+        timeout = timeout or CommandExecutor.TIMEOUTS.get(command_type, COMMAND_TIMEOUT)
         
         try:
             if command_type == 'shell':
-                result = CommandExecutor._execute_shell_command(command_content)
+                result = CommandExecutor._execute_shell_command(command_content, timeout, output)
             elif command_type == 'script_update':
-                result = CommandExecutor._execute_script_update(command_content)
+                result = CommandExecutor._execute_script_update(command_content, timeout)
             elif command_type == 'file_operation':
-                result = CommandExecutor._execute_file_operation(command_content)
+                result = CommandExecutor._execute_file_operation(command_content, timeout)
             else:
                 result = f'未知命令类型: {command_type}'
                 status = 'failed'
@@ -43,37 +63,109 @@ class CommandExecutor:
         return status, result
     
     @staticmethod
-    def _execute_shell_command(command):
-        """执行shell命令"""
+    def _execute_shell_command(command, timeout=COMMAND_TIMEOUT, output=None):
+        """执行shell命令，边执行边读取输出，超时时终止进程并保留已产生的输出
+
+        内存中只保留最后COMMAND_OUTPUT_TAIL个字符作为结果；提供output时输出同时写入output并定期上报。
+        """
         logger.debug('执行shell命令: %s', command)
         
+        tail = OutputTail(COMMAND_OUTPUT_TAIL)
+        
+        def on_text(text):
+            tail.append(text)
+            if output is not None:
+                output.write(text)
+        
         try:
-            # 执行命令，设置超时
-            output = subprocess.check_output(
-                command, 
-                shell=True, 
-                stderr=subprocess.STDOUT, 
-                timeout=COMMAND_TIMEOUT
+            # 在新的进程组中执行，超时时连同子进程一起终止
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
             )
+            reader = threading.Thread(target=CommandExecutor._read_output, args=(process.stdout, on_text),
+                                      name='command_output_reader')
+            reader.daemon = True
+            reader.start()
             
-            # 处理输出
-            if PY2:
-                return output.strip()
-            else:
-                return output.strip().decode('utf-8')
-        
-        except subprocess.TimeoutExpired:
-            return f'命令执行超时（{COMMAND_TIMEOUT}秒）'
-        except subprocess.CalledProcessError as e:
-            if PY2:
-                return f'命令执行失败，退出码: {e.returncode}，输出: {e.output.strip()}'
-            else:
-                return f'命令执行失败，退出码: {e.returncode}，输出: {e.output.strip().decode("utf-8")}'
+            timed_out = False
+            deadline = time.time() + timeout
+            while True:
+                try:
+                    process.wait(timeout=max(min(COMMAND_OUTPUT_INTERVAL, deadline - time.time()), 0.01))
+                    break
+                except subprocess.TimeoutExpired:
+                    if time.time() >= deadline:
+                        timed_out = True
+                        CommandExecutor._kill_process(process)
+                        process.wait()
+                        break
+                    if output is not None:
+                        output.flush()
+            reader.join(5)
         except Exception as e:
             return f'命令执行异常: {str(e)}'
+        
+        if timed_out:
+            status_line = f'命令执行超时（{timeout}秒）'
+        elif process.returncode != 0:
+            status_line = f'命令执行失败，退出码: {process.returncode}'
+        else:
+            status_line = ''
+        
+        if output is not None:
+            # 输出已上报，结果只追加退出状态；剩余输出多次上报失败时放入结果中随结果上报
+            rest = ''
+            for attempt in range(3):
+                if output.flush():
+                    break
+                time.sleep(1)
+            else:
+                rest = output.drain(COMMAND_OUTPUT_TAIL)
+            if rest:
+                return f'{rest}\n{status_line}' if status_line else rest
+            return f'\n{status_line}' if status_line and output.written else status_line
+        
+        text = tail.getvalue().strip()
+        if tail.dropped:
+            text = f'[... 省略{tail.dropped}个字符 ...]\n{text}'
+        if not status_line:
+            return text
+        if process.returncode != 0 and not timed_out:
+            return f'{status_line}，输出: {text}'
+        return f'{text}\n{status_line}' if text else status_line
+    
+    @staticmethod
+    def _read_output(stream, on_text):
+        """按块读取进程输出并增量解码为UTF-8文本"""
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        try:
+            while True:
+                chunk = os.read(stream.fileno(), 8192)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                if text:
+                    on_text(text)
+            text = decoder.decode(b'', True)
+            if text:
+                on_text(text)
+        finally:
+            stream.close()
+    
+    @staticmethod
+    def _kill_process(process):
+        """终止超时的命令进程组"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            process.kill()
     
     @staticmethod
-    def _execute_script_update(update_info):
+    def _execute_script_update(update_info, timeout=SCRIPT_UPDATE_TIMEOUT):
         """执行脚本更新"""
         logger.debug('执行脚本更新: %s', update_info)
         
@@ -108,7 +200,7 @@ class CommandExecutor:
             
             # 下载更新包
             update_file = os.path.join(UPDATE_TEMP_DIR, f'update_{version}.zip')
-            CommandExecutor._download_file(update_url, update_file)
+            CommandExecutor._download_file(update_url, update_file, timeout)
             
             # 解压更新包
             import zipfile
@@ -142,7 +234,7 @@ class CommandExecutor:
             return f'脚本更新失败: {str(e)}'
     
     @staticmethod
-    def _execute_file_operation(file_operation):
+    def _execute_file_operation(file_operation, timeout=FILE_OPERATION_TIMEOUT):
         """执行文件操作"""
         logger.debug('执行文件操作: %s', file_operation)
         
@@ -161,7 +253,7 @@ class CommandExecutor:
                 url = operation_data.get('url')
                 if not url:
                     return '文件上传操作缺少URL'
-                CommandExecutor._download_file(url, file_path)
+                CommandExecutor._download_file(url, file_path, timeout)
                 return f'文件下载成功: {file_path}'
             
             elif operation_type == 'download':
@@ -192,19 +284,19 @@ class CommandExecutor:
             return f'文件操作失败: {str(e)}'
     
     @staticmethod
-    def _download_file(url, save_path):
-        """下载文件"""
+    def _download_file(url, save_path, timeout=30):
+        """下载文件，timeout为网络读写超时时间（秒）"""
         logger.debug('下载文件: %s -> %s', url, save_path)
         
         try:
             if PY2:
                 import urllib2
-                response = urllib2.urlopen(url, timeout=30)
-                with open(save_path, 'wb') as f:
-                    f.write(response.read())
+                response = urllib2.urlopen(url, timeout=timeout)
             else:
                 import urllib.request
-                urllib.request.urlretrieve(url, save_path)
+                response = urllib.request.urlopen(url, timeout=timeout)
+            with open(save_path, 'wb') as f:
+                shutil.copyfileobj(response, f)
             
             logger.info('文件下载成功: %s', save_path)
         
@@ -0,0 +1,98 @@
+# 命令并发执行模块
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .logger import logger
+
+class CommandPool:
+    """命令执行池：有界线程池并发执行命令，按命令类型限制并发数，独占类型执行时不运行其他命令
+
+    命令按领取顺序排队；排在队首的独占命令会等待正在执行的命令结束，期间不再启动后续命令。
+    每条命令结束后立即调用report上报结果，不等待先提交的命令。
+    """
+
+    def __init__(self, execute, report, max_workers, limits, exclusive_types=(), max_queue=100):
+        self._execute = execute  # execute(command) -> (status, result)
+        self._report = report  # report(command, status, result)
+        self._limits = dict(limits)  # 命令类型 -> 最大并发数
+        self._exclusive_types = set(exclusive_types)
+        self._max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='command_worker')
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._running = {}  # 命令类型 -> 正在执行的命令数
+        self._exclusive_running = False
+        self._closed = False
+
+    def submit(self, command):
+        """提交一条命令排队执行"""
+        with self._condition:
+            self._queue.append(command)
+            self._dispatch()
+
+    def backlog(self):
+        """返回排队和执行中的命令数"""
+        with self._condition:
+            return len(self._queue) + sum(self._running.values())
+
+    def wait_for_capacity(self, timeout=None):
+        """等待排队和执行中的命令数低于上限，返回是否有空余"""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: len(self._queue) + sum(self._running.values()) < self._max_queue, timeout)
+
+    def wait_idle(self, timeout=None):
+        """等待所有排队和执行中的命令结束，返回是否已全部结束"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not any(self._running.values()), timeout)
+
+    def _can_start(self, command_type):
+        """判断该类型的命令现在能否启动（调用方持有锁）"""
+        if self._exclusive_running:
+            return False
+        if command_type in self._exclusive_types:
+            return not any(self._running.values())
+        return self._running.get(command_type, 0) < self._limits.get(command_type, 1)
+
+    def _dispatch(self):
+        """按队列顺序启动满足并发限制的命令（调用方持有锁）"""
+        if self._closed:
+            return
+        for command in list(self._queue):
+            command_type = command.get('command_type')
+            if not self._can_start(command_type):
+                if command_type in self._exclusive_types:
+                    # 独占命令等待期间不启动后续命令，避免其一直等不到空闲
+                    break
+                continue
+            self._queue.remove(command)
+            self._running[command_type] = self._running.get(command_type, 0) + 1
+            if command_type in self._exclusive_types:
+                self._exclusive_running = True
+            self._executor.submit(self._run, command)
+
+    def _run(self, command):
+        """在工作线程中执行命令并上报结果"""
+        command_type = command.get('command_type')
+        try:
+            status, result = self._execute(command)
+            if status is not None:
+                self._report(command, status, result)
+        except Exception as e:
+            logger.error('命令%s执行异常: %s', command.get('id'), e)
+        finally:
+            with self._condition:
+                self._running[command_type] -= 1
+                if command_type in self._exclusive_types:
+                    self._exclusive_running = False
+                self._dispatch()
+                self._condition.notify_all()
+
+    def shutdown(self, wait=True):
+        """停止接收新命令，丢弃排队中的命令（租约到期后由服务端重新排队）"""
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._condition.notify_all()
+        self._executor.shutdown(wait=wait)
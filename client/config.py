@@ -9,20 +9,41 @@ PY2 = sys.version_info[0] == 2
 # 服务端配置
 SERVER_URL = os.environ.get('SERVER_URL') or 'http://localhost:5000'
 API_BASE = os.path.join(SERVER_URL, 'api')
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)  # 命令结果和输出请求体超过该字节数时gzip压缩后上传
 
 # 截图配置
 SCREENSHOT_INTERVAL = int(os.environ.get('SCREENSHOT_INTERVAL') or 30)  # 30秒
 SCREENSHOT_QUALITY = int(os.environ.get('SCREENSHOT_QUALITY') or 85)  # 图片质量
+SCREENSHOT_MIN_QUALITY = int(os.environ.get('SCREENSHOT_MIN_QUALITY') or 40)  # 质量降到该值仍超过大小上限时缩小分辨率，而不是继续降低质量
+SCREENSHOT_FORMAT = os.environ.get('SCREENSHOT_FORMAT') or 'JPEG'  # 编码格式：JPEG或WEBP（同等画质体积更小，需要Pillow支持WebP）
 SCREENSHOT_MAX_SIZE = int(os.environ.get('SCREENSHOT_MAX_SIZE') or 2 * 1024 * 1024)  # 2MB
+SCREENSHOT_CHANGE_THRESHOLD = int(os.environ.get('SCREENSHOT_CHANGE_THRESHOLD') or 4)  # 画面指纹（64位）相差不超过该位数时视为未变化，不上传图片
+SCREENSHOT_KEYFRAME_INTERVAL = int(os.environ.get('SCREENSHOT_KEYFRAME_INTERVAL') or 3600)  # 画面未变化时也至少每隔该时间（秒）上传一张完整截图
+SCREENSHOT_TILE_SIZE = int(os.environ.get('SCREENSHOT_TILE_SIZE') or 64)  # 差分截图的图块边长（像素，应为16的倍数，与JPEG编码块对齐）
+SCREENSHOT_DELTA_MAX_RATIO = float(os.environ.get('SCREENSHOT_DELTA_MAX_RATIO') or 0.5)  # 相对关键帧变化的图块超过该比例时上传完整截图作为新的关键帧
 
 # 系统监控配置
 MONITOR_INTERVAL = int(os.environ.get('MONITOR_INTERVAL') or 30)  # 30秒
+METRIC_BATCH_SIZE = int(os.environ.get('METRIC_BATCH_SIZE') or 10)  # 缓冲满多少条采样后批量上传
+METRIC_BATCH_MAX_AGE = int(os.environ.get('METRIC_BATCH_MAX_AGE') or 300)  # 最旧采样等待上传的最长时间（秒）
+METRIC_BUFFER_MAX = int(os.environ.get('METRIC_BUFFER_MAX') or 1000)  # 上传失败时最多保留的采样数
 
 # 心跳配置
 HEARTBEAT_INTERVAL = int(os.environ.get('HEARTBEAT_INTERVAL') or 10)  # 10秒
 
 # 命令执行配置
 COMMAND_TIMEOUT = int(os.environ.get('COMMAND_TIMEOUT') or 60)  # 60秒
+COMMAND_POLL_WAIT = int(os.environ.get('COMMAND_POLL_WAIT') or 25)  # 长轮询等待新命令的时间（秒），0表示每5秒轮询一次
+FILE_OPERATION_TIMEOUT = int(os.environ.get('FILE_OPERATION_TIMEOUT') or 300)  # 文件操作的网络超时（秒）
+SCRIPT_UPDATE_TIMEOUT = int(os.environ.get('SCRIPT_UPDATE_TIMEOUT') or 300)  # 脚本更新下载的网络超时（秒）
+COMMAND_WORKERS = int(os.environ.get('COMMAND_WORKERS') or 4)  # 并发执行命令的工作线程数
+COMMAND_SHELL_CONCURRENCY = int(os.environ.get('COMMAND_SHELL_CONCURRENCY') or 4)  # shell命令最大并发数
+COMMAND_FILE_CONCURRENCY = int(os.environ.get('COMMAND_FILE_CONCURRENCY') or 2)  # 文件操作最大并发数
+COMMAND_QUEUE_MAX = int(os.environ.get('COMMAND_QUEUE_MAX') or 100)  # 排队和执行中的命令达到该数量时暂停领取
+COMMAND_OUTPUT_INTERVAL = float(os.environ.get('COMMAND_OUTPUT_INTERVAL') or 2)  # 执行中命令的输出上报间隔（秒）
+COMMAND_OUTPUT_CHUNK = int(os.environ.get('COMMAND_OUTPUT_CHUNK') or 64 * 1024)  # 单次上报的最大输出字符数
+COMMAND_OUTPUT_BUFFER_MAX = int(os.environ.get('COMMAND_OUTPUT_BUFFER_MAX') or 1024 * 1024)  # 每条命令等待上报的最大输出字符数，超出时丢弃最旧的部分
+COMMAND_OUTPUT_TAIL = int(os.environ.get('COMMAND_OUTPUT_TAIL') or 64 * 1024)  # 不增量上报时作为结果保留的最后输出字符数
 
 # 脚本更新配置
 UPDATE_TEMP_DIR = os.environ.get('UPDATE_TEMP_DIR') or '/tmp/inspection_client_update'
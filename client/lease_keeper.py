@@ -0,0 +1,50 @@
+# 命令租约续约模块
+
+import time
+import threading
+from .logger import logger
+
+class LeaseKeeper:
+    """命令租约续约类：为已领取但尚未提交结果的命令定期续约"""
+
+    def __init__(self, renew):
+        self._renew = renew  # renew(command_id, claim_token)：成功返回True，租约失效返回False，请求失败返回None
+        self._leases = {}  # command_id -> [claim_token, 续约间隔, 下次续约时间]
+        self._lock = threading.Lock()
+
+    def add(self, command_id, claim_token, lease_seconds):
+        """登记已领取的命令，在租约过去三分之一时续约"""
+        interval = max(lease_seconds / 3.0, 1)
+        with self._lock:
+            self._leases[command_id] = [claim_token, interval, time.time() + interval]
+
+    def remove(self, command_id):
+        """命令结果已提交，停止续约"""
+        with self._lock:
+            self._leases.pop(command_id, None)
+
+    def holds(self, command_id):
+        """判断是否仍持有命令的租约（续约失败说明命令已被重新排队或已结束）"""
+        with self._lock:
+            return command_id in self._leases
+
+    def renew_due(self, now=None):
+        """为到期的租约续约，返回租约已失效的命令ID列表；请求失败的在下个周期重试"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            due = [(command_id, lease[0]) for command_id, lease in self._leases.items() if lease[2] <= now]
+
+        lost = []
+        for command_id, claim_token in due:
+            renewed = self._renew(command_id, claim_token)
+            with self._lock:
+                lease = self._leases.get(command_id)
+                if lease is None:
+                    continue
+                if renewed:
+                    lease[2] = now + lease[1]
+                elif renewed is False:
+                    del self._leases[command_id]
+                    lost.append(command_id)
+                    logger.warning('命令%s的租约已失效', command_id)
+        return lost
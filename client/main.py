@@ -7,11 +7,17 @@ import threading
 from .logger import logger
 from .config import (
     HEARTBEAT_INTERVAL, MONITOR_INTERVAL, SCREENSHOT_INTERVAL,
-    CLIENT_NAME, CLIENT_VERSION
+    SCREENSHOT_CHANGE_THRESHOLD, SCREENSHOT_KEYFRAME_INTERVAL, SCREENSHOT_TILE_SIZE, SCREENSHOT_DELTA_MAX_RATIO,
+    COMMAND_POLL_WAIT, COMMAND_WORKERS, COMMAND_SHELL_CONCURRENCY, COMMAND_FILE_CONCURRENCY,
+    COMMAND_QUEUE_MAX, CLIENT_NAME, CLIENT_VERSION
 )
 from .system_info import SystemInfo
 from .screenshot import Screenshot
 from .network import Network
+from .metric_buffer import MetricBuffer
+from .lease_keeper import LeaseKeeper
+from .command_pool import CommandPool
+from .output_stream import OutputStreamer
 from .command_executor import CommandExecutor
 
 # 兼容Python 2.7和3.x
@@ -27,6 +33,8 @@ class InspectionClient:
         self.port = 0
         self.running = False
         self.threads = []
+        self.command_pool = None
+        self.metric_buffer = MetricBuffer()
         
     def start(self):
         """启动客户端"""
@@ -67,6 +75,13 @@ class InspectionClient:
             if thread.is_alive():
                 thread.join(5)
         
+        # 停止执行池：排队中的命令租约到期后由服务端重新排队，执行中的命令完成后照常上报结果
+        if self.command_pool:
+            self.command_pool.shutdown(wait=False)
+        
+        # 上传缓冲中剩余的系统数据
+        self.metric_buffer.flush(Network.upload_system_data_batch)
+        
         logger.info('巡检客户端已停止')
     
     def _start_heartbeat_thread(self):
@@ -99,13 +114,15 @@ class InspectionClient:
                         # 获取系统信息
                         system_data = SystemInfo.get_system_data()
                         
-                        # 上传系统数据
-                        Network.upload_system_data(
+                        # 加入缓冲，达到条数或时间阈值时批量上传
+                        self.metric_buffer.add(
                             self.client_id,
                             system_data['cpu_usage'],
                             system_data['memory_usage'],
                             system_data['disk_usage']
                         )
+                        if self.metric_buffer.should_flush():
+                            self.metric_buffer.flush(Network.upload_system_data_batch)
                 except Exception as e:
                     logger.error('监控线程异常: %s', e)
                 
@@ -119,16 +136,74 @@ class InspectionClient:
     
     def _start_screenshot_thread(self):
         """启动截图线程"""
+        # 上一张上传的截图：ID（服务端尚未写入时为上传凭据）、画面指纹和上传时间
+        last_upload = {'id': None, 'upload_id': None, 'fingerprint': None, 'time': 0}
+        # 最近一张以原分辨率上传的完整截图（关键帧）：ID（或上传凭据）、画面尺寸、各图块摘要和上传时间
+        keyframe = {'id': None, 'upload_id': None, 'size': None, 'digests': None, 'time': 0}
+        
+        def resolve():
+            """服务端异步写入截图，按上传凭据查询尚未得到的截图ID；写入失败时该截图不再作为关键帧或确认未变化的对象"""
+            results = {}
+            for entry in (keyframe, last_upload):
+                upload_id = entry['upload_id']
+                if not upload_id:
+                    continue
+                if upload_id not in results:
+                    results[upload_id] = Network.get_screenshot_upload(upload_id)
+                if results[upload_id] is not None:
+                    entry.update(id=results[upload_id] or None, upload_id=None)
+        
+        def upload(image_data, fingerprint):
+            """上传截图，返回(截图ID, 上传凭据)：与关键帧相比变化的图块不多时只上传这些图块，否则上传完整截图作为新的关键帧"""
+            size, digests = Screenshot.tile_digests(image_data, SCREENSHOT_TILE_SIZE)
+            if (digests and keyframe['id'] and size == keyframe['size'] and
+                    time.time() - keyframe['time'] < SCREENSHOT_KEYFRAME_INTERVAL):
+                # 服务端要求至少一个图块，画面与关键帧相同时也上传第一个图块
+                changed = Screenshot.changed_tiles(digests, keyframe['digests']) or [0]
+                if len(changed) <= len(digests) * SCREENSHOT_DELTA_MAX_RATIO:
+                    delta_data, tiles = Screenshot.pack_tiles(image_data, changed, SCREENSHOT_TILE_SIZE)
+                    if delta_data:
+                        screenshot_id, upload_id = Network.upload_screenshot_delta(
+                            self.client_id, keyframe['id'], delta_data, tiles, fingerprint)
+                        if screenshot_id or upload_id:
+                            return screenshot_id, upload_id
+            
+            compressed_data = Screenshot.compress_image(image_data)
+            screenshot_id, upload_id = Network.upload_screenshot(self.client_id, compressed_data, fingerprint)
+            if screenshot_id or upload_id:
+                # 缩小了分辨率的截图不能作为关键帧（图块坐标对不上）
+                full_size = digests and Screenshot.image_size(compressed_data) == size
+                keyframe.update(id=screenshot_id if full_size else None, upload_id=upload_id if full_size else None,
+                                size=size, digests=digests, time=time.time())
+            return screenshot_id, upload_id
+        
         def screenshot_loop():
-            """截图循环"""
+            """截图循环：画面与上一张上传的截图相比未变化时只发送确认，不编码和上传图片；
+            变化时只上传相对关键帧变化的图块，定期上传完整的关键帧
+            """
             while self.running:
                 try:
                     if self.client_id:
-                        # 捕获截图
-                        screenshot_data = Screenshot.get_screenshot()
-                        if screenshot_data:
-                            # 上传截图
-                            Network.upload_screenshot(self.client_id, screenshot_data)
+                        resolve()
+                        # 捕获截图并计算画面指纹
+                        image_data = Screenshot.capture_screen()
+                        fingerprint = Screenshot.fingerprint(image_data)
+                        unchanged = (
+                            fingerprint and last_upload['fingerprint'] and
+                            time.time() - last_upload['time'] < SCREENSHOT_KEYFRAME_INTERVAL and
+                            Screenshot.fingerprint_distance(fingerprint, last_upload['fingerprint'])
+                            <= SCREENSHOT_CHANGE_THRESHOLD
+                        )
+                        if unchanged:
+                            # 上一张截图尚未写入或服务端找不到（如已被清理）时改为上传截图
+                            unchanged = last_upload['id'] and Network.report_screenshot_unchanged(
+                                self.client_id, last_upload['id'])
+                        if not unchanged and image_data:
+                            # 压缩并上传截图
+                            screenshot_id, upload_id = upload(image_data, fingerprint)
+                            if screenshot_id or upload_id:
+                                last_upload.update(id=screenshot_id, upload_id=upload_id, fingerprint=fingerprint,
+                                                   time=time.time())
                 except Exception as e:
                     logger.error('截图线程异常: %s', e)
                 
@@ -141,37 +216,73 @@ class InspectionClient:
         logger.info('截图线程已启动，间隔: %d秒', SCREENSHOT_INTERVAL)
     
     def _start_command_thread(self):
-        """启动命令执行线程"""
+        """启动命令领取线程、命令执行池和租约续约线程"""
+        lease_keeper = LeaseKeeper(Network.renew_command_lease)
+        
+        def execute(command):
+            """执行一条命令（在执行池的工作线程中调用），租约已失效时跳过"""
+            command_id = command.get('id')
+            if not lease_keeper.holds(command_id):
+                # 租约已失效的命令已被服务端重新排队，不再执行
+                return None, None
+            if not command.get('command_type') or not command.get('command_content'):
+                return 'failed', '命令信息不完整'
+            output = None
+            if command['command_type'] == 'shell':
+                # shell命令的输出边执行边上报，长时间运行的命令可在服务端查看进度
+                claim_token = command.get('claim_token')
+                output = OutputStreamer(
+                    lambda offset, data: Network.append_command_output(command_id, claim_token, offset, data))
+            return CommandExecutor.execute_command(command_id, command['command_type'], command['command_content'],
+                                                   output=output)
+        
+        def report(command, status, result):
+            """命令执行完成后立即上报结果并停止续约"""
+            Network.update_command_result(command.get('id'), status, result, command.get('claim_token'))
+            lease_keeper.remove(command.get('id'))
+        
+        # shell命令并行执行，文件操作限制并发，脚本更新独占执行
+        self.command_pool = CommandPool(
+            execute, report, COMMAND_WORKERS,
+            {'shell': COMMAND_SHELL_CONCURRENCY, 'file_operation': COMMAND_FILE_CONCURRENCY, 'script_update': 1},
+            exclusive_types=('script_update',), max_queue=COMMAND_QUEUE_MAX
+        )
+        
         def command_loop():
-            """命令循环"""
+            """命令领取循环"""
             while self.running:
+                started = time.time()
+                commands = None
                 try:
-                    if self.client_id:
-                        # 获取待执行命令
-                        commands = Network.get_pending_commands(self.client_id)
-                        if commands:
-                            for command in commands:
-                                command_id = command.get('id')
-                                command_type = command.get('command_type')
-                                command_content = command.get('command_content')
-                                
-                                if command_id and command_type and command_content:
-                                    # 执行命令
-                                    status, result = CommandExecutor.execute_command(
-                                        command_id, command_type, command_content
-                                    )
-                                    
-                                    # 更新命令执行结果
-                                    Network.update_command_result(command_id, status, result)
+                    # 执行池积压过多时暂停领取，避免持有过多租约
+                    if self.client_id and self.command_pool.wait_for_capacity(timeout=1):
+                        # 领取待执行命令（长轮询：没有命令时服务端挂起请求，新命令下发后立即返回）
+                        commands, lease_seconds = Network.claim_commands(self.client_id, COMMAND_POLL_WAIT)
+                        for command in commands or []:
+                            lease_keeper.add(command.get('id'), command.get('claim_token'), lease_seconds)
+                            self.command_pool.submit(command)
                 except Exception as e:
                     logger.error('命令线程异常: %s', e)
                 
-                time.sleep(5)  # 每5秒检查一次命令
+                # 领取到命令后立即再次领取；请求失败或服务端未挂起请求（不支持长轮询）时每5秒检查一次
+                if not commands and time.time() - started < 1:
+                    time.sleep(5)
         
-        thread = threading.Thread(target=command_loop, name='command_thread')
-        thread.daemon = True
-        thread.start()
-        self.threads.append(thread)
+        def lease_loop():
+            """续约循环"""
+            while self.running:
+                try:
+                    lease_keeper.renew_due()
+                except Exception as e:
+                    logger.error('续约线程异常: %s', e)
+                
+                time.sleep(1)
+        
+        for target, name in ((command_loop, 'command_thread'), (lease_loop, 'lease_thread')):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
         logger.info('命令执行线程已启动')
 
 # 主函数
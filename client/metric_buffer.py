@@ -0,0 +1,61 @@
+# 系统数据缓冲模块
+
+import time
+import threading
+from collections import deque
+from .logger import logger
+from .config import METRIC_BATCH_SIZE, METRIC_BATCH_MAX_AGE, METRIC_BUFFER_MAX
+
+class MetricBuffer:
+    """系统数据缓冲类：按条数或时间批量上传采样"""
+
+    def __init__(self, batch_size=METRIC_BATCH_SIZE, max_age=METRIC_BATCH_MAX_AGE, max_size=METRIC_BUFFER_MAX):
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_size = max_size
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def add(self, client_id, cpu_usage, memory_usage, disk_usage, timestamp=None):
+        """添加一条带时间戳的采样，超出容量时丢弃最旧的采样"""
+        sample = {
+            'client_id': client_id,
+            'cpu_usage': cpu_usage,
+            'memory_usage': memory_usage,
+            'disk_usage': disk_usage,
+            'timestamp': timestamp if timestamp is not None else time.time()
+        }
+        with self._lock:
+            self._samples.append(sample)
+            while len(self._samples) > self.max_size:
+                self._samples.popleft()
+                logger.warning('系统数据缓冲已满，丢弃最旧的采样')
+
+    def should_flush(self, now=None):
+        """判断是否达到条数或时间阈值"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            if not self._samples:
+                return False
+            return len(self._samples) >= self.batch_size or now - self._samples[0]['timestamp'] >= self.max_age
+
+    def flush(self, upload):
+        """调用upload(samples)上传缓冲中的采样，失败时放回缓冲等待下次重试"""
+        with self._lock:
+            samples = list(self._samples)
+            self._samples.clear()
+        if not samples:
+            return True
+
+        if upload(samples):
+            return True
+
+        with self._lock:
+            self._samples.extendleft(reversed(samples))
+            while len(self._samples) > self.max_size:
+                self._samples.popleft()
+        return False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
@@ -4,9 +4,10 @@ import os
 import sys
 import json
 import time
+import gzip
 from io import BytesIO
 from .logger import logger
-from .config import API_BASE, PY2
+from .config import API_BASE, PY2, COMPRESS_MIN_SIZE
 
 # 兼容Python 2.7和3.x
 if PY2:
@@ -21,9 +22,13 @@ else:
 class Network:
     """网络通信类"""
     
+    # 最近一次获取的预设命令目录：(版本号, 预设命令列表)
+    _preset_cache = (None, [])
+    
     @staticmethod
-    def _make_request(url, method='GET', data=None, files=None, headers=None):
-        """发送HTTP请求"""
+    def _make_request(url, method='GET', data=None, files=None, headers=None, json_data=None, timeout=30,
+                      compress=False):
+        """发送HTTP请求，compress为True时超过COMPRESS_MIN_SIZE字节的JSON请求体gzip压缩后发送"""
         try:
             if method == 'GET':
                 if data:
@@ -58,6 +63,16 @@ class Network:
                     request = urllib2.Request(url, body.getvalue())
                     request.add_header('Content-Type', content_type)
                     request.add_header('Content-Length', str(len(body.getvalue())))
+                elif json_data is not None:
+                    # JSON请求
+                    body = json.dumps(json_data).encode('utf-8')
+                    compressed = compress and len(body) >= COMPRESS_MIN_SIZE
+                    if compressed:
+                        body = gzip.compress(body)
+                    request = urllib2.Request(url, body)
+                    request.add_header('Content-Type', 'application/json')
+                    if compressed:
+                        request.add_header('Content-Encoding', 'gzip')
                 else:
                     # 普通POST请求
                     if data:
@@ -77,7 +92,7 @@ class Network:
                     request.add_header(key, value)
             
             # 发送请求
-            response = urllib2.urlopen(request, timeout=30)
+            response = urllib2.urlopen(request, timeout=timeout)
             response_data = response.read()
             
             # 解析响应
@@ -87,6 +102,9 @@ class Network:
                 return json.loads(response_data.decode('utf-8'))
         
         except urllib2.HTTPError as e:
+            if e.code == 304:
+                # 条件请求命中，内容未变化
+                return {'status': 'not_modified'}
             logger.error('HTTP错误: %s %s', e.code, e.reason)
             if e.code == 404:
                 logger.error('请求的URL不存在: %s', url)
@@ -140,44 +158,153 @@ class Network:
             return False
     
     @staticmethod
-    def upload_screenshot(client_id, screenshot_data):
-        """上传截图"""
+    def upload_system_data_batch(samples):
+        """批量上传带时间戳的系统数据"""
+        url = os.path.join(API_BASE, 'system_data/batch')
+        
+        response = Network._make_request(url, method='POST', json_data={'samples': samples})
+        if response and response.get('status') == 'ok':
+            logger.debug('系统数据批量上传成功，条数: %d', response.get('inserted', 0))
+            return True
+        else:
+            logger.error('系统数据批量上传失败')
+            return False
+    
+    @staticmethod
+    def upload_screenshot(client_id, screenshot_data, fingerprint=None):
+        """上传截图，返回(截图ID, 上传凭据)：服务端已写入时返回截图ID，已保存文件但尚未写入数据库时返回上传凭据，
+        由调用方稍后用get_screenshot_upload查询截图ID；失败返回(None, None)
+        """
         url = os.path.join(API_BASE, 'screenshots')
         data = {'client_id': client_id}
+        if fingerprint:
+            data['fingerprint'] = fingerprint
         files = {'file': screenshot_data}
         
         response = Network._make_request(url, method='POST', data=data, files=files)
         if response and response.get('status') == 'ok':
             logger.debug('截图上传成功')
-            return True
+            return response.get('id'), None
+        elif response and response.get('status') == 'accepted':
+            logger.debug('截图已提交，服务端尚未写入')
+            return None, response.get('upload_id')
         else:
             logger.error('截图上传失败')
+            return None, None
+    
+    @staticmethod
+    def upload_screenshot_delta(client_id, keyframe_id, delta_data, tiles, fingerprint=None):
+        """上传相对关键帧变化的图块，返回值同upload_screenshot；失败（如关键帧已被清理）返回(None, None)，调用方改为上传完整截图"""
+        url = os.path.join(API_BASE, f'screenshots/{keyframe_id}/delta')
+        data = {'client_id': client_id, 'tiles': json.dumps(tiles, separators=(',', ':'))}
+        if fingerprint:
+            data['fingerprint'] = fingerprint
+        
+        response = Network._make_request(url, method='POST', data=data, files={'file': delta_data})
+        if response and response.get('status') in ('ok', 'accepted'):
+            logger.debug('差分截图上传成功，图块数: %d', len(tiles['boxes']))
+            return response.get('id'), response.get('upload_id')
+        else:
+            logger.warning('差分截图上传失败，将上传完整截图')
+            return None, None
+    
+    @staticmethod
+    def get_screenshot_upload(upload_id):
+        """按上传凭据查询截图ID：已写入返回截图ID，尚未写入返回None，写入失败或查询失败返回False"""
+        url = os.path.join(API_BASE, f'screenshots/uploads/{upload_id}')
+        
+        response = Network._make_request(url)
+        if response and response.get('status') == 'ok':
+            return response.get('id')
+        elif response and response.get('status') == 'accepted':
+            return None
+        else:
+            logger.warning('查询截图上传%s失败', upload_id)
             return False
     
     @staticmethod
-    def get_pending_commands(client_id):
-        """获取待执行命令"""
+    def report_screenshot_unchanged(client_id, screenshot_id):
+        """画面未变化时只通知服务端上一张截图仍是当前画面，返回服务端是否已记录"""
+        url = os.path.join(API_BASE, f'screenshots/{screenshot_id}/unchanged')
+        
+        response = Network._make_request(url, method='POST', json_data={'client_id': client_id})
+        if response and response.get('status') == 'ok':
+            logger.debug('画面未变化，已确认截图%s', screenshot_id)
+            return True
+        else:
+            logger.warning('确认截图%s失败，将上传完整截图', screenshot_id)
+            return False
+    
+    @staticmethod
+    def get_pending_commands(client_id, wait=0):
+        """获取待执行命令，wait大于0时由服务端挂起请求直到有新命令或超时；请求失败返回None"""
         url = os.path.join(API_BASE, f'commands/pending/{client_id}')
+        data = {'wait': wait} if wait > 0 else None
         
-        response = Network._make_request(url, method='GET')
+        response = Network._make_request(url, method='GET', data=data, timeout=wait + 30)
         if response and response.get('status') == 'ok':
-            commands = response.get('commands', [])
+            commands = response.get('commands') or []
             logger.debug('获取到%d条待执行命令', len(commands))
             return commands
         else:
             logger.error('获取待执行命令失败')
-            return []
+            return None
+    
+    @staticmethod
+    def claim_commands(client_id, wait=0):
+        """领取待执行命令（服务端标记为已领取并设置租约），返回(命令列表, 租约秒数)；请求失败返回(None, 0)"""
+        url = os.path.join(API_BASE, f'commands/claim/{client_id}')
+        if wait > 0:
+            url = f"{url}?{urllib.urlencode({'wait': wait})}"
+        
+        response = Network._make_request(url, method='POST', json_data={}, timeout=wait + 30)
+        if response and response.get('status') == 'ok':
+            commands = response.get('commands') or []
+            logger.debug('领取到%d条待执行命令', len(commands))
+            return commands, response.get('lease_seconds', 0)
+        else:
+            logger.error('领取待执行命令失败')
+            return None, 0
+    
+    @staticmethod
+    def renew_command_lease(command_id, claim_token):
+        """续约执行中的命令：成功返回True，租约已失效返回False，请求失败返回None"""
+        url = os.path.join(API_BASE, f'commands/lease/{command_id}')
+        
+        response = Network._make_request(url, method='POST', json_data={'claim_token': claim_token})
+        if response and response.get('status') == 'ok':
+            return bool(response.get('renewed'))
+        else:
+            logger.warning('命令%s续约请求失败', command_id)
+            return None
     
     @staticmethod
-    def update_command_result(command_id, status, result=''):
+    def append_command_output(command_id, claim_token, offset, data):
+        """上报执行中命令的一段输出，返回(是否写入, 服务端已接收的字符数)；请求失败返回None"""
+        url = os.path.join(API_BASE, f'commands/output/{command_id}')
+        
+        response = Network._make_request(url, method='POST', json_data={
+            'claim_token': claim_token,
+            'offset': offset,
+            'data': data
+        }, compress=True)
+        if response and response.get('status') == 'ok':
+            return bool(response.get('accepted')), response.get('output_size', 0)
+        else:
+            logger.warning('命令%s输出上报失败', command_id)
+            return None
+    
+    @staticmethod
+    def update_command_result(command_id, status, result='', claim_token=None):
         """更新命令执行结果"""
         url = os.path.join(API_BASE, f'commands/result/{command_id}')
         data = {
             'status': status,
-            'result': result
+            'result': result,
+            'claim_token': claim_token
         }
         
-        response = Network._make_request(url, method='POST', data=data)
+        response = Network._make_request(url, method='POST', json_data=data, compress=True)
         if response and response.get('status') == 'ok':
             logger.debug('命令执行结果更新成功')
             return True
@@ -187,15 +314,21 @@ class Network:
     
     @staticmethod
     def get_preset_commands():
-        """获取预设命令"""
+        """获取预设命令，带上已缓存目录的版本号，服务端返回未变化时直接使用缓存"""
         url = os.path.join(API_BASE, 'preset_commands')
+        version, preset_commands = Network._preset_cache
+        headers = {'If-None-Match': f'"{version}"'} if version else None
         
-        response = Network._make_request(url, method='GET')
+        response = Network._make_request(url, method='GET', headers=headers)
+        if response and response.get('status') == 'not_modified':
+            return preset_commands
         if response and response.get('status') == 'ok':
-            return response.get('preset_commands', [])
+            preset_commands = response.get('preset_commands', [])
+            Network._preset_cache = (response.get('version'), preset_commands)
+            return preset_commands
         else:
             logger.error('获取预设命令失败')
-            return []
+            return preset_commands
 
 # 测试代码
 if __name__ == '__main__':
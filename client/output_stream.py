@@ -0,0 +1,126 @@
+# 命令输出增量上报模块
+
+import threading
+from collections import deque
+from .logger import logger
+from .config import COMMAND_OUTPUT_CHUNK, COMMAND_OUTPUT_BUFFER_MAX
+
+class OutputTail:
+    """有界输出缓冲：只保留最后max_size个字符"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._chunks = deque()
+        self._size = 0
+        self.dropped = 0  # 已丢弃的字符数
+
+    def append(self, text):
+        """追加一段输出，超出容量时丢弃最旧的部分"""
+        self._chunks.append(text)
+        self._size += len(text)
+        while self._size > self.max_size:
+            excess = self._size - self.max_size
+            head = self._chunks[0]
+            if len(head) <= excess:
+                self._chunks.popleft()
+                self._size -= len(head)
+                self.dropped += len(head)
+            else:
+                self._chunks[0] = head[excess:]
+                self._size -= excess
+                self.dropped += excess
+
+    def appendleft(self, text):
+        """把未能上报的输出放回缓冲头部"""
+        self._chunks.appendleft(text)
+        self._size += len(text)
+
+    def take(self, size=None):
+        """取出最多size个字符（缺省全部）"""
+        parts = []
+        remaining = self._size if size is None else size
+        while self._chunks and remaining > 0:
+            head = self._chunks.popleft()
+            if len(head) > remaining:
+                self._chunks.appendleft(head[remaining:])
+                head = head[:remaining]
+            parts.append(head)
+            remaining -= len(head)
+            self._size -= len(head)
+        return ''.join(parts)
+
+    def getvalue(self):
+        return ''.join(self._chunks)
+
+    def __len__(self):
+        return self._size
+
+class OutputStreamer:
+    """命令输出增量上报类：执行线程写入输出，flush按偏移分段上报到服务端
+
+    send(offset, data)成功返回(是否写入, 服务端已接收的字符数)，请求失败返回None。
+    上报失败的输出留在缓冲中等待下次重试；缓冲超出容量时丢弃最旧的输出并上报一行说明。
+    """
+
+    def __init__(self, send, chunk_size=COMMAND_OUTPUT_CHUNK, max_size=COMMAND_OUTPUT_BUFFER_MAX):
+        self._send = send
+        self._chunk_size = chunk_size
+        self._pending = OutputTail(max_size)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.offset = 0  # 服务端已接收的字符数
+        self.written = 0  # 命令产生的字符数
+
+    def write(self, text):
+        """写入一段输出（可在读取输出的线程中调用），只写入内存缓冲"""
+        with self._lock:
+            self._pending.append(text)
+            self.written += len(text)
+
+    def flush(self):
+        """上报缓冲中的输出，返回是否已全部上报"""
+        with self._flush_lock:
+            realigned = False
+            while True:
+                with self._lock:
+                    dropped, self._pending.dropped = self._pending.dropped, 0
+                    data = self._pending.take(self._chunk_size)
+                if dropped:
+                    logger.warning('命令输出上报积压，丢弃%d个字符', dropped)
+                    data = f'\n[... 丢弃{dropped}个字符 ...]\n' + data
+                if not data:
+                    return True
+
+                response = self._send(self.offset, data)
+                if response is None:
+                    with self._lock:
+                        self._pending.appendleft(data)
+                    return False
+                accepted, output_size = response
+                if not accepted:
+                    if realigned:
+                        # 对齐偏移后仍未写入，留待下次重试
+                        with self._lock:
+                            self._pending.appendleft(data)
+                        return False
+                    # 偏移不一致（如上次请求已写入但响应丢失）：跳过服务端已接收的部分后重发
+                    realigned = True
+                    data = data[max(output_size - self.offset, 0):]
+                    if data:
+                        with self._lock:
+                            self._pending.appendleft(data)
+                else:
+                    realigned = False
+                self.offset = output_size
+
+    def drain(self, max_size):
+        """取出缓冲中尚未上报的输出（最多最后max_size个字符）并清空缓冲，用于上报失败时随结果一起上报"""
+        with self._flush_lock, self._lock:
+            dropped, self._pending.dropped = self._pending.dropped, 0
+            data = self._pending.take()
+        if len(data) > max_size:
+            dropped += len(data) - max_size
+            data = data[-max_size:]
+        if dropped:
+            data = f'[... 省略{dropped}个字符 ...]\n' + data
+        return data
@@ -2,37 +2,46 @@
 
 import os
 import sys
+import math
+import hashlib
 import platform
 import subprocess
+import threading
 from io import BytesIO
 from .logger import logger
-from .config import SCREENSHOT_QUALITY, SCREENSHOT_MAX_SIZE
+from .config import SCREENSHOT_QUALITY, SCREENSHOT_MIN_QUALITY, SCREENSHOT_MAX_SIZE, SCREENSHOT_FORMAT
 
 # 兼容Python 2.7和3.x
 PY2 = sys.version_info[0] == 2
 
-# 尝试导入截图库
-SCREENSHOT_METHOD = None
+# 尝试导入截图库（只在启动时解析一次，可用的后端按优先级登记到CAPTURE_BACKENDS）
+QT_VERSION = None
 
 # 尝试使用PyQt5
 try:
     from PyQt5.QtWidgets import QApplication
-    from PyQt5.QtGui import QPixmap, QScreen
-    SCREENSHOT_METHOD = 'pyqt5'
+    from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+    QT_VERSION = 5
     logger.info('PyQt5已安装，将使用PyQt5进行截图')
 except ImportError:
     pass
 
 # 尝试使用PyQt4
-if SCREENSHOT_METHOD is None:
+if QT_VERSION is None:
     try:
         from PyQt4.QtGui import QApplication, QPixmap
-        from PyQt4.Qt import QDesktopWidget
-        SCREENSHOT_METHOD = 'pyqt4'
+        from PyQt4.QtCore import QBuffer, QByteArray, QIODevice
+        QT_VERSION = 4
         logger.info('PyQt4已安装，将使用PyQt4进行截图')
     except ImportError:
         pass
 
+# 查找可执行文件（不再每次截图前启动which进程）
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
 # 尝试使用Pillow
 try:
     from PIL import Image
@@ -42,9 +51,120 @@ except ImportError:
     PILLOW_AVAILABLE = False
     logger.warning('Pillow未安装，截图功能可能受限')
 
+# 截图编码格式，Pillow不支持WEBP时使用JPEG
+ENCODE_FORMAT = SCREENSHOT_FORMAT.upper()
+if PILLOW_AVAILABLE and ENCODE_FORMAT != 'JPEG':
+    from PIL import features
+    if ENCODE_FORMAT != 'WEBP' or not features.check('webp'):
+        logger.warning('不支持的截图编码格式%s，使用JPEG', SCREENSHOT_FORMAT)
+        ENCODE_FORMAT = 'JPEG'
+
+# 质量二分查找的精度，区间小于该值时停止
+QUALITY_STEP = 5
+
+class QtCaptureBackend:
+    """PyQt截图后端：首次截图时创建QApplication和输出缓冲区，之后每次截图复用"""
+    
+    name = 'pyqt%d' % QT_VERSION if QT_VERSION else 'pyqt'
+    
+    def __init__(self):
+        self._app = None
+        self._bytes = None
+    
+    def capture(self):
+        if self._app is None:
+            self._app = QApplication.instance() or QApplication(sys.argv[:1])
+            self._bytes = QByteArray()
+        
+        if QT_VERSION == 5:
+            screen = self._app.primaryScreen()
+            if screen is None:
+                raise RuntimeError('无法获取主屏幕')
+            pixmap = screen.grabWindow(0)
+        else:
+            desktop = self._app.desktop()
+            geometry = desktop.screenGeometry()
+            pixmap = QPixmap.grabWindow(desktop.winId(), geometry.x(), geometry.y(),
+                                        geometry.width(), geometry.height())
+        
+        # 有Pillow时输出未压缩的BMP，省去PNG压缩，之后由compress_image统一编码
+        self._bytes.clear()
+        buffer = QBuffer(self._bytes)
+        buffer.open(QIODevice.WriteOnly)
+        pixmap.save(buffer, 'BMP' if PILLOW_AVAILABLE else 'PNG')
+        buffer.close()
+        return bytes(self._bytes)
+
+class CommandCaptureBackend:
+    """系统命令截图后端：可执行文件路径在启动时解析"""
+    
+    def __init__(self, name, args):
+        self.name = name
+        self._path = which(name)
+        self._args = args
+    
+    @property
+    def available(self):
+        return self._path is not None
+    
+    def capture(self):
+        return subprocess.check_output([self._path] + self._args, stderr=subprocess.PIPE)
+
+class CaptureSession:
+    """长期存在的截图会话：按优先级依次尝试截图后端，截图失败的后端移到末尾，之后优先使用成功的后端"""
+    
+    def __init__(self, backends):
+        self._backends = list(backends)
+        self._lock = threading.Lock()
+    
+    @property
+    def backends(self):
+        """当前的尝试顺序（后端名称）"""
+        with self._lock:
+            return [backend.name for backend in self._backends]
+    
+    def capture(self):
+        """返回截图数据，所有后端都失败时返回None"""
+        with self._lock:
+            for backend in list(self._backends):
+                try:
+                    data = backend.capture()
+                    if data:
+                        return data
+                    logger.error('%s截图结果为空', backend.name)
+                except Exception as e:
+                    logger.error('使用%s截图失败: %s', backend.name, e)
+                # 记住失败的后端，后续截图先尝试其他后端
+                if len(self._backends) > 1:
+                    self._backends.remove(backend)
+                    self._backends.append(backend)
+                    logger.info('截图后端顺序调整为: %s', ', '.join(item.name for item in self._backends))
+            return None
+
+def _resolve_backends():
+    """按优先级返回当前环境可用的截图后端：PyQt、scrot、ImageMagick import"""
+    backends = []
+    if QT_VERSION:
+        backends.append(QtCaptureBackend())
+    for backend in (CommandCaptureBackend('scrot', ['-q', str(SCREENSHOT_QUALITY), '-']),
+                    CommandCaptureBackend('import', ['-window', 'root', '-quality', str(SCREENSHOT_QUALITY), 'png:-'])):
+        if backend.available:
+            backends.append(backend)
+    return backends
+
+# 可用的截图后端（启动时解析）
+CAPTURE_BACKENDS = _resolve_backends()
+
 class Screenshot:
     """截图类"""
     
+    # 上一张截图最终使用的编码质量和缩放比例，作为下一张的初始值（相邻截图的画面通常相近）
+    _last_quality = None
+    _last_scale = 1.0
+    
+    # 截图会话，首次截图时创建
+    _session = None
+    
     @staticmethod
     def capture_screen():
         """捕获屏幕截图"""
@@ -52,109 +172,198 @@ class Screenshot:
             logger.error('截图功能仅支持Linux系统')
             return None
         
-        # 根据可用的库选择截图方法
-        if SCREENSHOT_METHOD == 'pyqt5':
-            return Screenshot._capture_pyqt5()
-        elif SCREENSHOT_METHOD == 'pyqt4':
-            return Screenshot._capture_pyqt4()
-        else:
-            return Screenshot._capture_system_cmd()
+        if Screenshot._session is None:
+            if not CAPTURE_BACKENDS:
+                logger.error('没有可用的截图工具，请安装PyQt5、scrot或ImageMagick')
+                return None
+            Screenshot._session = CaptureSession(CAPTURE_BACKENDS)
+        return Screenshot._session.capture()
     
     @staticmethod
-    def _capture_pyqt5():
-        """使用PyQt5截图"""
+    def compress_image(image_data, max_size=None):
+        """压缩图片：编码为不超过max_size（默认SCREENSHOT_MAX_SIZE）字节的最高质量
+
+        从上一张截图的质量开始二分查找，通常只需1-3次编码；
+        质量降到SCREENSHOT_MIN_QUALITY仍超过上限时按面积比例缩小分辨率后重新查找。
+        """
+        if not PILLOW_AVAILABLE or not image_data:
+            return image_data
+        
+        max_size = max_size or SCREENSHOT_MAX_SIZE
         try:
-            app = QApplication(sys.argv)
-            screen = QApplication.primaryScreen()
-            if screen is None:
-                logger.error('无法获取主屏幕')
-                return None
+            # 打开图片
+            image = Image.open(BytesIO(image_data))
             
-            pixmap = screen.grabWindow(0)
-            buffer = BytesIO()
-            pixmap.save(buffer, 'PNG')
-            return buffer.getvalue()
+            # 转换为RGB模式
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            scale = Screenshot._last_scale
+            quality = Screenshot._last_quality or SCREENSHOT_QUALITY
+            passes = 0
+            for _ in range(3):
+                resized = image
+                if scale < 1:
+                    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+                    resized = image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+                compressed_data, quality, count = Screenshot._fit_quality(resized, quality, max_size)
+                passes += count
+                if len(compressed_data) <= max_size:
+                    break
+                # 编码大小约与像素数成正比，按面积比例缩小后从最低质量开始查找
+                scale *= (float(max_size) / len(compressed_data)) ** 0.5 * 0.9
+                quality = SCREENSHOT_MIN_QUALITY
+            
+            # 缩小后以最高质量仍有余量时，下一张按余量放大
+            if scale < 1 and quality >= SCREENSHOT_QUALITY:
+                scale = min(1.0, scale * (float(max_size) / len(compressed_data)) ** 0.5)
+            Screenshot._last_quality = quality
+            Screenshot._last_scale = scale
+            
+            logger.debug('图片压缩完成，原始大小: %d字节，压缩后大小: %d字节，格式: %s，质量: %d，缩放: %.2f，编码次数: %d',
+                       len(image_data), len(compressed_data), ENCODE_FORMAT, quality, scale, passes)
+            
+            return compressed_data
         except Exception as e:
-            logger.error('使用PyQt5截图失败: %s', e)
-            return Screenshot._capture_system_cmd()
+            logger.error('压缩图片失败: %s', e)
+            return image_data
     
     @staticmethod
-    def _capture_pyqt4():
-        """使用PyQt4截图"""
-        try:
-            app = QApplication(sys.argv)
-            desktop = QDesktopWidget()
-            screen = desktop.screenGeometry()
-            pixmap = QPixmap.grabWindow(app.desktop().winId(), 
-                                       screen.x(), screen.y(), 
-                                       screen.width(), screen.height())
-            
+    def _fit_quality(image, quality, max_size):
+        """在[SCREENSHOT_MIN_QUALITY, SCREENSHOT_QUALITY]内二分查找不超过max_size的最高质量，从quality开始编码
+
+        大小已接近上限（90%以上）时不再尝试更高质量；返回(编码数据, 质量, 编码次数)，最低质量仍超过上限时返回最低质量的结果
+        """
+        low, high = SCREENSHOT_MIN_QUALITY, SCREENSHOT_QUALITY
+        quality = max(low, min(quality, high))
+        best = None
+        passes = 0
+        while True:
             buffer = BytesIO()
-            pixmap.save(buffer, 'PNG')
-            return buffer.getvalue()
+            image.save(buffer, format=ENCODE_FORMAT, quality=quality)
+            data = buffer.getvalue()
+            passes += 1
+            
+            if len(data) <= max_size:
+                best = (data, quality)
+                if len(data) >= max_size * 0.9:
+                    break
+                low = quality + 1
+            else:
+                if quality <= SCREENSHOT_MIN_QUALITY:
+                    return data, quality, passes
+                high = quality - 1
+            
+            # 已找到可用结果且剩余区间小于精度，或区间为空时停止
+            if high < low or (best and high - low < QUALITY_STEP):
+                break
+            quality = (low + high + 1) // 2 if best is None else (low + high) // 2
+        
+        if best is None:
+            return data, quality, passes
+        return best[0], best[1], passes
+    
+    @staticmethod
+    def image_size(image_data):
+        """返回图片的(宽, 高)，只解析文件头；无法解析时返回None"""
+        if not PILLOW_AVAILABLE or not image_data:
+            return None
+        try:
+            return Image.open(BytesIO(image_data)).size
+        except Exception:
+            return None
+    
+    @staticmethod
+    def tile_digests(image_data, tile_size):
+        """把画面按tile_size见方切成图块（逐行排列），返回(画面尺寸, 各图块像素的摘要列表)
+
+        Pillow不可用或图片无法解析时返回(None, None)
+        """
+        if not PILLOW_AVAILABLE or not image_data:
+            return None, None
+        
+        try:
+            image = Image.open(BytesIO(image_data)).convert('RGB')
+            width, height = image.size
+            digests = []
+            for top in range(0, height, tile_size):
+                for left in range(0, width, tile_size):
+                    box = (left, top, min(left + tile_size, width), min(top + tile_size, height))
+                    digests.append(hashlib.sha1(image.crop(box).tobytes()).digest())
+            return image.size, digests
         except Exception as e:
-            logger.error('使用PyQt4截图失败: %s', e)
-            return Screenshot._capture_system_cmd()
+            logger.error('计算截图图块摘要失败: %s', e)
+            return None, None
     
     @staticmethod
-    def _capture_system_cmd():
-        """使用系统命令截图"""
+    def changed_tiles(digests, base_digests):
+        """返回与关键帧相比发生变化的图块序号"""
+        return [index for index, (digest, base_digest) in enumerate(zip(digests, base_digests))
+                if digest != base_digest]
+    
+    @staticmethod
+    def pack_tiles(image_data, indexes, tile_size, max_size=None):
+        """把变化的图块按网格拼成一张图并编码，返回(拼图数据, 图块描述)；无法编码或超过max_size时返回(None, None)
+
+        图块描述为{'tile': 图块边长, 'cols': 拼图列数, 'boxes': [[x, y, 宽, 高], ...]}，
+        第i个图块在拼图中位于(i % cols * tile, i // cols * tile)，服务端按boxes把图块贴回关键帧
+        """
+        if not PILLOW_AVAILABLE or not image_data or not indexes:
+            return None, None
+        
+        max_size = max_size or SCREENSHOT_MAX_SIZE
         try:
-            # 尝试使用scrot
-            if subprocess.call(['which', 'scrot'], stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0:
-                cmd = ['scrot', '-q', str(SCREENSHOT_QUALITY), '-']
-                output = subprocess.check_output(cmd)
-                return output
-            
-            # 尝试使用ImageMagick的import命令
-            if subprocess.call(['which', 'import'], stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0:
-                cmd = ['import', '-window', 'root', '-quality', str(SCREENSHOT_QUALITY), 'png:-']
-                output = subprocess.check_output(cmd)
-                return output
+            image = Image.open(BytesIO(image_data)).convert('RGB')
+            width, height = image.size
+            per_row = (width + tile_size - 1) // tile_size
+            cols = int(math.ceil(math.sqrt(len(indexes))))
+            rows = (len(indexes) + cols - 1) // cols
+            atlas = Image.new('RGB', (cols * tile_size, rows * tile_size))
+            boxes = []
+            for position, index in enumerate(indexes):
+                left, top = index % per_row * tile_size, index // per_row * tile_size
+                box = (left, top, min(left + tile_size, width), min(top + tile_size, height))
+                atlas.paste(image.crop(box), (position % cols * tile_size, position // cols * tile_size))
+                boxes.append([left, top, box[2] - left, box[3] - top])
             
-            logger.error('没有可用的截图工具，请安装scrot或ImageMagick')
-            return None
+            data, quality, passes = Screenshot._fit_quality(
+                atlas, Screenshot._last_quality or SCREENSHOT_QUALITY, max_size)
+            if len(data) > max_size:
+                return None, None
+            logger.debug('差分截图编码完成，图块: %d/%d，大小: %d字节，质量: %d，编码次数: %d',
+                       len(indexes), per_row * ((height + tile_size - 1) // tile_size), len(data), quality, passes)
+            return data, {'tile': tile_size, 'cols': cols, 'boxes': boxes}
         except Exception as e:
-            logger.error('使用系统命令截图失败: %s', e)
-            return None
+            logger.error('编码差分截图失败: %s', e)
+            return None, None
     
     @staticmethod
-    def compress_image(image_data):
-        """压缩图片"""
+    def fingerprint(image_data):
+        """计算画面指纹（差值哈希）：缩小为9x8灰度图，比较相邻像素明暗得到64位，返回16位十六进制字符串
+
+        Pillow不可用或图片无法解析时返回None
+        """
         if not PILLOW_AVAILABLE or not image_data:
-            return image_data
+            return None
         
         try:
-            # 打开图片
             image = Image.open(BytesIO(image_data))
-            
-            # 转换为RGB模式
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-            
-            # 压缩图片
-            buffer = BytesIO()
-            quality = SCREENSHOT_QUALITY
-            
-            # 逐步降低质量直到图片大小符合要求
-            while True:
-                buffer.seek(0)
-                buffer.truncate()
-                image.save(buffer, format='JPEG', quality=quality)
-                compressed_data = buffer.getvalue()
-                
-                if len(compressed_data) <= SCREENSHOT_MAX_SIZE or quality <= 10:
-                    break
-                
-                quality -= 5
-            
-            logger.debug('图片压缩完成，原始大小: %d字节，压缩后大小: %d字节，质量: %d', 
-                       len(image_data), len(compressed_data), quality)
-            
-            return compressed_data
+            # JPEG解码时直接输出缩小的灰度图像，其他格式忽略
+            image.draft('L', (image.width // 8 or 1, image.height // 8 or 1))
+            pixels = image.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+            bits = 0
+            for row in range(8):
+                for col in range(8):
+                    bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+            return '%016x' % bits
         except Exception as e:
-            logger.error('压缩图片失败: %s', e)
-            return image_data
+            logger.error('计算截图指纹失败: %s', e)
+            return None
+    
+    @staticmethod
+    def fingerprint_distance(first, second):
+        """返回两个画面指纹不同的位数"""
+        return bin(int(first, 16) ^ int(second, 16)).count('1')
     
     @staticmethod
     def get_screenshot():
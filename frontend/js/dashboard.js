@@ -4,22 +4,115 @@
 let cpuChart = null;
 let memoryChart = null;
 
+// 图表当前展示的客户端及其数据点
+let chartClientId = null;
+let chartPoints = [];
+
+// 图表展示的时间窗口（毫秒）
+const CHART_WINDOW = 3600 * 1000;
+
+// 客户端列表延迟刷新定时器
+let clientListTimer = null;
+
 // 页面加载完成后执行
 document.addEventListener('DOMContentLoaded', function() {
     // 初始化图表
     initCharts();
     
-    // 加载数据
+    // 加载全量数据
+    loadAll();
+    
+    if (window.EventSource) {
+        // 订阅服务端事件流，之后只接收增量变化
+        subscribeEvents();
+        // 本地刷新相对时间，不访问服务端
+        setInterval(refreshRelativeTimes, 15000);
+    } else {
+        // 浏览器不支持EventSource时退回定时轮询
+        setInterval(loadClientStats, 5000);  // 每5秒刷新一次客户端统计
+        setInterval(loadScreenshots, 10000);  // 每10秒刷新一次截图
+        setInterval(loadClientList, 15000);  // 每15秒刷新一次客户端列表
+        setInterval(updateCharts, 30000);  // 每30秒更新一次图表
+    }
+});
+
+/**
+ * 加载全部数据
+ */
+function loadAll() {
     loadClientStats();
     loadScreenshots();
     loadClientList();
+    updateCharts();
+}
+
+/**
+ * 订阅服务端事件流
+ */
+function subscribeEvents() {
+    const source = new EventSource(`${API_BASE}/events`);
     
-    // 设置定时刷新
-    setInterval(loadClientStats, 5000);  // 每5秒刷新一次客户端统计
-    setInterval(loadScreenshots, 10000);  // 每10秒刷新一次截图
-    setInterval(loadClientList, 15000);  // 每15秒刷新一次客户端列表
-    setInterval(updateCharts, 30000);  // 每30秒更新一次图表
-});
+    // 客户端上线或下线：更新统计卡片，稍后刷新客户端列表
+    source.addEventListener('client_status', function(event) {
+        const data = JSON.parse(event.data);
+        renderClientStats(data.online_count, data.offline_count);
+        scheduleClientListReload();
+        if (data.status === 'online' && chartClientId === null) {
+            updateCharts();
+        }
+    });
+    
+    // 新截图：更新对应客户端的轮播项
+    source.addEventListener('screenshot', function(event) {
+        const data = JSON.parse(event.data);
+        const row = document.querySelector(`#clientTableBody tr[data-client-id="${data.client_id}"]`);
+        const hostname = row ? row.dataset.hostname : `客户端${data.client_id}`;
+        renderScreenshot(data.client_id, hostname, screenshotUrl(data), data.created_at);
+    });
+    
+    // 画面未变化：只更新对应轮播项的确认时间
+    source.addEventListener('screenshot_unchanged', function(event) {
+        const data = JSON.parse(event.data);
+        const time = document.querySelector(`#carouselInner .carousel-item[data-client-id="${data.client_id}"] .screenshot-time`);
+        if (time) {
+            time.textContent = `更新时间: ${Utils.formatDateTime(data.last_seen_at)}`;
+        }
+    });
+    
+    // 新数据点：追加到当前图表
+    source.addEventListener('system_data', function(event) {
+        const data = JSON.parse(event.data);
+        if (data.client_id === chartClientId) {
+            appendChartPoints(data.points);
+        }
+    });
+    
+    // 服务端无法补发错过的事件：重新加载全量数据
+    source.addEventListener('reset', loadAll);
+}
+
+/**
+ * 延迟刷新客户端列表，合并短时间内的多次状态变化
+ */
+function scheduleClientListReload() {
+    if (clientListTimer) {
+        return;
+    }
+    clientListTimer = setTimeout(function() {
+        clientListTimer = null;
+        loadClientList();
+    }, 1000);
+}
+
+/**
+ * 刷新客户端列表中的相对时间
+ */
+function refreshRelativeTimes() {
+    document.querySelectorAll('#clientTableBody td[data-last-heartbeat]').forEach(cell => {
+        cell.textContent = Utils.formatRelativeTime(cell.dataset.lastHeartbeat);
+    });
+    document.getElementById('updateTime').textContent = new Date().toLocaleString('zh-CN');
+}
 
 /**
  * 初始化图表
@@ -127,28 +220,35 @@ function loadClientStats() {
     Utils.apiRequest('/clients/stats')
         .then(data => {
             if (data && data.status === 'ok') {
-                const onlineCount = data.online_count || 0;
-                const offlineCount = data.offline_count || 0;
-                const totalCount = onlineCount + offlineCount;
-                
-                // 更新统计卡片
-                document.getElementById('onlineCount').textContent = onlineCount;
-                document.getElementById('offlineCount').textContent = offlineCount;
-                document.getElementById('totalCount').textContent = totalCount;
-                
-                // 更新时间
-                const now = new Date();
-                document.getElementById('updateTime').textContent = now.toLocaleString('zh-CN');
+                renderClientStats(data.online_count, data.offline_count);
             }
         });
 }
 
+/**
+ * 更新统计卡片
+ * @param {number} onlineCount - 在线客户端数量
+ * @param {number} offlineCount - 离线客户端数量
+ */
+function renderClientStats(onlineCount, offlineCount) {
+    onlineCount = onlineCount || 0;
+    offlineCount = offlineCount || 0;
+    
+    document.getElementById('onlineCount').textContent = onlineCount;
+    document.getElementById('offlineCount').textContent = offlineCount;
+    document.getElementById('totalCount').textContent = onlineCount + offlineCount;
+    
+    // 更新时间
+    const now = new Date();
+    document.getElementById('updateTime').textContent = now.toLocaleString('zh-CN');
+}
+
 /**
  * 加载截图轮播数据
  */
 function loadScreenshots() {
-    // 获取所有客户端
-    Utils.apiRequest('/clients')
+    // 获取所有客户端（逐页请求，只取轮播需要的字段）
+    Utils.apiRequestAll('/clients?limit=1000&fields=id,hostname,status', 'clients')
         .then(clientsData => {
             if (clientsData && clientsData.status === 'ok') {
                 const clients = clientsData.clients;
@@ -156,26 +256,15 @@ function loadScreenshots() {
                 carouselInner.innerHTML = '';
                 
                 // 遍历客户端，获取每个客户端的最新截图
-                clients.forEach((client, index) => {
+                clients.forEach(client => {
                     if (client.status === 'online') {
                         Utils.apiRequest(`/screenshots/latest/${client.id}`)
                             .then(screenshotData => {
                                 if (screenshotData && screenshotData.status === 'ok') {
                                     const screenshot = screenshotData.screenshot;
                                     if (screenshot) {
-                                        // 创建轮播项
-                                        const carouselItem = document.createElement('div');
-                                        carouselItem.className = `carousel-item ${index === 0 ? 'active' : ''}`;
-                                        
-                                        carouselItem.innerHTML = `
-                                            <img src="${API_BASE}/screenshots/download/${screenshot.file_path.split('/').pop()}" alt="${client.hostname} 截图">
-                                            <div class="carousel-caption d-none d-md-block">
-                                                <h5>${client.hostname}</h5>
-                                                <p>更新时间: ${Utils.formatDateTime(screenshot.created_at)}</p>
-                                            </div>
-                                        `;
-                                        
-                                        carouselInner.appendChild(carouselItem);
+                                        renderScreenshot(client.id, client.hostname, screenshotUrl(screenshot),
+                                                         screenshot.last_seen_at || screenshot.created_at);
                                     }
                                 }
                             });
@@ -185,11 +274,51 @@ function loadScreenshots() {
         });
 }
 
+/**
+ * 获取轮播使用的截图地址：优先使用中等尺寸的缩略图
+ * @param {Object} screenshot - 截图记录或截图事件
+ * @returns {string} 截图地址
+ */
+function screenshotUrl(screenshot) {
+    if (screenshot.urls) {
+        return new URL(screenshot.urls.medium, API_BASE).href;
+    }
+    return `${API_BASE}/screenshots/download/${screenshot.file_path ? screenshot.file_path.split('/').pop() : screenshot.filename}`;
+}
+
+/**
+ * 新增或替换客户端的截图轮播项
+ * @param {number} clientId - 客户端ID
+ * @param {string} hostname - 主机名
+ * @param {string} url - 截图地址
+ * @param {string} createdAt - 截图时间
+ */
+function renderScreenshot(clientId, hostname, url, createdAt) {
+    const carouselInner = document.getElementById('carouselInner');
+    let carouselItem = carouselInner.querySelector(`.carousel-item[data-client-id="${clientId}"]`);
+    
+    if (!carouselItem) {
+        // 创建轮播项，第一项设为当前项
+        carouselItem = document.createElement('div');
+        carouselItem.className = `carousel-item ${carouselInner.children.length === 0 ? 'active' : ''}`;
+        carouselItem.dataset.clientId = clientId;
+        carouselInner.appendChild(carouselItem);
+    }
+    
+    carouselItem.innerHTML = `
+        <img src="${url}" alt="${hostname} 截图" loading="lazy">
+        <div class="carousel-caption d-none d-md-block">
+            <h5>${hostname}</h5>
+            <p class="screenshot-time">更新时间: ${Utils.formatDateTime(createdAt)}</p>
+        </div>
+    `;
+}
+
 /**
  * 加载客户端列表
  */
 function loadClientList() {
-    Utils.apiRequest('/clients')
+    Utils.apiRequest('/clients?limit=10&fields=id,hostname,ip_address,port,status,last_heartbeat')
         .then(data => {
             if (data && data.status === 'ok') {
                 const clients = data.clients;
@@ -201,6 +330,8 @@ function loadClientList() {
                 
                 displayClients.forEach(client => {
                     const row = document.createElement('tr');
+                    row.dataset.clientId = client.id;
+                    row.dataset.hostname = client.hostname;
                     row.innerHTML = `
                         <td>${client.hostname}</td>
                         <td>${client.ip_address}:${client.port}</td>
@@ -208,7 +339,7 @@ function loadClientList() {
                             <span class="client-status status-${client.status}"></span>
                             ${client.status === 'online' ? '在线' : '离线'}
                         </td>
-                        <td>${Utils.formatRelativeTime(client.last_heartbeat)}</td>
+                        <td data-last-heartbeat="${client.last_heartbeat}">${Utils.formatRelativeTime(client.last_heartbeat)}</td>
                         <td>
                             <a href="maintenance.html?client_id=${client.id}" class="btn btn-sm btn-primary">详情</a>
                         </td>
@@ -223,49 +354,71 @@ function loadClientList() {
  * 更新图表数据
  */
 function updateCharts() {
-    // 获取所有客户端
-    Utils.apiRequest('/clients')
+    // 逐页获取客户端，找到第一个在线客户端后不再请求后续页
+    const isOnline = client => client.status === 'online';
+    Utils.apiRequestAll('/clients?fields=id,status', 'clients', clients => clients.some(isOnline))
         .then(clientsData => {
             if (clientsData && clientsData.status === 'ok') {
                 const clients = clientsData.clients;
-                const onlineClients = clients.filter(client => client.status === 'online');
+                const onlineClients = clients.filter(isOnline);
                 
                 if (onlineClients.length > 0) {
-                    // 获取第一个在线客户端的系统数据
+                    // 获取第一个在线客户端最近1小时的系统数据（服务端按数据点数选择汇总粒度）
                     const clientId = onlineClients[0].id;
-                    Utils.apiRequest(`/system_data/${clientId}`)
+                    const start = Math.floor((Date.now() - CHART_WINDOW) / 1000);
+                    chartClientId = clientId;
+                    Utils.apiRequest(`/system_data/${clientId}?start=${start}&points=120`)
                         .then(systemData => {
                             if (systemData && systemData.status === 'ok') {
-                                const data = systemData.system_data;
-                                if (data.length > 0) {
-                                    // 准备图表数据
-                                    const timestamps = data.map(item => Utils.formatDateTime(item.created_at));
-                                    const cpuData = data.map(item => item.cpu_usage);
-                                    const memoryData = data.map(item => item.memory_usage);
-                                    
-                                    // 更新CPU图表
-                                    cpuChart.setOption({
-                                        xAxis: {
-                                            data: timestamps
-                                        },
-                                        series: [{
-                                            data: cpuData
-                                        }]
-                                    });
-                                    
-                                    // 更新内存图表
-                                    memoryChart.setOption({
-                                        xAxis: {
-                                            data: timestamps
-                                        },
-                                        series: [{
-                                            data: memoryData
-                                        }]
-                                    });
-                                }
+                                chartPoints = systemData.system_data;
+                                renderCharts();
                             }
                         });
                 }
             }
         });
 }
+
+/**
+ * 追加事件推送的数据点，并移除超出时间窗口的数据点
+ * @param {Array} points - 数据点列表
+ */
+function appendChartPoints(points) {
+    const cutoff = Date.now() - CHART_WINDOW;
+    chartPoints = chartPoints.concat(points).filter(item => new Date(item.created_at).getTime() >= cutoff);
+    renderCharts();
+}
+
+/**
+ * 根据当前数据点更新图表
+ */
+function renderCharts() {
+    if (chartPoints.length === 0) {
+        return;
+    }
+    
+    // 准备图表数据
+    const timestamps = chartPoints.map(item => Utils.formatDateTime(item.created_at));
+    const cpuData = chartPoints.map(item => item.cpu_usage);
+    const memoryData = chartPoints.map(item => item.memory_usage);
+    
+    // 更新CPU图表
+    cpuChart.setOption({
+        xAxis: {
+            data: timestamps
+        },
+        series: [{
+            data: cpuData
+        }]
+    });
+    
+    // 更新内存图表
+    memoryChart.setOption({
+        xAxis: {
+            data: timestamps
+        },
+        series: [{
+            data: memoryData
+        }]
+    });
+}
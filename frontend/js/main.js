@@ -38,6 +38,32 @@ const Utils = {
             });
     },
     
+    /**
+     * 请求分页列表接口的所有页：沿next_cursor依次请求，直到next_cursor为null
+     * @param {string} url - API地址（可带limit、fields等参数）
+     * @param {string} key - 响应中列表字段的名称
+     * @param {Function} until - 可选，传入已获取的列表，返回true时不再请求后续页
+     * @returns {Promise} - 返回Promise对象，成功时为{status: 'ok', [key]: 合并后的列表}，请求失败时为null
+     */
+    apiRequestAll: function(url, key, until = null) {
+        const separator = url.includes('?') ? '&' : '?';
+        const items = [];
+        const requestPage = cursor => {
+            const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+            return Utils.apiRequest(pageUrl).then(data => {
+                if (!data || data.status !== 'ok') {
+                    return null;
+                }
+                items.push(...data[key]);
+                if (data.next_cursor && !(until && until(items))) {
+                    return requestPage(data.next_cursor);
+                }
+                return {status: 'ok', [key]: items};
+            });
+        };
+        return requestPage(null);
+    },
+    
     /**
      * 格式化日期时间
      * @param {string} dateString - 日期字符串
@@ -6,17 +6,53 @@ import os
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, current_app, request, jsonify, send_file, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
+import atexit
 import datetime
+import time
+import math
+import json
+import zlib
+import hashlib
 from server.database import db
-from server.config import config
+from server.config import config, CONFIG_NAME
+from server.presence import PresenceRegistry
+from server.events import EventBroker
+from server.commands import (CommandNotifier, LeaseReaper, COMMAND_TYPES, FINAL_STATUSES, hostname_pattern,
+                             create_job, claim_commands, renew_lease, append_output, spill_result, discard_result,
+                             record_result)
+from server.blobs import BlobStore, iter_file
+from server.presets import PresetCatalog, PRESET_FIELDS
+from server.screenshots import ScreenshotStore, parse_tiles, image_mimetype
+from server.thumbnails import ThumbnailCache, RENDITIONS, rendition_urls
+from server.ingest import ScreenshotIngest, UploadTooLarge, IngestQueueFull
+from server.command_history import HISTORY_FIELDS, build_filters, query_history, aggregate_history, job_counts
+from server.retention import RetentionJob
+from server.pagination import parse_page_args, next_cursor, encode_cursor, make_etag, not_modified, json_with_etag
+from server.metrics import parse_sample, parse_timestamp, insert_samples, query_series
+
+# 截图上传接口，请求体上限为截图大小上限加上表单字段的余量
+SCREENSHOT_UPLOAD_ENDPOINTS = ('upload_screenshot', 'upload_screenshot_delta')
+SCREENSHOT_FORM_OVERHEAD = 64 * 1024
+
+class InspectionRequest(Request):
+    """请求类：截图上传接口以截图大小上限作为请求体上限（而不是MAX_CONTENT_LENGTH），
+    没有Content-Length的分块上传在解析表单时读取超过上限即停止"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint in SCREENSHOT_UPLOAD_ENDPOINTS:
+            return current_app.config['MAX_SCREENSHOT_SIZE'] + SCREENSHOT_FORM_OVERHEAD
+        return super().max_content_length
 
 # 创建Flask应用
 app = Flask(__name__)
+app.request_class = InspectionRequest
 
 # 加载配置
-app.config.from_object(config['default'])
+app.config.from_object(config[CONFIG_NAME])
 
 # 启用CORS
 CORS(app)
@@ -24,19 +60,170 @@ CORS(app)
 # 创建必要的目录
 os.makedirs(app.config['SCREENSHOT_DIR'], exist_ok=True)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['BLOB_DIR'], exist_ok=True)
+
+# 列表接口可投影的列
+CLIENT_FIELDS = ('id', 'hostname', 'ip_address', 'port', 'status', 'last_heartbeat', 'created_at', 'updated_at')
+SYSTEM_DATA_FIELDS = ('id', 'client_id', 'cpu_usage', 'memory_usage', 'disk_usage', 'created_at')
+SCREENSHOT_FIELDS = ('id', 'client_id', 'file_path', 'content_hash', 'base_hash', 'file_size', 'fingerprint',
+                     'last_seen_at', 'created_at')
+
+# 事件分发器（向大屏等订阅者推送状态变化、新截图和新数据点）
+events = EventBroker(app.config['EVENTS_QUEUE_SIZE'], app.config['EVENTS_HISTORY_SIZE'])
+
+# 客户端在线状态注册表（心跳在内存中应答，定期批量写回数据库）
+presence = PresenceRegistry(db, app.config['HEARTBEAT_TIMEOUT'], app.config['PRESENCE_FLUSH_INTERVAL'],
+                            app.config['IDENTITY_CACHE_SIZE'], events)
+presence.start()
+atexit.register(presence.stop)
+
+# 命令下发通知（长轮询的待执行命令请求在内存中等待，下发命令时唤醒）
+command_notifier = CommandNotifier(app.config['COMMAND_HINT_TTL'])
+
+# 命令租约回收任务（租约到期的已领取命令重新排队）
+lease_reaper = LeaseReaper(db, app.config, command_notifier)
+lease_reaper.start()
+atexit.register(lease_reaper.stop)
+
+# 预设命令目录缓存（修改时失效，下发时按ID查找）
+presets = PresetCatalog(db, app.config['PRESET_CACHE_TTL'])
+
+# 内容寻址文件存储（保存超过阈值的命令结果）
+blobs = BlobStore(app.config['BLOB_DIR'])
+
+# 截图存储（按内容哈希分片存放，相同截图只存一份）
+screenshot_store = ScreenshotStore(db, app.config['SCREENSHOT_DIR'], app.config['BLOB_GC_MIN_AGE'])
+
+# 截图缩略图（上传后在后台生成，大屏轮播加载缩略图而不是原图）
+thumbnails = ThumbnailCache(app.config['THUMBNAIL_DIR'], app.config['THUMBNAIL_CACHE_MAX'],
+                            app.config['THUMBNAIL_QUALITY'])
+thumbnails.start()
+atexit.register(thumbnails.stop)
+
+# 后台数据清理任务
+retention = RetentionJob(db, app.config, blobs, screenshot_store)
+retention.start()
+atexit.register(retention.stop)
 
 # 辅助函数：获取客户端状态
-def get_client_status(last_heartbeat):
-    """根据最后心跳时间判断客户端状态"""
-    timeout = app.config['HEARTBEAT_TIMEOUT']
-    if (datetime.datetime.now() - last_heartbeat).total_seconds() > timeout:
-        return 'offline'
-    return 'online'
+def get_client_status(client):
+    """根据注册表中的最后心跳时间更新客户端状态"""
+    last_heartbeat = presence.last_heartbeat(client['id'])
+    if last_heartbeat is not None and 'last_heartbeat' in client:
+        client['last_heartbeat'] = last_heartbeat
+    return presence.status(client['id'])
+
+# 辅助函数：将数字形式的查询参数转换为数值（Unix时间戳）
+def _numeric_arg(value):
+    """数字字符串转换为float，其他值原样返回"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+# 辅助函数：获取客户端最新一行数据的ID，作为列表的数据版本
+def _latest_id(table, client_id):
+    """查询客户端在指定表中的最大ID（走client_id索引）"""
+    rows = db.execute_query(f"SELECT MAX(id) AS max_id FROM {table} WHERE client_id = %s", (client_id,))
+    return rows[0]['max_id'] if rows else None
+
+# 辅助函数：为截图行附加各规格的下载地址
+def _with_urls(screenshot):
+    """按content_hash或file_path生成small/medium/full地址，差分截图为合成画面的地址；投影中没有这些列时不附加"""
+    # 截图写入线程中没有请求上下文，不能使用url_for
+    adapter = app.url_map.bind('localhost', script_name=app.config['APPLICATION_ROOT'])
+    urls = rendition_urls(
+        screenshot,
+        lambda filename, size: adapter.build('download_screenshot', {'filename': filename, 'size': size}),
+        lambda screenshot_id, size: adapter.build('screenshot_frame', {'screenshot_id': screenshot_id, 'size': size})
+    )
+    if urls:
+        screenshot['urls'] = urls
+    return screenshot
+
+# 辅助函数：发送内容不会变化的文件（按内容哈希命名的截图和缩略图）
+def _send_immutable(path, mimetype, etag, **kwargs):
+    """以etag和immutable缓存策略发送文件，浏览器可长期缓存"""
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=365 * 24 * 3600, **kwargs)
+    response.cache_control.immutable = True
+    return response
+
+# 辅助函数：解析JSON请求体，支持gzip压缩（Content-Encoding: gzip）
+def _request_json():
+    """返回解析后的JSON请求体，格式错误或解压后超过MAX_CONTENT_LENGTH时返回None"""
+    body = request.get_data()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        limit = app.config['MAX_CONTENT_LENGTH']
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, limit)
+        except zlib.error:
+            return None
+        if decompressor.unconsumed_tail:
+            return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+# 辅助函数：发布新的系统数据点
+def _publish_samples(rows):
+    """按客户端分组发布system_data事件，数据点按采样时间排序"""
+    points = {}
+    for client_id, cpu_usage, memory_usage, disk_usage, created_at in sorted(rows, key=lambda row: row[4]):
+        points.setdefault(client_id, []).append({
+            'created_at': created_at, 'cpu_usage': cpu_usage,
+            'memory_usage': memory_usage, 'disk_usage': disk_usage
+        })
+    for client_id, client_points in points.items():
+        events.publish('system_data', {'client_id': client_id, 'points': client_points})
+
+# 辅助函数：截图写入数据库后的处理（在截图写入线程中调用）
+def _screenshots_stored(rows):
+    """为完整截图生成缩略图（大屏收到事件后请求时通常已生成），发布新截图事件"""
+    now = datetime.datetime.now()
+    for row in rows:
+        if not row['base_hash']:
+            thumbnails.submit(screenshot_store.blobs.path(row['content_hash']), row['content_hash'])
+        events.publish('screenshot', _with_urls({'client_id': int(row['client_id']), 'id': row['id'],
+                                                 'filename': row['content_hash'], 'content_hash': row['content_hash'],
+                                                 'base_hash': row['base_hash'], 'file_size': row['file_size'],
+                                                 'created_at': now}))
+
+# 截图异步写入（上传内容流式写入临时文件，后台线程批量移动文件并写入数据库）
+ingest = ScreenshotIngest(db, screenshot_store, app.config['MAX_SCREENSHOT_SIZE'], app.config['SCREENSHOT_INGEST_QUEUE'],
+                          app.config['SCREENSHOT_INGEST_BATCH'], _screenshots_stored)
+ingest.start()
+atexit.register(ingest.stop)
+
+# 辅助函数：解析截图上传表单
+def _screenshot_form():
+    """返回(上传的文件, 表单字段)；请求体超过上限时（Content-Length超过或分块上传读取超过）抛出UploadTooLarge"""
+    try:
+        return request.files.get('file'), request.form
+    except RequestEntityTooLarge:
+        raise UploadTooLarge()
+
+# 辅助函数：提交已写入临时文件的截图
+def _submit_screenshot(upload, row):
+    """upload为ingest.receive的返回值，row为截图行的其余列；文件和描述文件持久化后立即返回202和上传凭据，
+    不等待写入数据库，客户端稍后按上传凭据查询截图ID
+    """
+    temp_path, content_hash, file_size = upload
+    try:
+        pending = ingest.submit(temp_path, content_hash, file_size, row)
+    except IngestQueueFull:
+        if row.get('base_hash'):
+            screenshot_store.release({row['base_hash']: 1})
+        return jsonify({'status': 'error', 'message': 'Screenshot queue is full'}), 503
+    
+    return jsonify({'status': 'accepted', 'upload_id': pending.upload_id, 'filename': content_hash}), 202
 
 # 路由：健康检查
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'message': 'Server is running'}), 200
+    return jsonify({'status': 'ok', 'message': 'Server is running', 'db_pool': db.pool_stats()}), 200
 
 # 路由：客户端心跳
 @app.route('/api/heartbeat', methods=['POST'])
@@ -49,34 +236,40 @@ def heartbeat():
     if not all([hostname, ip_address, port]):
         return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
     
-    # 检查客户端是否已存在
-    query = "SELECT id, last_heartbeat FROM clients WHERE hostname = %s AND ip_address = %s AND port = %s"
-    client = db.execute_query(query, (hostname, ip_address, port))
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid port'}), 400
     
-    if client:
-        # 更新心跳时间
-        client_id = client[0]['id']
-        update_query = "UPDATE clients SET last_heartbeat = NOW(), status = 'online' WHERE id = %s"
-        db.execute_update(update_query, (client_id,))
-    else:
-        # 新增客户端
-        insert_query = "INSERT INTO clients (hostname, ip_address, port, status, last_heartbeat) VALUES (%s, %s, %s, 'online', NOW())"
-        db.execute_update(insert_query, (hostname, ip_address, port))
-        client_id = db.cursor.lastrowid
+    # 在注册表中记录心跳，身份缓存未命中时才通过一次upsert写入数据库
+    client_id = presence.heartbeat(hostname, ip_address, port)
+    if client_id is None:
+        return jsonify({'status': 'error', 'message': 'Failed to register client'}), 500
     
     return jsonify({'status': 'ok', 'client_id': client_id}), 200
 
 # 路由：获取客户端列表
 @app.route('/api/clients', methods=['GET'])
 def get_clients():
-    query = "SELECT * FROM clients"
-    clients = db.execute_query(query)
+    try:
+        columns, limit, after_id = parse_page_args(CLIENT_FIELDS)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    # 客户端列表未变化时直接返回304，不查询数据库
+    etag = make_etag(presence.version(include_heartbeats='last_heartbeat' in columns))
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    query = f"SELECT {', '.join(columns)} FROM clients WHERE id > %s ORDER BY id ASC LIMIT %s"
+    clients = db.execute_query(query, (after_id or 0, limit)) or []
     
     # 更新客户端状态
     for client in clients:
-        client['status'] = get_client_status(client['last_heartbeat'])
+        client['status'] = get_client_status(client)
     
-    return jsonify({'status': 'ok', 'clients': clients}), 200
+    return json_with_etag({'status': 'ok', 'clients': clients, 'next_cursor': next_cursor(clients, limit)}, etag), 200
 
 # 路由：获取客户端详情
 @app.route('/api/clients/<int:client_id>', methods=['GET'])
@@ -88,7 +281,7 @@ def get_client(client_id):
         return jsonify({'status': 'error', 'message': 'Client not found'}), 404
     
     client = client[0]
-    client['status'] = get_client_status(client['last_heartbeat'])
+    client['status'] = get_client_status(client)
     
     return jsonify({'status': 'ok', 'client': client}), 200
 
@@ -104,29 +297,97 @@ def upload_system_data():
     if not all([client_id, cpu_usage, memory_usage, disk_usage]):
         return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
     
+    try:
+        row = parse_sample(data)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
     # 插入系统数据
-    query = "INSERT INTO system_data (client_id, cpu_usage, memory_usage, disk_usage) VALUES (%s, %s, %s, %s)"
-    db.execute_update(query, (client_id, cpu_usage, memory_usage, disk_usage))
+    if insert_samples(db, [row]):
+        _publish_samples([row])
     
     return jsonify({'status': 'ok'}), 200
 
+# 路由：批量上传系统数据（支持多个客户端的带时间戳采样）
+@app.route('/api/system_data/batch', methods=['POST'])
+def upload_system_data_batch():
+    data = request.json
+    samples = data.get('samples')
+    default_client_id = data.get('client_id')
+    
+    if not isinstance(samples, list) or not samples:
+        return jsonify({'status': 'error', 'message': 'Missing samples'}), 400
+    
+    if len(samples) > app.config['SYSTEM_DATA_BATCH_MAX']:
+        return jsonify({'status': 'error', 'message': 'Too many samples'}), 413
+    
+    rows = []
+    rejected = 0
+    for sample in samples:
+        try:
+            rows.append(parse_sample(sample, default_client_id))
+        except ValueError:
+            rejected += 1
+    
+    # 一条多行INSERT语句写入整批数据
+    inserted = insert_samples(db, rows)
+    if rows and not inserted:
+        return jsonify({'status': 'error', 'message': 'Failed to store samples'}), 500
+    _publish_samples(rows)
+    
+    return jsonify({'status': 'ok', 'inserted': inserted, 'rejected': rejected}), 200
+
 # 路由：获取系统数据
 @app.route('/api/system_data/<int:client_id>', methods=['GET'])
 def get_system_data(client_id):
-    # 获取最近100条数据
-    query = "SELECT * FROM system_data WHERE client_id = %s ORDER BY created_at DESC LIMIT 100"
-    system_data = db.execute_query(query, (client_id,))
-    
-    return jsonify({'status': 'ok', 'system_data': system_data}), 200
+    start = request.args.get('start')
+    end = request.args.get('end')
+    
+    # 没有新数据时直接返回304
+    etag = make_etag(_latest_id('system_data', client_id))
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    if start is None and end is None:
+        # 未指定时间范围：按ID倒序分页，默认获取最近100条数据
+        try:
+            columns, limit, before_id = parse_page_args(SYSTEM_DATA_FIELDS, default_limit=100)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        query = f"SELECT {', '.join(columns)} FROM system_data WHERE client_id = %s AND id < %s ORDER BY id DESC LIMIT %s"
+        system_data = db.execute_query(query, (client_id, before_id or 2 ** 63 - 1, limit)) or []
+        return json_with_etag({'status': 'ok', 'system_data': system_data,
+                               'next_cursor': next_cursor(system_data, limit)}, etag), 200
+    
+    # 指定时间范围：选择仍能填满所需数据点数的最粗粒度汇总表
+    try:
+        end = parse_timestamp(_numeric_arg(end))
+        start = parse_timestamp(_numeric_arg(start)) if start is not None else end - datetime.timedelta(hours=1)
+        points = min(int(request.args.get('points', 300)), app.config['SYSTEM_DATA_MAX_POINTS'])
+    except (TypeError, ValueError, OverflowError, OSError):
+        return jsonify({'status': 'error', 'message': 'Invalid time range'}), 400
+    
+    if start >= end or points <= 0:
+        return jsonify({'status': 'error', 'message': 'Invalid time range'}), 400
+    
+    resolution, system_data = query_series(db, client_id, start, end, points)
+    
+    return json_with_etag({'status': 'ok', 'resolution': resolution, 'system_data': system_data}, etag), 200
 
 # 路由：上传截图
 @app.route('/api/screenshots', methods=['POST'])
 def upload_screenshot():
-    if 'file' not in request.files:
+    try:
+        file, form = _screenshot_form()
+    except UploadTooLarge:
+        return jsonify({'status': 'error', 'message': 'Screenshot too large'}), 413
+    
+    if file is None:
         return jsonify({'status': 'error', 'message': 'No file part'}), 400
     
-    file = request.files['file']
-    client_id = request.form.get('client_id')
+    client_id = form.get('client_id')
     
     if not client_id:
         return jsonify({'status': 'error', 'message': 'Missing client_id'}), 400
@@ -134,25 +395,103 @@ def upload_screenshot():
     if file.filename == '':
         return jsonify({'status': 'error', 'message': 'No selected file'}), 400
     
-    # 保存截图
-    filename = f"client_{client_id}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-    filepath = os.path.join(app.config['SCREENSHOT_DIR'], filename)
-    file.save(filepath)
+    # 边读边检查大小，超过上限时立即停止读取
+    try:
+        upload = ingest.receive(file.stream)
+    except UploadTooLarge:
+        return jsonify({'status': 'error', 'message': 'Screenshot too large'}), 413
+    
+    # 按内容哈希保存截图（相同截图只增加引用数）并记录到数据库（fingerprint为客户端计算的画面指纹）
+    return _submit_screenshot(upload, {'client_id': client_id, 'fingerprint': form.get('fingerprint')})
+
+# 路由：上传差分截图（只包含相对关键帧变化的图块，请求时再合成完整画面）
+@app.route('/api/screenshots/<int:base_id>/delta', methods=['POST'])
+def upload_screenshot_delta(base_id):
+    # 服务端无法合成画面时客户端改为上传完整截图
+    if not thumbnails.available:
+        return jsonify({'status': 'error', 'message': 'Delta screenshots are not supported'}), 501
+    try:
+        file, form = _screenshot_form()
+    except UploadTooLarge:
+        return jsonify({'status': 'error', 'message': 'Screenshot too large'}), 413
+    
+    client_id = form.get('client_id')
+    if not client_id or file is None:
+        return jsonify({'status': 'error', 'message': 'Missing client_id or file'}), 400
+    try:
+        tiles = parse_tiles(form.get('tiles'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    try:
+        upload = ingest.receive(file.stream)
+    except UploadTooLarge:
+        return jsonify({'status': 'error', 'message': 'Screenshot too large'}), 413
+    
+    # 关键帧必须是该客户端的完整截图；差分截图持有关键帧文件的引用，关键帧行先被清理时文件仍保留
+    rows = db.execute_query("SELECT content_hash FROM screenshots WHERE id = %s AND client_id = %s AND base_hash IS NULL",
+                            (base_id, client_id))
+    base_hash = rows[0]['content_hash'] if rows else None
+    if not base_hash or not screenshot_store.retain(base_hash):
+        ingest.discard(upload[0])
+        return jsonify({'status': 'error', 'message': 'Keyframe not found'}), 404
+    
+    return _submit_screenshot(upload, {'client_id': client_id, 'base_hash': base_hash,
+                                       'tiles': json.dumps(tiles, separators=(',', ':')),
+                                       'fingerprint': form.get('fingerprint')})
+
+# 路由：按上传凭据查询截图的写入结果
+@app.route('/api/screenshots/uploads/<upload_id>', methods=['GET'])
+def get_screenshot_upload(upload_id):
+    pending = ingest.lookup(upload_id)
+    if pending is None:
+        return jsonify({'status': 'error', 'message': 'Upload not found'}), 404
+    if not pending.done.is_set():
+        return jsonify({'status': 'accepted', 'upload_id': upload_id}), 202
+    if not pending.id:
+        return jsonify({'status': 'error', 'message': 'Failed to save screenshot'}), 500
+    return jsonify({'status': 'ok', 'id': pending.id, 'filename': pending.content_hash}), 200
+
+# 路由：画面未变化（客户端不上传图片，只确认上一张截图仍是当前画面）
+@app.route('/api/screenshots/<int:screenshot_id>/unchanged', methods=['POST'])
+def screenshot_unchanged(screenshot_id):
+    data = request.json
+    client_id = data.get('client_id')
+    
+    if not client_id:
+        return jsonify({'status': 'error', 'message': 'Missing client_id'}), 400
+    
+    # 只更新最后确认时间，不新增行和文件；截图不存在时客户端改为上传完整图片
+    now = datetime.datetime.now()
+    updated = db.execute_update("UPDATE screenshots SET last_seen_at = %s WHERE id = %s AND client_id = %s",
+                                (now, screenshot_id, client_id))
+    if not updated:
+        return jsonify({'status': 'error', 'message': 'Screenshot not found'}), 404
     
-    # 记录到数据库
-    file_size = os.path.getsize(filepath)
-    query = "INSERT INTO screenshots (client_id, file_path, file_size) VALUES (%s, %s, %s)"
-    db.execute_update(query, (client_id, filepath, file_size))
+    events.publish('screenshot_unchanged', {'client_id': int(client_id), 'id': screenshot_id, 'last_seen_at': now})
     
-    return jsonify({'status': 'ok', 'filename': filename}), 200
+    return jsonify({'status': 'ok', 'id': screenshot_id}), 200
 
 # 路由：获取截图列表
 @app.route('/api/screenshots/<int:client_id>', methods=['GET'])
 def get_screenshots(client_id):
-    query = "SELECT * FROM screenshots WHERE client_id = %s ORDER BY created_at DESC LIMIT 20"
-    screenshots = db.execute_query(query, (client_id,))
-    
-    return jsonify({'status': 'ok', 'screenshots': screenshots}), 200
+    try:
+        columns, limit, before_id = parse_page_args(SCREENSHOT_FIELDS, default_limit=20)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    # 没有新截图时直接返回304
+    etag = make_etag(_latest_id('screenshots', client_id))
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    query = f"SELECT {', '.join(columns)} FROM screenshots WHERE client_id = %s AND id < %s ORDER BY id DESC LIMIT %s"
+    screenshots = db.execute_query(query, (client_id, before_id or 2 ** 63 - 1, limit)) or []
+    screenshots = [_with_urls(screenshot) for screenshot in screenshots]
+    
+    return json_with_etag({'status': 'ok', 'screenshots': screenshots,
+                           'next_cursor': next_cursor(screenshots, limit)}, etag), 200
 
 # 路由：获取最新截图
 @app.route('/api/screenshots/latest/<int:client_id>', methods=['GET'])
@@ -163,79 +502,481 @@ def get_latest_screenshot(client_id):
     if not screenshot:
         return jsonify({'status': 'error', 'message': 'No screenshots found'}), 404
     
-    return jsonify({'status': 'ok', 'screenshot': screenshot[0]}), 200
+    screenshot[0].pop('tiles', None)
+    return jsonify({'status': 'ok', 'screenshot': _with_urls(screenshot[0])}), 200
 
 # 路由：下载截图
 @app.route('/api/screenshots/download/<filename>', methods=['GET'])
 def download_screenshot(filename):
+    # size参数选择规格：small、medium为缩略图，默认full为原图
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in RENDITIONS:
+        return jsonify({'status': 'error', 'message': f'Invalid size: {size}'}), 400
+    
+    # 按内容哈希存储的截图经索引解析路径，内容不会变化，可长期缓存
+    path = screenshot_store.resolve(filename)
+    if path:
+        digest = filename.split('.', 1)[0]
+        thumbnail = thumbnails.get(size, path, digest) if size != 'full' else None
+        if thumbnail:
+            return _send_immutable(thumbnail, 'image/jpeg', f'{digest}-{size}')
+        # 未安装Pillow或原图无法解码时返回原图
+        return _send_immutable(path, image_mimetype(path), digest, as_attachment=True, download_name=filename)
+    
+    # 旧版本按文件名保存的截图
     return send_from_directory(app.config['SCREENSHOT_DIR'], filename, as_attachment=True)
 
-# 路由：获取待执行命令
+# 路由：获取截图的完整画面（差分截图在首次请求时合成，结果保存在缩略图缓存中）
+@app.route('/api/screenshots/frame/<int:screenshot_id>', methods=['GET'])
+def screenshot_frame(screenshot_id):
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in RENDITIONS:
+        return jsonify({'status': 'error', 'message': f'Invalid size: {size}'}), 400
+    
+    rows = db.execute_query("SELECT file_path, content_hash, base_hash, tiles FROM screenshots WHERE id = %s",
+                            (screenshot_id,))
+    if not rows:
+        return jsonify({'status': 'error', 'message': 'Screenshot not found'}), 404
+    screenshot = rows[0]
+    if not screenshot['base_hash']:
+        return download_screenshot(screenshot['content_hash'] or os.path.basename(screenshot['file_path']))
+    
+    # 合成画面由关键帧、图块拼图和图块位置唯一确定
+    key = hashlib.sha256(f"{screenshot['base_hash']}:{screenshot['content_hash']}:{screenshot['tiles']}"
+                         .encode('utf-8')).hexdigest()
+    frame = thumbnails.frame(key, screenshot_store.blobs.path(screenshot['base_hash']),
+                             screenshot_store.blobs.path(screenshot['content_hash']), json.loads(screenshot['tiles']))
+    if not frame:
+        return jsonify({'status': 'error', 'message': 'Failed to reconstruct screenshot'}), 500
+    path = thumbnails.get(size, frame, key) if size != 'full' else frame
+    return _send_immutable(path or frame, 'image/jpeg', f'{key}-{size}')
+
+# 辅助函数：长轮询等待客户端的待执行命令
+def _wait_for_commands(client_id, fetch, **extra):
+    """按wait参数（秒）等待，fetch()返回命令列表，查询失败返回None；extra为响应中附加的字段"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid wait'}), 400
+    if not math.isfinite(wait):
+        return jsonify({'status': 'error', 'message': 'Invalid wait'}), 400
+    wait = min(max(wait, 0), app.config['COMMAND_WAIT_MAX'])
+    
+    deadline = time.monotonic() + wait
+    while True:
+        generation = command_notifier.generation(client_id)
+        # 已知没有新命令时不查询数据库
+        if wait <= 0 or command_notifier.may_have_pending(client_id):
+            commands = fetch()
+            if commands or commands is None or wait <= 0:
+                return jsonify({'status': 'ok', 'commands': commands, **extra}), 200
+            command_notifier.mark_empty(client_id, generation)
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return jsonify({'status': 'ok', 'commands': [], **extra}), 200
+        command_notifier.wait(client_id, generation, remaining)
+
+# 路由：获取待执行命令（只读）
 @app.route('/api/commands/pending/<int:client_id>', methods=['GET'])
 def get_pending_commands(client_id):
     query = "SELECT * FROM commands WHERE client_id = %s AND status = 'pending' ORDER BY created_at ASC"
-    commands = db.execute_query(query, (client_id,))
+    return _wait_for_commands(client_id, lambda: db.execute_query(query, (client_id,)))
+
+# 路由：领取待执行命令（原子地标记为已领取并设置租约，支持wait长轮询）
+@app.route('/api/commands/claim/<int:client_id>', methods=['POST'])
+def claim_pending_commands(client_id):
+    lease_seconds = app.config['COMMAND_LEASE_SECONDS']
+    return _wait_for_commands(client_id, lambda: claim_commands(db, client_id, lease_seconds),
+                              lease_seconds=lease_seconds)
+
+# 路由：续约已领取的命令
+@app.route('/api/commands/lease/<int:command_id>', methods=['POST'])
+def renew_command_lease(command_id):
+    data = request.json
+    claim_token = data.get('claim_token')
     
-    return jsonify({'status': 'ok', 'commands': commands}), 200
+    if not claim_token:
+        return jsonify({'status': 'error', 'message': 'Missing claim_token'}), 400
+    
+    # renewed为false表示租约已失效（命令已重新排队或已结束），客户端应放弃尚未开始执行的命令
+    renewed = renew_lease(db, command_id, claim_token, app.config['COMMAND_LEASE_SECONDS'])
+    
+    return jsonify({'status': 'ok', 'renewed': renewed, 'lease_seconds': app.config['COMMAND_LEASE_SECONDS']}), 200
+
+# 路由：追加执行中命令的输出
+@app.route('/api/commands/output/<int:command_id>', methods=['POST'])
+def append_command_output(command_id):
+    data = _request_json()
+    if data is None:
+        return jsonify({'status': 'error', 'message': 'Invalid request body'}), 400
+    claim_token = data.get('claim_token')
+    offset = data.get('offset')
+    output = data.get('data')
+    
+    if not claim_token or not isinstance(offset, int) or not isinstance(output, str):
+        return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
+    
+    # offset与已接收的字符数不一致时不写入（accepted为false），客户端按返回的output_size重新对齐
+    outcome, output_size = append_output(db, command_id, claim_token, offset, output,
+                                         app.config['COMMAND_OUTPUT_MAX'])
+    if outcome == 'not_found':
+        return jsonify({'status': 'error', 'message': 'Command not found'}), 404
+    if outcome == 'conflict':
+        return jsonify({'status': 'error', 'message': 'Command already finished or reclaimed'}), 409
+    
+    return jsonify({'status': 'ok', 'accepted': outcome == 'appended', 'output_size': output_size}), 200
 
 # 路由：更新命令执行结果
 @app.route('/api/commands/result/<int:command_id>', methods=['POST'])
 def update_command_result(command_id):
-    data = request.json
+    data = _request_json()
+    if data is None:
+        return jsonify({'status': 'error', 'message': 'Invalid request body'}), 400
     status = data.get('status')
     result = data.get('result', '')
     
-    if not status or status not in ['executed', 'failed']:
+    if not status or status not in FINAL_STATUSES:
         return jsonify({'status': 'error', 'message': 'Invalid status'}), 400
     
-    query = "UPDATE commands SET status = %s, result = %s, executed_at = NOW() WHERE id = %s"
-    db.execute_update(query, (status, result, command_id))
+    # 只接受待执行或已领取的命令，同步更新所属批量任务的状态计数
+    # 超过阈值的结果压缩后存入文件，表中只保留预览
+    outcome = record_result(
+        db, command_id, status, result, datetime.datetime.now(), data.get('claim_token'),
+        app.config['COMMAND_OUTPUT_MAX'],
+        lambda text: spill_result(blobs, text, app.config['COMMAND_RESULT_INLINE_MAX'],
+                                  app.config['COMMAND_RESULT_PREVIEW']),
+        lambda digest: discard_result(db, blobs, digest)
+    )
+    if outcome == 'not_found':
+        return jsonify({'status': 'error', 'message': 'Command not found'}), 404
+    if outcome == 'conflict':
+        return jsonify({'status': 'error', 'message': 'Command already finished or reclaimed'}), 409
     
     return jsonify({'status': 'ok'}), 200
 
+# 辅助函数：解析下发请求中的命令
+def _command_from_request(data):
+    """返回(command_type, command_content)；指定preset_id时从预设目录缓存中查找shell命令，不存在时抛出LookupError"""
+    preset_id = data.get('preset_id')
+    if preset_id is None:
+        return data.get('command_type'), data.get('command_content')
+    try:
+        preset = presets.get(int(preset_id))
+    except (TypeError, ValueError):
+        preset = None
+    if preset is None:
+        raise LookupError(preset_id)
+    return 'shell', preset['command']
+
 # 路由：下发命令
 @app.route('/api/commands', methods=['POST'])
 def send_command():
     data = request.json
     client_id = data.get('client_id')
-    command_type = data.get('command_type')
-    command_content = data.get('command_content')
+    try:
+        command_type, command_content = _command_from_request(data)
+    except LookupError:
+        return jsonify({'status': 'error', 'message': 'Preset command not found'}), 404
     
     if not all([client_id, command_type, command_content]):
         return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
     
-    if command_type not in ['shell', 'script_update', 'file_operation']:
+    if command_type not in COMMAND_TYPES:
         return jsonify({'status': 'error', 'message': 'Invalid command type'}), 400
     
+    try:
+        client_id = int(client_id)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid client_id'}), 400
+    
     query = "INSERT INTO commands (client_id, command_type, command_content, status) VALUES (%s, %s, %s, 'pending')"
-    db.execute_update(query, (client_id, command_type, command_content))
+    command_id = db.execute_insert(query, (client_id, command_type, command_content))
+    
+    # 唤醒等待中的长轮询请求
+    if command_id:
+        command_notifier.notify(client_id)
+    
+    return jsonify({'status': 'ok', 'command_id': command_id}), 201
+
+# 辅助函数：解析批量下发的目标客户端
+def _resolve_targets(data):
+    """根据client_ids列表或selector（online、hostname通配符）返回存在的客户端ID列表，参数不合法时抛出ValueError"""
+    client_ids = data.get('client_ids')
+    selector = data.get('selector')
+    
+    if client_ids is not None:
+        if not isinstance(client_ids, list) or not client_ids:
+            raise ValueError('Invalid client_ids')
+        requested = sorted({int(client_id) for client_id in client_ids})
+        # 只保留存在的客户端，按块查询避免参数过多
+        existing = []
+        for start in range(0, len(requested), 500):
+            chunk = requested[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            rows = db.execute_query(f"SELECT id FROM clients WHERE id IN ({placeholders})", chunk) or []
+            existing.extend(row['id'] for row in rows)
+        return existing
+    
+    if not isinstance(selector, dict) or not selector:
+        raise ValueError('Missing client_ids or selector')
+    
+    hostname = selector.get('hostname')
+    if hostname is not None:
+        rows = db.execute_query("SELECT id FROM clients WHERE hostname LIKE %s ESCAPE '!'",
+                                (hostname_pattern(str(hostname)),)) or []
+        targets = [row['id'] for row in rows]
+    else:
+        targets = None
+    
+    if selector.get('online'):
+        online = presence.online_clients()
+        if targets is not None:
+            online = set(online)
+            targets = [client_id for client_id in targets if client_id in online]
+        else:
+            targets = online
+    
+    if targets is None:
+        raise ValueError('Invalid selector')
+    return sorted(targets)
+
+# 路由：批量下发命令（一个任务，所有命令一次写入）
+@app.route('/api/commands/batch', methods=['POST'])
+def send_command_batch():
+    data = request.json
+    try:
+        command_type, command_content = _command_from_request(data)
+    except LookupError:
+        return jsonify({'status': 'error', 'message': 'Preset command not found'}), 404
+    
+    if not all([command_type, command_content]):
+        return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
+    
+    if command_type not in COMMAND_TYPES:
+        return jsonify({'status': 'error', 'message': 'Invalid command type'}), 400
     
-    return jsonify({'status': 'ok', 'command_id': db.cursor.lastrowid}), 201
+    try:
+        client_ids = _resolve_targets(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    if not client_ids:
+        return jsonify({'status': 'error', 'message': 'No matching clients'}), 404
+    
+    if len(client_ids) > app.config['COMMAND_BATCH_MAX']:
+        return jsonify({'status': 'error', 'message': 'Too many clients'}), 413
+    
+    selector = app.json.dumps(data['selector']) if data.get('client_ids') is None else None
+    job_id, inserted = create_job(db, command_type, command_content, client_ids, selector)
+    if not job_id or not inserted:
+        return jsonify({'status': 'error', 'message': 'Failed to create job'}), 500
+    
+    # 唤醒各客户端等待中的长轮询请求
+    for client_id in client_ids:
+        command_notifier.notify(client_id)
+    
+    return jsonify({'status': 'ok', 'job_id': job_id, 'total_count': inserted}), 201
+
+# 路由：获取批量任务进度（读取增量维护的计数，不扫描命令表）
+@app.route('/api/commands/jobs/<int:job_id>', methods=['GET'])
+def get_command_job(job_id):
+    job = db.execute_query("SELECT * FROM command_jobs WHERE id = %s", (job_id,))
+    
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    
+    return jsonify({'status': 'ok', 'job': job[0]}), 200
+
+# 路由：查询命令历史（按客户端、状态、类型、任务和时间范围过滤，aggregate=job|client时按状态汇总）
+@app.route('/api/commands', methods=['GET'])
+def get_commands():
+    args = request.args
+    try:
+        start, end = args.get('start'), args.get('end')
+        start = parse_timestamp(_numeric_arg(start)) if start else None
+        end = parse_timestamp(_numeric_arg(end)) if end else None
+        conditions, params = build_filters(args.get('client_id'), args.get('status'), args.get('command_type'),
+                                           args.get('job_id'), start, end)
+    except (TypeError, ValueError, OverflowError, OSError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    aggregate = args.get('aggregate')
+    if aggregate:
+        if aggregate not in ('job', 'client'):
+            return jsonify({'status': 'error', 'message': 'Invalid aggregate'}), 400
+        try:
+            _, limit, after = parse_page_args(HISTORY_FIELDS)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if aggregate == 'job' and not any(args.get(name) for name in ('client_id', 'status', 'command_type')):
+            # 只按任务或时间过滤时直接读取任务表中增量维护的计数
+            groups = job_counts(db, args.get('job_id'), start, end, limit, after)
+        else:
+            groups = aggregate_history(db, aggregate, conditions, params, limit, after)
+        if groups is None:
+            return jsonify({'status': 'error', 'message': 'Query failed'}), 500
+        if aggregate == 'client' and groups:
+            client_ids = [group['client_id'] for group in groups]
+            hostnames = {}
+            for offset in range(0, len(client_ids), 500):
+                chunk = client_ids[offset:offset + 500]
+                rows = db.execute_query(
+                    f"SELECT id, hostname FROM clients WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk) or []
+                hostnames.update((row['id'], row['hostname']) for row in rows)
+            for group in groups:
+                group['hostname'] = hostnames.get(group['client_id'])
+        # 两种汇总都按分组键倒序分页，本页已满时返回下一页游标
+        key = 'job_id' if aggregate == 'job' else 'client_id'
+        cursor = (encode_cursor(groups[-1][key]) if len(groups) >= limit and groups[-1][key] is not None
+                  else None)
+        return jsonify({'status': 'ok', 'aggregate': aggregate, 'groups': groups, 'next_cursor': cursor}), 200
+    
+    try:
+        columns, limit, after = parse_page_args(HISTORY_FIELDS, time_cursor=True)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    commands = query_history(db, columns, conditions, params, limit, after)
+    if commands is None:
+        return jsonify({'status': 'error', 'message': 'Query failed'}), 500
+    
+    return jsonify({'status': 'ok', 'commands': commands,
+                    'next_cursor': next_cursor(commands, limit, 'created_at')}), 200
+
+# 路由：获取命令详情（执行中的命令可查看已上报的输出）
+@app.route('/api/commands/<int:command_id>', methods=['GET'])
+def get_command(command_id):
+    command = db.execute_query("SELECT * FROM commands WHERE id = %s", (command_id,))
+    
+    if not command:
+        return jsonify({'status': 'error', 'message': 'Command not found'}), 404
+    
+    return jsonify({'status': 'ok', 'command': command[0]}), 200
+
+# 路由：获取命令的完整执行结果（存入文件的结果按块流式返回）
+@app.route('/api/commands/<int:command_id>/result', methods=['GET'])
+def get_command_result(command_id):
+    command = db.execute_query("SELECT result, result_blob FROM commands WHERE id = %s", (command_id,))
+    
+    if not command:
+        return jsonify({'status': 'error', 'message': 'Command not found'}), 404
+    
+    digest = command[0]['result_blob']
+    if not digest:
+        return Response(command[0]['result'] or '', mimetype='text/plain')
+    
+    # 接受gzip的客户端直接返回压缩内容，否则边读边解压
+    accept_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    f = blobs.open(digest, decompress=not accept_gzip)
+    if f is None:
+        return jsonify({'status': 'error', 'message': 'Result file not found'}), 404
+    
+    response = Response(iter_file(f), mimetype='text/plain')
+    if accept_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Length'] = str(blobs.size(digest))
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
-# 路由：获取预设命令
+# 路由：获取预设命令（带版本号，If-None-Match或version参数与当前版本一致时返回304）
 @app.route('/api/preset_commands', methods=['GET'])
 def get_preset_commands():
-    query = "SELECT * FROM preset_commands ORDER BY id ASC"
-    preset_commands = db.execute_query(query)
-    
-    return jsonify({'status': 'ok', 'preset_commands': preset_commands}), 200
+    version, preset_commands = presets.snapshot()
+    if version is None:
+        return jsonify({'status': 'error', 'message': 'Query failed'}), 500
+    
+    response = not_modified(version)
+    if response:
+        return response
+    if request.args.get('version') == version:
+        response = app.response_class(status=304)
+        response.set_etag(version)
+        return response
+    
+    return json_with_etag({'status': 'ok', 'version': version, 'preset_commands': preset_commands}, version), 200
+
+# 辅助函数：校验预设命令字段
+def _preset_values(data, required):
+    """返回要写入的预设命令字段，缺少必填字段或类型不合法时抛出ValueError"""
+    values = {field: data[field] for field in PRESET_FIELDS if data.get(field) is not None}
+    if required and not all(values.get(field) for field in ('name', 'command')):
+        raise ValueError('Missing required fields')
+    if not values or not all(isinstance(value, str) for value in values.values()):
+        raise ValueError('Invalid fields')
+    return values
+
+# 路由：新增预设命令
+@app.route('/api/preset_commands', methods=['POST'])
+def create_preset_command():
+    try:
+        values = _preset_values(request.json, required=True)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    preset_id = presets.create(values)
+    if not preset_id:
+        return jsonify({'status': 'error', 'message': 'Failed to create preset command'}), 500
+    
+    return jsonify({'status': 'ok', 'id': preset_id, 'version': presets.version()}), 201
+
+# 路由：修改预设命令
+@app.route('/api/preset_commands/<int:preset_id>', methods=['PUT'])
+def update_preset_command(preset_id):
+    try:
+        values = _preset_values(request.json, required=False)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    found = presets.update(preset_id, values)
+    if found is None:
+        return jsonify({'status': 'error', 'message': 'Failed to update preset command'}), 500
+    if not found:
+        return jsonify({'status': 'error', 'message': 'Preset command not found'}), 404
+    
+    return jsonify({'status': 'ok', 'version': presets.version()}), 200
+
+# 路由：删除预设命令
+@app.route('/api/preset_commands/<int:preset_id>', methods=['DELETE'])
+def delete_preset_command(preset_id):
+    found = presets.delete(preset_id)
+    if found is None:
+        return jsonify({'status': 'error', 'message': 'Failed to delete preset command'}), 500
+    if not found:
+        return jsonify({'status': 'error', 'message': 'Preset command not found'}), 404
+    
+    return jsonify({'status': 'ok', 'version': presets.version()}), 200
 
 # 路由：获取在线客户端统计
 @app.route('/api/clients/stats', methods=['GET'])
 def get_client_stats():
-    # 更新所有客户端状态
-    update_query = "UPDATE clients SET status = 'offline' WHERE TIMESTAMPDIFF(SECOND, last_heartbeat, NOW()) > %s"
-    db.execute_update(update_query, (app.config['HEARTBEAT_TIMEOUT'],))
-    
-    # 获取在线和离线客户端数量
-    online_query = "SELECT COUNT(*) as online_count FROM clients WHERE status = 'online'"
-    offline_query = "SELECT COUNT(*) as offline_count FROM clients WHERE status = 'offline'"
-    
-    online_count = db.execute_query(online_query)[0]['online_count']
-    offline_count = db.execute_query(offline_query)[0]['offline_count']
+    # 从注册表获取在线和离线客户端数量（只读，状态变化由注册表的写回线程持久化）
+    online_count, offline_count = presence.stats()
     
     return jsonify({'status': 'ok', 'online_count': online_count, 'offline_count': offline_count}), 200
 
+# 路由：事件流（Server-Sent Events）
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    # 浏览器断线重连时通过Last-Event-ID补发错过的事件
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    subscriber = events.subscribe(last_event_id)
+    response = Response(events.stream(subscriber, app.config['EVENTS_KEEPALIVE'], app.json.dumps),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁止Nginx缓冲事件流
+    return response
+
+# 路由：获取最近一次数据清理报告
+@app.route('/api/maintenance/retention', methods=['GET'])
+def get_retention_report():
+    return jsonify({'status': 'ok', 'report': retention.last_report}), 200
+
 # 主函数
 if __name__ == '__main__':
     app.run(host=app.config['SERVER_HOST'], port=app.config['SERVER_PORT'], debug=app.config['DEBUG'])
@@ -0,0 +1,144 @@
+# 内容寻址文件存储模块
+
+import os
+import re
+import gzip
+import time
+import hashlib
+import tempfile
+
+class BlobStore:
+    """内容寻址文件存储：按内容的SHA-256摘要存放文件，相同内容只存一份
+
+    文件按摘要前缀分depth级目录存放（每级两位十六进制，如root/ab/cd/摘要），单个目录内的文件数有界；
+    先写临时文件再原子重命名，读者不会看到写了一半的文件。
+    """
+
+    _digest_pattern = re.compile(r'^[0-9a-f]{64}$')
+
+    def __init__(self, root, depth=1):
+        self.root = os.path.abspath(root)
+        self.depth = depth
+
+    def relative_path(self, digest):
+        """返回摘要对应的相对路径，摘要格式不合法时返回None"""
+        if not digest or not self._digest_pattern.match(digest):
+            return None
+        return os.path.join(*[digest[level * 2:level * 2 + 2] for level in range(self.depth)], digest)
+
+    def path(self, digest):
+        """返回摘要对应的文件路径，摘要格式不合法时返回None"""
+        relative_path = self.relative_path(digest)
+        return os.path.join(self.root, relative_path) if relative_path else None
+
+    def put(self, data):
+        """写入一段内容，返回其摘要；内容已存在时只刷新修改时间"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            # 刷新修改时间，避免刚被重新引用的文件被回收
+            os.utime(path, None)
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return digest
+
+    def adopt(self, temp_path, digest):
+        """把已写好的临时文件（须与root在同一文件系统）原子移动为摘要对应的文件，返回文件路径
+
+        内容已存在时删除临时文件并刷新已有文件的修改时间
+        """
+        path = self.path(digest)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            os.utime(path, None)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path
+
+    def open(self, digest, decompress=False):
+        """以二进制只读方式打开文件，decompress为True时按gzip解压读取；不存在时返回None"""
+        path = self.path(digest)
+        if path is None:
+            return None
+        try:
+            return gzip.open(path, 'rb') if decompress else open(path, 'rb')
+        except OSError:
+            return None
+
+    def size(self, digest):
+        """返回文件大小，不存在时返回None"""
+        path = self.path(digest)
+        try:
+            return os.path.getsize(path) if path else None
+        except OSError:
+            return None
+
+    def delete(self, digest):
+        """删除文件，返回释放的字节数"""
+        path = self.path(digest)
+        if path is None:
+            return 0
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def delete_if_idle(self, digest, min_age, now=None):
+        """文件超过min_age秒未修改时删除（并发写入相同内容会刷新修改时间），返回释放的字节数"""
+        path = self.path(digest)
+        now = now if now is not None else time.time()
+        try:
+            if path is None or now - os.path.getmtime(path) < min_age:
+                return 0
+        except OSError:
+            return 0
+        return self.delete(digest)
+
+    def collect(self, referenced, min_age=3600, now=None):
+        """删除不在referenced中且超过min_age秒未修改的文件，返回(删除的文件数, 释放的字节数)"""
+        now = now if now is not None else time.time()
+        files = freed = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if name in referenced or now - stat.st_mtime < min_age:
+                    continue
+                # 包括中断写入残留的临时文件
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                files += 1
+                freed += stat.st_size
+        return files, freed
+
+def iter_file(f, chunk_size=64 * 1024):
+    """按块读取文件对象，读完后关闭"""
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
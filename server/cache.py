@@ -0,0 +1,53 @@
+# 进程内缓存模块
+
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """线程安全的有界LRU缓存"""
+
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """读取缓存项，命中时将其移到最近使用的位置"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入缓存项，超出容量时淘汰最久未使用的项"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """删除缓存项"""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """返回缓存指标"""
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self._maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,134 @@
+# 命令历史查询模块
+
+from server.commands import COMMAND_TYPES
+
+# 命令状态
+COMMAND_STATUSES = ('pending', 'dispatched', 'executed', 'failed')
+
+# 历史列表可投影的列（完整结果通过结果接口读取）
+HISTORY_FIELDS = ('id', 'client_id', 'job_id', 'command_type', 'command_content', 'status', 'attempts',
+                  'output_size', 'result_size', 'created_at', 'executed_at')
+
+# 聚合维度 -> 分组列
+AGGREGATE_KEYS = {'job': 'job_id', 'client': 'client_id'}
+
+def build_filters(client_id=None, status=None, command_type=None, job_id=None, start=None, end=None):
+    """将过滤条件转换为(WHERE子句列表, 参数列表)，条件不合法时抛出ValueError
+
+    等值条件与created_at范围组合，可使用(client_id, status, created_at)、(status, created_at)、
+    (command_type, created_at)、(job_id, created_at)和(created_at)索引。
+    """
+    conditions, params = [], []
+    if client_id is not None:
+        conditions.append('client_id = %s')
+        params.append(int(client_id))
+    if status is not None:
+        if status not in COMMAND_STATUSES:
+            raise ValueError('Invalid status')
+        conditions.append('status = %s')
+        params.append(status)
+    if command_type is not None:
+        if command_type not in COMMAND_TYPES:
+            raise ValueError('Invalid command_type')
+        conditions.append('command_type = %s')
+        params.append(command_type)
+    if job_id is not None:
+        conditions.append('job_id = %s')
+        params.append(int(job_id))
+    if start is not None:
+        conditions.append('created_at >= %s')
+        params.append(start)
+    if end is not None:
+        conditions.append('created_at < %s')
+        params.append(end)
+    if start is not None and end is not None and start >= end:
+        raise ValueError('Invalid time range')
+    return conditions, params
+
+def query_history(database, columns, conditions, params, limit, after=None):
+    """按创建时间倒序分页查询命令，after为上一页最后一行的(created_at, id)
+
+    以(created_at, id)为键集分页，翻页代价与页码无关；查询失败时返回None
+    """
+    conditions, params = list(conditions), list(params)
+    if after is not None:
+        created_at, command_id = after
+        conditions.append('(created_at < %s OR (created_at = %s AND id < %s))')
+        params.extend([created_at, created_at, command_id])
+    columns = list(columns)
+    if 'created_at' not in columns:
+        columns.append('created_at')
+
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+    query = (f"SELECT {', '.join(columns)} FROM commands {where}"
+             f"ORDER BY created_at DESC, id DESC LIMIT %s")
+    return database.execute_query(query, params + [limit])
+
+def aggregate_history(database, by, conditions, params, limit, after=None):
+    """按任务或客户端统计各状态的命令数，返回[{job_id或client_id, counts, total}]；查询失败时返回None
+
+    按分组键倒序每页最多limit组，after为上一页最后一组的键；不属于任何任务的命令（键为NULL）汇总在最后一页
+    """
+    key = AGGREGATE_KEYS[by]
+    key_conditions, key_params = list(conditions) + [f'{key} IS NOT NULL'], list(params)
+    if after is not None:
+        key_conditions.append(f'{key} < %s')
+        key_params.append(after)
+    rows = database.execute_query(
+        f"SELECT DISTINCT {key} FROM commands WHERE {' AND '.join(key_conditions)} ORDER BY {key} DESC LIMIT %s",
+        key_params + [limit])
+    if rows is None:
+        return None
+
+    keys = [row[key] for row in rows]
+    selected, selected_params = [], []
+    if keys:
+        selected.append(f"{key} IN ({', '.join(['%s'] * len(keys))})")
+        selected_params.extend(keys)
+    if len(keys) < limit:
+        selected.append(f'{key} IS NULL')
+    if not selected:
+        return []
+    where = ' AND '.join(list(conditions) + [f"({' OR '.join(selected)})"])
+    rows = database.execute_query(
+        f"SELECT {key}, status, COUNT(*) AS count FROM commands WHERE {where} GROUP BY {key}, status",
+        list(params) + selected_params)
+    if rows is None:
+        return None
+
+    groups = {}
+    for row in rows:
+        group = groups.setdefault(row[key], {key: row[key], 'counts': dict.fromkeys(COMMAND_STATUSES, 0), 'total': 0})
+        group['counts'][row['status']] = row['count']
+        group['total'] += row['count']
+    return sorted(groups.values(), key=lambda group: (group[key] is None, -(group[key] or 0)))
+
+def job_counts(database, job_id=None, start=None, end=None, limit=1000, after=None):
+    """读取任务表中增量维护的状态计数（不扫描命令表），按任务ID倒序每页最多limit个任务，
+    after为上一页最后一个任务ID；查询失败时返回None
+    """
+    conditions, params = [], []
+    if job_id is not None:
+        conditions.append('id = %s')
+        params.append(int(job_id))
+    if start is not None:
+        conditions.append('created_at >= %s')
+        params.append(start)
+    if end is not None:
+        conditions.append('created_at < %s')
+        params.append(end)
+    if after is not None:
+        conditions.append('id < %s')
+        params.append(after)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+    rows = database.execute_query(
+        f"SELECT * FROM command_jobs {where}ORDER BY id DESC LIMIT %s", params + [limit])
+    if rows is None:
+        return None
+    return [{
+        'job_id': row['id'],
+        'command_type': row['command_type'],
+        'created_at': row['created_at'],
+        'counts': {status: row[f'{status}_count'] for status in COMMAND_STATUSES},
+        'total': row['total_count']
+    } for row in rows]
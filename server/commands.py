@@ -0,0 +1,338 @@
+# 命令下发通知模块
+
+import gzip
+import time
+import uuid
+import datetime
+import threading
+
+class CommandNotifier:
+    """按客户端的命令到达通知：长轮询请求在内存中等待，下发命令时唤醒对应客户端
+
+    每个客户端维护一个递增的代数，下发命令时加一；查询到没有待执行命令时记录当时的代数，
+    代数未变化且记录未过期期间无需再查询数据库。
+    """
+
+    def __init__(self, hint_ttl=300):
+        self._hint_ttl = hint_ttl
+        self._lock = threading.Lock()
+        self._waiters = {}  # client_id -> [Condition（共享同一把锁）, 等待中的请求数]
+        self._generations = {}  # client_id -> 代数
+        self._empty = {}  # client_id -> (查询为空时的代数, 查询时间)
+
+    def generation(self, client_id):
+        """返回客户端当前的代数，应在查询数据库之前获取"""
+        with self._lock:
+            return self._generations.get(client_id, 0)
+
+    def may_have_pending(self, client_id):
+        """判断客户端是否可能有待执行命令（需要查询数据库）"""
+        with self._lock:
+            empty = self._empty.get(client_id)
+            if empty is None:
+                return True
+            generation, checked_at = empty
+            return generation != self._generations.get(client_id, 0) or time.monotonic() - checked_at > self._hint_ttl
+
+    def mark_empty(self, client_id, generation):
+        """记录查询时（代数为generation）客户端没有待执行命令"""
+        with self._lock:
+            if generation == self._generations.get(client_id, 0):
+                self._empty[client_id] = (generation, time.monotonic())
+
+    def notify(self, client_id):
+        """客户端有新的待执行命令：递增代数并唤醒等待中的请求"""
+        with self._lock:
+            self._generations[client_id] = self._generations.get(client_id, 0) + 1
+            waiters = self._waiters.get(client_id)
+            if waiters is not None:
+                waiters[0].notify_all()
+
+    def wait(self, client_id, generation, timeout):
+        """等待客户端代数变化或超时，返回代数是否已变化"""
+        with self._lock:
+            waiters = self._waiters.get(client_id)
+            if waiters is None:
+                waiters = self._waiters[client_id] = [threading.Condition(self._lock), 0]
+            waiters[1] += 1
+            try:
+                return waiters[0].wait_for(lambda: self._generations.get(client_id, 0) != generation, timeout)
+            finally:
+                # 没有其他等待者时释放条件变量
+                waiters[1] -= 1
+                if not waiters[1]:
+                    del self._waiters[client_id]
+
+# 支持的命令类型
+COMMAND_TYPES = ('shell', 'script_update', 'file_operation')
+
+# 命令结束状态
+FINAL_STATUSES = ('executed', 'failed')
+
+def hostname_pattern(pattern):
+    """将通配符主机名模式（*和?）转换为LIKE模式，转义字符为!"""
+    escaped = pattern.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return escaped.replace('*', '%').replace('?', '_')
+
+def create_job(database, command_type, command_content, client_ids, selector=None):
+    """在一个事务中创建命令任务并用多行INSERT为每个客户端写入一条命令，返回(任务ID, 写入的命令数)；
+    写入失败时整个任务回滚，返回(None, 0)
+    """
+    def write(tx):
+        job_id = tx.execute_insert(
+            "INSERT INTO command_jobs (command_type, command_content, selector, total_count, pending_count) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            (command_type, command_content, selector, len(client_ids), len(client_ids))
+        )
+        rows = [(client_id, command_type, command_content, 'pending', job_id) for client_id in client_ids]
+        tx.insert_rows('commands', ('client_id', 'command_type', 'command_content', 'status', 'job_id'), rows)
+        return job_id
+
+    job_id = database.transaction(write)
+    if not job_id:
+        return None, 0
+    return job_id, len(client_ids)
+
+def _shift_job_counts(database, job_counts, previous, status):
+    """按任务调整状态计数：job_counts为任务ID到从previous变为status的命令数的映射"""
+    for job_id, count in job_counts.items():
+        database.execute_update(
+            f"UPDATE command_jobs SET {previous}_count = {previous}_count - %s, "
+            f"{status}_count = {status}_count + %s WHERE id = %s",
+            (count, count, job_id)
+        )
+
+def _count_by_job(commands):
+    """统计属于各任务的命令数"""
+    job_counts = {}
+    for command in commands:
+        if command['job_id']:
+            job_counts[command['job_id']] = job_counts.get(command['job_id'], 0) + 1
+    return job_counts
+
+def claim_commands(database, client_id, lease_seconds):
+    """用一条UPDATE将客户端的待执行命令原子地标记为已领取并设置租约，返回领取到的命令
+
+    重新领取的命令清空上一次领取上报的输出，输出偏移从0开始。
+    """
+    claim_token = uuid.uuid4().hex
+    lease_expires_at = datetime.datetime.now() + datetime.timedelta(seconds=lease_seconds)
+    claimed = database.execute_update(
+        "UPDATE commands SET status = 'dispatched', claim_token = %s, lease_expires_at = %s, attempts = attempts + 1, "
+        "result = NULL, output_size = 0 WHERE client_id = %s AND status = 'pending'",
+        (claim_token, lease_expires_at, client_id)
+    )
+    if not claimed:
+        return []
+
+    # 查询失败时已领取的命令在租约到期后重新排队
+    commands = database.execute_query(
+        "SELECT * FROM commands WHERE client_id = %s AND claim_token = %s ORDER BY created_at ASC",
+        (client_id, claim_token)
+    ) or []
+    _shift_job_counts(database, _count_by_job(commands), 'pending', 'dispatched')
+    return commands
+
+def renew_lease(database, command_id, claim_token, lease_seconds):
+    """延长已领取命令的租约，租约已失效（重新排队或已结束）时返回False"""
+    lease_expires_at = datetime.datetime.now() + datetime.timedelta(seconds=lease_seconds)
+    return bool(database.execute_update(
+        "UPDATE commands SET lease_expires_at = %s WHERE id = %s AND status = 'dispatched' AND claim_token = %s",
+        (lease_expires_at, command_id, claim_token)
+    ))
+
+def append_output(database, command_id, claim_token, offset, data, max_length):
+    """追加执行中命令的一段输出，result只保留最后max_length个字符，output_size记录已接收的总字符数
+
+    offset必须等于已接收的字符数，重发已接收过的片段不会重复写入。
+    返回(结果, 已接收的字符数)，结果为'appended'、'mismatch'（偏移不一致）、'not_found'或'conflict'
+    """
+    updated = database.execute_update(
+        f"UPDATE commands SET result = {database.append_tail('result', max_length)}, output_size = output_size + %s "
+        "WHERE id = %s AND status = 'dispatched' AND claim_token = %s AND output_size = %s",
+        (data, len(data), command_id, claim_token, offset)
+    )
+    rows = database.execute_query("SELECT status, claim_token, output_size FROM commands WHERE id = %s",
+                                  (command_id,))
+    if not rows:
+        return 'not_found', 0
+    output_size = rows[0]['output_size']
+    if updated:
+        return 'appended', output_size
+    if rows[0]['status'] != 'dispatched' or rows[0]['claim_token'] != claim_token:
+        return 'conflict', output_size
+    return 'mismatch', output_size
+
+def spill_result(blobs, text, inline_max, preview_size):
+    """结果超过inline_max字节时gzip压缩后存入内容寻址存储
+
+    返回写入commands表的(result, result_blob, result_size)：存入文件时result只保留开头的预览，
+    result_size为结果的字节数；写入文件失败时退回只在表中保存预览。
+    """
+    data = text.encode('utf-8')
+    if blobs is None or len(data) <= inline_max:
+        return text, None, None
+    try:
+        # mtime固定为0，相同结果压缩后的内容相同，只存一份
+        digest = blobs.put(gzip.compress(data, mtime=0))
+    except OSError as e:
+        print(f"命令结果写入文件失败: {e}")
+        return text[:preview_size], None, len(data)
+    return text[:preview_size], digest, len(data)
+
+def discard_result(database, blobs, digest):
+    """删除没有命令引用的结果文件（结果写入文件后更新未生效时调用），返回释放的字节数"""
+    if blobs is None or not digest:
+        return 0
+    rows = database.execute_query("SELECT id FROM commands WHERE result_blob = %s LIMIT 1", (digest,))
+    if rows is None or rows:
+        # 相同内容的结果已被其他命令引用，或查询失败时交给保留期任务回收
+        return 0
+    return blobs.delete(digest)
+
+def record_result(database, command_id, status, result, executed_at, claim_token=None, max_length=None, store=None,
+                  discard=None):
+    """写入命令执行结果并同步更新所属任务的状态计数
+
+    只接受待执行或已领取的命令；提供claim_token时必须与当前领取一致（租约到期重新排队后迟到的结果被拒绝）。
+    已增量上报过输出的命令，结果追加在输出之后；max_length限制保留的结果字符数。
+    store(text)返回实际写入的(result, result_blob, result_size)，用于将大结果存入文件；
+    写入的文件最终没有被采用时调用discard(result_blob)。
+    返回'recorded'、'not_found'或'conflict'（命令已结束或已被重新领取）
+    """
+    result = result or ''
+    token_condition = " AND claim_token = %s" if claim_token else ""
+    spilled_text = spilled = None
+    applied = False
+
+    try:
+        # 以原状态为条件更新，并发写入同一命令的结果时只有一次会调整任务计数；条件不满足时重读状态重试
+        for _ in range(3):
+            rows = database.execute_query(
+                "SELECT status, job_id, claim_token, output_size, result FROM commands WHERE id = %s", (command_id,))
+            if not rows:
+                return 'not_found'
+            previous, job_id, output_size = rows[0]['status'], rows[0]['job_id'], rows[0]['output_size']
+
+            if previous in FINAL_STATUSES:
+                # 同一领取重复提交结果（如响应丢失后重试）视为成功
+                return 'recorded' if claim_token and rows[0]['claim_token'] == claim_token else 'conflict'
+            if claim_token and rows[0]['claim_token'] != claim_token:
+                # 已被回收重新排队（claim_token已清空）或已被重新领取
+                return 'conflict'
+
+            text = (rows[0]['result'] or '') + result if output_size else result
+            if max_length and len(text) > max_length:
+                text = text[-max_length:]
+            if store is None:
+                stored = (text, None, None)
+            else:
+                # 只在结果内容变化（重试期间又追加了输出）时重新写入文件
+                if text != spilled_text:
+                    if spilled and discard:
+                        discard(spilled[1])
+                    spilled_text, spilled = text, store(text)
+                stored = spilled
+
+            # 以输出长度为条件，读取后又追加的输出不会被覆盖
+            updated = database.execute_update(
+                "UPDATE commands SET status = %s, result = %s, result_blob = %s, result_size = %s, executed_at = %s, "
+                "lease_expires_at = NULL WHERE id = %s AND status = %s AND output_size = %s" + token_condition,
+                (status,) + tuple(stored) + (executed_at, command_id, previous, output_size) +
+                ((claim_token,) if claim_token else ())
+            )
+            if updated:
+                applied = True
+                if job_id:
+                    _shift_job_counts(database, {job_id: 1}, previous, status)
+                return 'recorded'
+        return 'conflict'
+    finally:
+        if not applied and spilled and discard:
+            discard(spilled[1])
+
+class LeaseReaper:
+    """后台租约回收任务：租约到期的已领取命令重新排队，超过最大尝试次数的标记为失败"""
+
+    def __init__(self, database, app_config, notifier=None):
+        self._db = database
+        self._interval = app_config['COMMAND_REAP_INTERVAL']
+        self._max_attempts = app_config['COMMAND_MAX_ATTEMPTS']
+        self._batch_size = app_config['RETENTION_BATCH_SIZE']
+        self._notifier = notifier
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        """回收一轮到期租约，返回(重新排队数, 标记失败数)"""
+        now = now or datetime.datetime.now()
+        requeued = failed = 0
+        while True:
+            # 走(status, lease_expires_at)索引
+            rows = self._db.execute_query(
+                "SELECT id, client_id, job_id, attempts FROM commands "
+                "WHERE status = 'dispatched' AND lease_expires_at < %s ORDER BY lease_expires_at ASC LIMIT %s",
+                (now, self._batch_size)
+            )
+            if not rows:
+                break
+
+            requeued_jobs, failed_jobs, clients = {}, {}, set()
+            batch_updated = 0
+            for row in rows:
+                # 逐行以状态和租约为条件更新，与结果提交、续约并发时不会重复计数
+                if row['attempts'] >= self._max_attempts:
+                    updated = self._db.execute_update(
+                        "UPDATE commands SET status = 'failed', result = %s, executed_at = %s, claim_token = NULL, "
+                        "lease_expires_at = NULL WHERE id = %s AND status = 'dispatched' AND lease_expires_at < %s",
+                        (f"Lease expired after {row['attempts']} attempts", now, row['id'], now)
+                    )
+                    failed += updated
+                    job_counts = failed_jobs
+                else:
+                    updated = self._db.execute_update(
+                        "UPDATE commands SET status = 'pending', claim_token = NULL, lease_expires_at = NULL "
+                        "WHERE id = %s AND status = 'dispatched' AND lease_expires_at < %s",
+                        (row['id'], now)
+                    )
+                    requeued += updated
+                    job_counts = requeued_jobs
+                    if updated:
+                        clients.add(row['client_id'])
+                batch_updated += updated
+                if updated and row['job_id']:
+                    job_counts[row['job_id']] = job_counts.get(row['job_id'], 0) + 1
+
+            _shift_job_counts(self._db, requeued_jobs, 'dispatched', 'pending')
+            _shift_job_counts(self._db, failed_jobs, 'dispatched', 'failed')
+            if self._notifier:
+                for client_id in clients:
+                    self._notifier.notify(client_id)
+
+            # 本批没有任何更新（如数据库写入失败）时停止，避免反复读取同一批
+            if len(rows) < self._batch_size or not batch_updated:
+                break
+        return requeued, failed
+
+    def _run(self):
+        """后台回收循环"""
+        while not self._stop_event.wait(self._interval):
+            try:
+                requeued, failed = self.run_once()
+                if requeued or failed:
+                    print(f"命令租约回收: 重新排队{requeued}条，标记失败{failed}条")
+            except Exception as e:
+                print(f"命令租约回收错误: {e}")
+
+    def start(self):
+        """启动后台回收线程"""
+        if self._interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='lease_reaper')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台回收线程"""
+        self._stop_event.set()
@@ -1,6 +1,7 @@
 # 服务端配置文件
 
 import os
+import tempfile
 
 # 基础配置
 class Config:
@@ -8,11 +9,20 @@ class Config:
     DEBUG = os.environ.get('DEBUG', 'False').lower() in ('true', '1', 't')
     
     # 数据库配置
+    DB_ENGINE = os.environ.get('DB_ENGINE') or 'mysql'  # 存储后端：mysql 或 sqlite
     DB_HOST = os.environ.get('DB_HOST') or 'localhost'
     DB_PORT = int(os.environ.get('DB_PORT') or 3306)
     DB_USER = os.environ.get('DB_USER') or 'root'
     DB_PASSWORD = os.environ.get('DB_PASSWORD') or 'password'
     DB_NAME = os.environ.get('DB_NAME') or 'inspection_system'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)  # 连接池最大连接数
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 5)  # 等待空闲连接的超时时间（秒）
+    DB_POOL_IDLE_CHECK = float(os.environ.get('DB_POOL_IDLE_CHECK') or 30)  # 空闲超过该时间（秒）的连接借出前检查是否已被服务端断开
+    
+    # SQLite配置（DB_ENGINE=sqlite时生效，适用于无数据库服务器的单机部署）
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or 'inspection_system.db'
+    SQLITE_STATEMENT_CACHE = int(os.environ.get('SQLITE_STATEMENT_CACHE') or 256)  # 每个连接缓存的预编译语句数
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5)  # 写锁等待超时（秒）
     
     # 服务器配置
     SERVER_HOST = os.environ.get('SERVER_HOST') or '0.0.0.0'
@@ -21,9 +31,55 @@ class Config:
     # 截图存储配置
     SCREENSHOT_DIR = os.environ.get('SCREENSHOT_DIR') or 'screenshots'
     MAX_SCREENSHOT_SIZE = int(os.environ.get('MAX_SCREENSHOT_SIZE') or 10 * 1024 * 1024)  # 10MB
+    SCREENSHOT_INGEST_QUEUE = int(os.environ.get('SCREENSHOT_INGEST_QUEUE') or 1000)  # 等待写入的截图数上限，队列满时上传返回503
+    SCREENSHOT_INGEST_BATCH = int(os.environ.get('SCREENSHOT_INGEST_BATCH') or 100)  # 每批写入数据库的最大截图数
+    THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR') or 'thumbnails'
+    THUMBNAIL_CACHE_MAX = int(os.environ.get('THUMBNAIL_CACHE_MAX') or 512 * 1024 * 1024)  # 缩略图磁盘缓存上限（字节），超出时淘汰最久未访问的缩略图
+    THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY') or 80)  # 缩略图JPEG质量（1-95）
+    
+    # 内容寻址文件存储配置
+    BLOB_DIR = os.environ.get('BLOB_DIR') or 'blobs'
+    BLOB_GC_MIN_AGE = int(os.environ.get('BLOB_GC_MIN_AGE') or 3600)  # 未被引用的文件至少保留的时间（秒），避免删除刚写入尚未入库的文件
+    
+    # 列表分页配置
+    PAGE_DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT') or 100)  # 默认每页行数
+    PAGE_MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT') or 1000)  # 每页最大行数
+    
+    # 系统数据配置
+    SYSTEM_DATA_BATCH_MAX = int(os.environ.get('SYSTEM_DATA_BATCH_MAX') or 5000)  # 单次批量上传的最大采样数
+    SYSTEM_DATA_MAX_POINTS = int(os.environ.get('SYSTEM_DATA_MAX_POINTS') or 2000)  # 按时间范围查询时的最大数据点数
+    
+    # 数据保留配置（天数，0表示永久保留）
+    RETENTION_SYSTEM_DATA_DAYS = int(os.environ.get('RETENTION_SYSTEM_DATA_DAYS') or 0)
+    RETENTION_ROLLUP_1M_DAYS = int(os.environ.get('RETENTION_ROLLUP_1M_DAYS') or 0)
+    RETENTION_ROLLUP_5M_DAYS = int(os.environ.get('RETENTION_ROLLUP_5M_DAYS') or 0)
+    RETENTION_ROLLUP_1H_DAYS = int(os.environ.get('RETENTION_ROLLUP_1H_DAYS') or 0)
+    RETENTION_SCREENSHOTS_DAYS = int(os.environ.get('RETENTION_SCREENSHOTS_DAYS') or 0)
+    RETENTION_COMMANDS_DAYS = int(os.environ.get('RETENTION_COMMANDS_DAYS') or 0)
+    RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL') or 3600)  # 清理任务执行间隔（秒），0表示不启动
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE') or 1000)  # 每批删除的最大行数
     
     # 心跳配置
     HEARTBEAT_TIMEOUT = int(os.environ.get('HEARTBEAT_TIMEOUT') or 60)  # 60秒
+    PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL') or 5)  # 心跳批量写回数据库的间隔（秒）
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 10000)  # (hostname, ip, port) -> client_id缓存容量
+    
+    # 事件推送配置
+    EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE') or 15)  # 事件流空闲时发送保活注释的间隔（秒）
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE') or 1000)  # 每个订阅者积压事件的上限
+    EVENTS_HISTORY_SIZE = int(os.environ.get('EVENTS_HISTORY_SIZE') or 1000)  # 保留供断线重连补发的最近事件数
+    
+    # 命令下发配置
+    COMMAND_WAIT_MAX = float(os.environ.get('COMMAND_WAIT_MAX') or 30)  # 长轮询获取待执行命令的最长等待时间（秒）
+    COMMAND_BATCH_MAX = int(os.environ.get('COMMAND_BATCH_MAX') or 10000)  # 单次批量下发的最大客户端数
+    COMMAND_HINT_TTL = float(os.environ.get('COMMAND_HINT_TTL') or 300)  # “没有待执行命令”的内存记录有效期（秒），过期后重新查询数据库
+    COMMAND_LEASE_SECONDS = int(os.environ.get('COMMAND_LEASE_SECONDS') or 120)  # 领取命令的租约时长（秒），执行期间由客户端续约
+    COMMAND_REAP_INTERVAL = int(os.environ.get('COMMAND_REAP_INTERVAL') or 30)  # 回收到期租约的间隔（秒），0表示不启动
+    COMMAND_MAX_ATTEMPTS = int(os.environ.get('COMMAND_MAX_ATTEMPTS') or 3)  # 租约到期达到该次数后标记为失败，不再重新排队
+    COMMAND_OUTPUT_MAX = int(os.environ.get('COMMAND_OUTPUT_MAX') or 1000000)  # 每条命令保留的输出字符数，超出时只保留最新的部分
+    COMMAND_RESULT_INLINE_MAX = int(os.environ.get('COMMAND_RESULT_INLINE_MAX') or 64 * 1024)  # 超过该字节数的结果压缩后存入文件，表中只保留预览
+    COMMAND_RESULT_PREVIEW = int(os.environ.get('COMMAND_RESULT_PREVIEW') or 4096)  # 存入文件的结果在表中保留的预览字符数
+    PRESET_CACHE_TTL = int(os.environ.get('PRESET_CACHE_TTL') or 300)  # 预设命令目录缓存有效期（秒），直接修改数据库的变更在此时间后生效
     
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
@@ -41,6 +97,14 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     DB_NAME = 'inspection_system_test'
+    DB_ENGINE = os.environ.get('DB_ENGINE') or 'sqlite'
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or os.path.join(tempfile.gettempdir(), 'inspection_system_test.db')
+    SCREENSHOT_DIR = os.path.join(tempfile.gettempdir(), 'inspection_system_test', 'screenshots')
+    UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'inspection_system_test', 'uploads')
+    BLOB_DIR = os.path.join(tempfile.gettempdir(), 'inspection_system_test', 'blobs')
+    THUMBNAIL_DIR = os.path.join(tempfile.gettempdir(), 'inspection_system_test', 'thumbnails')
+    RETENTION_INTERVAL = 0
+    COMMAND_REAP_INTERVAL = 0
 
 # 配置映射
 config = {
@@ -49,3 +113,6 @@ config = {
     'testing': TestingConfig,
     'default': DevelopmentConfig
 }
+
+# 当前使用的配置名称
+CONFIG_NAME = os.environ.get('SERVER_CONFIG') or 'default'
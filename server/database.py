@@ -1,79 +1,617 @@
 # 数据库连接模块
 
-import mysql.connector
-from mysql.connector import Error
-from server.config import config
+import os
+import re
+import sqlite3
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from server.config import config, CONFIG_NAME
+
+# MySQL驱动为可选依赖，使用SQLite后端时无需安装
+try:
+    import mysql.connector
+    from mysql.connector import Error as MySQLError
+    MYSQL_AVAILABLE = True
+except ImportError:
+    MYSQL_AVAILABLE = False
+
+    class MySQLError(Exception):
+        pass
+
+# SQLite初始化脚本和升级脚本目录
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database_sqlite.sql')
+SQLITE_MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations', 'sqlite')
+
+class PoolTimeoutError(Exception):
+    """等待空闲连接超时"""
+    pass
+
+class ConnectionPool:
+    """有界连接池：按请求借出连接，用完归还，并记录等待时间等指标
+
+    空闲超过idle_check秒的连接借出前用validate(conn)检查，已被服务端断开（如超过wait_timeout）时关闭并换一个新连接。
+    """
+
+    def __init__(self, factory, size, timeout, validate=None, idle_check=30):
+        self._factory = factory
+        self._size = size
+        self._timeout = timeout
+        self._validate = validate
+        self._idle_check = idle_check
+        self._idle = []  # (连接, 归还时间)
+        self._created = 0
+        self._cond = threading.Condition()
+
+        # 连接池指标
+        self.checkout_count = 0
+        self.in_use_count = 0
+        self.timeout_count = 0
+        self.stale_count = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self):
+        """借出一个连接，连接池耗尽时最多等待timeout秒"""
+        start = time.monotonic()
+        deadline = start + self._timeout
+        conn = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._created < self._size:
+                    # 预占一个名额，在锁外创建连接
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeout_count += 1
+                    raise PoolTimeoutError(f'等待数据库连接超时（{self._timeout}秒）')
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - start
+            self.checkout_count += 1
+            self.in_use_count += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        if conn is not None and self._validate and time.monotonic() - idle_since > self._idle_check:
+            if not self._is_usable(conn):
+                # 失效的连接关闭后在同一名额上新建连接
+                with self._cond:
+                    self.stale_count += 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self.in_use_count -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def _is_usable(self, conn):
+        """检查空闲连接是否仍可用，检查本身出错也视为不可用"""
+        try:
+            return self._validate(conn)
+        except Exception:
+            return False
+
+    def release(self, conn, discard=False):
+        """归还连接，discard为True时关闭连接并释放名额"""
+        with self._cond:
+            self.in_use_count -= 1
+            if discard:
+                self._created -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if discard:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """返回连接池指标"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'created': self._created,
+                'idle': len(self._idle),
+                'in_use': self.in_use_count,
+                'checkouts': self.checkout_count,
+                'timeouts': self.timeout_count,
+                'stale': self.stale_count,
+                'avg_wait_ms': round(self.total_wait_time * 1000 / self.checkout_count, 3) if self.checkout_count else 0.0,
+                'max_wait_ms': round(self.max_wait_time * 1000, 3)
+            }
+
+class Transaction:
+    """同一事务中执行多条语句（由Database.transaction创建），方法与Database同名，出错时抛出异常，整个事务回滚"""
+
+    def __init__(self, database, cursor):
+        self._db = database
+        self._cursor = cursor
+
+    def execute_query(self, query, params=None):
+        """执行查询语句，返回结果行"""
+        self._cursor.execute(self._db._prepare(query), params or ())
+        return self._cursor.fetchall()
+
+    def execute_update(self, query, params=None):
+        """执行更新语句，返回影响行数"""
+        self._cursor.execute(self._db._prepare(query), params or ())
+        return self._cursor.rowcount
+
+    def execute_insert(self, query, params=None):
+        """执行插入语句，返回新插入行的ID"""
+        self._cursor.execute(self._db._prepare(query), params or ())
+        return self._cursor.lastrowid
+
+    def insert_rows(self, table, columns, rows, chunk_size=500):
+        """用多行VALUES语句批量插入，返回插入行数"""
+        return self._db._insert_chunks(self._cursor, table, columns, rows, chunk_size) if rows else 0
+
+    def execute_many(self, query, params_list):
+        """批量执行更新语句，返回影响行数"""
+        self._cursor.executemany(self._db._prepare(query), params_list)
+        return self._cursor.rowcount
+
+    def execute_upsert_many(self, table, columns, keys, updates, params_list):
+        """批量插入或更新多行，参数含义同Database.execute_upsert，返回影响行数"""
+        if not params_list:
+            return 0
+        self._cursor.executemany(self._db._build_upsert(table, columns, keys, updates, False), params_list)
+        return self._cursor.rowcount
 
 class Database:
+    """存储后端基类：封装连接池和通用的执行方法，SQL统一使用%s占位符"""
+
+    # 后端驱动抛出的异常类型
+    errors = ()
+
+    # 多参数最小值/最大值函数名
+    least = 'LEAST'
+    greatest = 'GREATEST'
+
     def __init__(self, config_name='default'):
         self.config = config[config_name]
-        self.connection = None
-        self.cursor = None
-        
+        self.pool = None
+        self._pool_lock = threading.Lock()
+
+    def append_tail(self, column, max_length):
+        """返回将一个%s参数追加到文本列末尾、只保留最后max_length个字符的SQL表达式"""
+        return f"RIGHT(CONCAT(COALESCE({column}, ''), %s), {int(max_length)})"
+
+    def _create_connection(self):
+        """创建一个新的数据库连接"""
+        raise NotImplementedError
+
+    def _create_cursor(self, conn):
+        """创建返回字典行的游标"""
+        raise NotImplementedError
+
+    def _is_alive(self, conn):
+        """判断连接是否仍可复用（出错后归还时，以及空闲较久的连接借出前）"""
+        return True
+
+    def _prepare(self, query):
+        """将通用SQL转换为后端方言"""
+        return query
+
+    def _get_pool(self):
+        """获取连接池，首次使用时创建"""
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(
+                        self._create_connection,
+                        self.config.DB_POOL_SIZE,
+                        self.config.DB_POOL_TIMEOUT,
+                        self._is_alive,
+                        self.config.DB_POOL_IDLE_CHECK
+                    )
+        return self.pool
+
     def connect(self):
-        """连接到数据库"""
+        """初始化连接池并验证数据库可连接"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.config.DB_HOST,
-                port=self.config.DB_PORT,
-                user=self.config.DB_USER,
-                password=self.config.DB_PASSWORD,
-                database=self.config.DB_NAME
-            )
-            if self.connection.is_connected():
-                self.cursor = self.connection.cursor(dictionary=True)
+            with self.connection():
                 return True
-        except Error as e:
+        except self.errors + (PoolTimeoutError,) as e:
             print(f"数据库连接错误: {e}")
             return False
-    
+
     def disconnect(self):
-        """断开数据库连接"""
-        if self.cursor:
-            self.cursor.close()
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-    
+        """关闭连接池中的空闲连接"""
+        if self.pool:
+            self.pool.close()
+
+    @contextmanager
+    def connection(self):
+        """从连接池借出连接，退出时归还；连接失效时丢弃"""
+        pool = self._get_pool()
+        conn = pool.acquire()
+        discard = False
+        try:
+            yield conn
+        except self.errors:
+            discard = not self._is_alive(conn)
+            raise
+        finally:
+            pool.release(conn, discard=discard)
+
+    @contextmanager
+    def _cursor(self):
+        """借出连接并创建仅在本次调用内有效的游标"""
+        with self.connection() as conn:
+            cursor = self._create_cursor(conn)
+            try:
+                yield conn, cursor
+            except self.errors:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
     def execute_query(self, query, params=None):
         """执行查询语句"""
         try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-            
-            self.cursor.execute(query, params)
-            result = self.cursor.fetchall()
-            return result
-        except Error as e:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(self._prepare(query), params or ())
+                result = cursor.fetchall()
+                # 结束只读事务，避免连接复用时读到旧快照
+                conn.commit()
+                return result
+        except self.errors + (PoolTimeoutError,) as e:
             print(f"查询执行错误: {e}")
             return None
-    
+
     def execute_update(self, query, params=None):
-        """执行更新语句（INSERT, UPDATE, DELETE）"""
+        """执行更新语句（INSERT, UPDATE, DELETE），返回影响行数"""
         try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-            
-            self.cursor.execute(query, params)
-            self.connection.commit()
-            return self.cursor.rowcount
-        except Error as e:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(self._prepare(query), params or ())
+                conn.commit()
+                return cursor.rowcount
+        except self.errors + (PoolTimeoutError,) as e:
             print(f"更新执行错误: {e}")
-            self.connection.rollback()
             return 0
-    
+
+    def execute_insert(self, query, params=None):
+        """执行插入语句，返回新插入行的ID"""
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(self._prepare(query), params or ())
+                conn.commit()
+                return cursor.lastrowid
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"插入执行错误: {e}")
+            return None
+
     def execute_many(self, query, params_list):
         """批量执行更新语句"""
         try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-            
-            self.cursor.executemany(query, params_list)
-            self.connection.commit()
-            return self.cursor.rowcount
-        except Error as e:
+            with self._cursor() as (conn, cursor):
+                cursor.executemany(self._prepare(query), params_list)
+                conn.commit()
+                return cursor.rowcount
+        except self.errors + (PoolTimeoutError,) as e:
             print(f"批量执行错误: {e}")
-            self.connection.rollback()
             return 0
 
+    def execute_inserts(self, query, params_list):
+        """在同一事务中逐行执行插入语句，返回各行的ID列表；失败时回滚并返回None"""
+        try:
+            with self._cursor() as (conn, cursor):
+                ids = []
+                for params in params_list:
+                    cursor.execute(self._prepare(query), params)
+                    ids.append(cursor.lastrowid)
+                conn.commit()
+                return ids
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"批量插入执行错误: {e}")
+            return None
+
+    def transaction(self, work):
+        """在同一事务中执行work(tx)，tx为Transaction；work正常返回时提交并返回其结果，数据库出错时回滚并返回None"""
+        try:
+            with self._cursor() as (conn, cursor):
+                try:
+                    result = work(Transaction(self, cursor))
+                except self.errors:
+                    raise
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+                return result
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"事务执行错误: {e}")
+            return None
+
+    def insert_rows(self, table, columns, rows, chunk_size=500):
+        """用多行VALUES语句批量插入，所有分块在同一事务中提交，返回插入行数"""
+        if not rows:
+            return 0
+        try:
+            with self._cursor() as (conn, cursor):
+                count = self._insert_chunks(cursor, table, columns, rows, chunk_size)
+                conn.commit()
+                return count
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"批量插入执行错误: {e}")
+            return 0
+
+    def _insert_chunks(self, cursor, table, columns, rows, chunk_size):
+        """按chunk_size行一条多行INSERT语句写入rows（不提交），返回插入行数"""
+        row_placeholder = f"({', '.join(['%s'] * len(columns))})"
+        count = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_placeholder] * len(chunk))}"
+            cursor.execute(self._prepare(query), [value for row in chunk for value in row])
+            count += cursor.rowcount
+        return count
+
+    def _build_upsert(self, table, columns, keys, updates, returning_id):
+        """生成插入或更新语句，由各后端实现"""
+        raise NotImplementedError
+
+    def execute_upsert(self, table, columns, keys, updates, params, returning_id=False):
+        """按唯一键原子地插入或更新一行
+
+        updates为列名到更新表达式的映射，表达式中的{new}表示本次插入的值；
+        returning_id为True时返回插入或命中的行ID，否则返回影响行数
+        """
+        query = self._build_upsert(table, columns, keys, updates, returning_id)
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(query, params)
+                if returning_id:
+                    row = cursor.fetchone() if cursor.description else None
+                    result = row['id'] if row else self._upserted_id(cursor, table, columns, keys, params)
+                else:
+                    result = cursor.rowcount
+                conn.commit()
+                return result
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"插入或更新执行错误: {e}")
+            return None if returning_id else 0
+
+    def _upserted_id(self, cursor, table, columns, keys, params):
+        """插入或更新语句没有返回行时，取插入或命中的行ID（同一事务内）"""
+        return cursor.lastrowid
+
+    def execute_upsert_many(self, table, columns, keys, updates, params_list):
+        """批量插入或更新多行，参数含义同execute_upsert，返回影响行数"""
+        if not params_list:
+            return 0
+        query = self._build_upsert(table, columns, keys, updates, False)
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.executemany(query, params_list)
+                conn.commit()
+                return cursor.rowcount
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"批量插入或更新执行错误: {e}")
+            return 0
+
+    def drop_expired_partitions(self, table, cutoff):
+        """删除上界不晚于cutoff的时间分区，返回(分区数, 估计行数)；不支持分区的后端返回(0, 0)"""
+        return 0, 0
+
+    def pool_stats(self):
+        """返回连接池指标"""
+        return self._get_pool().stats()
+
+class MySQLDatabase(Database):
+    """MySQL存储后端"""
+
+    errors = (MySQLError,)
+
+    def _create_connection(self):
+        if not MYSQL_AVAILABLE:
+            raise MySQLError('未安装mysql-connector-python')
+        return mysql.connector.connect(
+            host=self.config.DB_HOST,
+            port=self.config.DB_PORT,
+            user=self.config.DB_USER,
+            password=self.config.DB_PASSWORD,
+            database=self.config.DB_NAME
+        )
+
+    def _create_cursor(self, conn):
+        return conn.cursor(dictionary=True)
+
+    def _is_alive(self, conn):
+        return conn.is_connected()
+
+    def drop_expired_partitions(self, table, cutoff):
+        """按RANGE (TO_DAYS(...)) 或 RANGE (UNIX_TIMESTAMP(...)) 分区的表可整体删除过期分区"""
+        query = ("SELECT PARTITION_NAME, PARTITION_EXPRESSION, PARTITION_DESCRIPTION, TABLE_ROWS "
+                 "FROM information_schema.PARTITIONS "
+                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_METHOD = 'RANGE' "
+                 "ORDER BY PARTITION_ORDINAL_POSITION")
+        partitions = self.execute_query(query, (table,)) or []
+        expired = []
+        rows = 0
+
+        for partition in partitions:
+            expression = (partition['PARTITION_EXPRESSION'] or '').lower()
+            description = partition['PARTITION_DESCRIPTION']
+            if not description or not description.isdigit():
+                continue
+            if 'to_days' in expression:
+                # TO_DAYS与Python序数日期相差365天
+                upper_bound = datetime.datetime.combine(
+                    datetime.date.fromordinal(int(description) - 365), datetime.time())
+            elif 'unix_timestamp' in expression:
+                upper_bound = datetime.datetime.fromtimestamp(int(description))
+            else:
+                continue
+            if upper_bound <= cutoff:
+                expired.append(partition['PARTITION_NAME'])
+                rows += partition['TABLE_ROWS'] or 0
+
+        # 至少保留一个分区
+        if not expired or len(expired) == len(partitions):
+            return 0, 0
+        try:
+            with self._cursor() as (conn, cursor):
+                cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+                return len(expired), rows
+        except self.errors + (PoolTimeoutError,) as e:
+            print(f"删除过期分区错误: {e}")
+            return 0, 0
+
+    def _build_upsert(self, table, columns, keys, updates, returning_id):
+        assignments = [f"{column} = {expression.format(new=f'VALUES({column})')}"
+                       for column, expression in updates.items()]
+        if returning_id:
+            # 命中已有行时通过LAST_INSERT_ID(id)让lastrowid返回该行ID
+            assignments.insert(0, 'id = LAST_INSERT_ID(id)')
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(assignments)}")
+
+# SQLite时间类型与datetime互转（格式与MySQL TIMESTAMP一致）
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.datetime.fromisoformat(value.decode('utf-8')))
+
+def _dict_factory(cursor, row):
+    """SQLite行转换为字典，与MySQL的dictionary游标保持一致"""
+    return {column[0]: row[index] for index, column in enumerate(cursor.description)}
+
+class SQLiteDatabase(Database):
+    """嵌入式SQLite存储后端（WAL模式），适用于单机部署和基准测试
+
+    插入或更新语句（ON CONFLICT）需要SQLite 3.24及以上；3.35以下没有RETURNING，改为在同一事务中按唯一键查询行ID。
+    """
+
+    errors = (sqlite3.Error,)
+
+    # 是否支持INSERT ... RETURNING
+    returning = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    least = 'MIN'
+    greatest = 'MAX'
+
+    _placeholder = re.compile(r'%s')
+
+    def __init__(self, config_name='default'):
+        super().__init__(config_name)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._statements = {}
+
+    def append_tail(self, column, max_length):
+        """返回将一个%s参数追加到文本列末尾、只保留最后max_length个字符的SQL表达式"""
+        return f"substr(COALESCE({column}, '') || %s, -{int(max_length)})"
+
+    def _create_connection(self):
+        conn = sqlite3.connect(
+            self.config.SQLITE_PATH,
+            timeout=self.config.SQLITE_BUSY_TIMEOUT,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            cached_statements=self.config.SQLITE_STATEMENT_CACHE
+        )
+        conn.row_factory = _dict_factory
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA foreign_keys = ON')
+        self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn):
+        """首次连接时初始化数据库：新库执行完整初始化脚本，旧库按user_version执行升级脚本"""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+
+            migrations = sorted(name for name in os.listdir(SQLITE_MIGRATIONS) if name.endswith('.sql'))
+            latest = int(migrations[-1].split('_', 1)[0]) if migrations else 0
+            exists = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'clients'").fetchone()
+
+            if not exists:
+                with open(SQLITE_SCHEMA, encoding='utf-8') as f:
+                    conn.executescript(f.read())
+                conn.execute(f'PRAGMA user_version = {latest}')
+            else:
+                version = conn.execute('PRAGMA user_version').fetchone()['user_version']
+                for name in migrations:
+                    number = int(name.split('_', 1)[0])
+                    if number > version:
+                        with open(os.path.join(SQLITE_MIGRATIONS, name), encoding='utf-8') as f:
+                            conn.executescript(f.read())
+                        conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+            self._schema_ready = True
+
+    def _create_cursor(self, conn):
+        return conn.cursor()
+
+    def _prepare(self, query):
+        # 转换结果按原始SQL缓存，配合连接级语句缓存实现预编译复用
+        prepared = self._statements.get(query)
+        if prepared is None:
+            prepared = self._placeholder.sub('?', query)
+            self._statements[query] = prepared
+        return prepared
+
+    def _build_upsert(self, table, columns, keys, updates, returning_id):
+        assignments = [f"{column} = {expression.format(new=f'excluded.{column}')}"
+                       for column, expression in updates.items()]
+        query = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))}) "
+                 f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(assignments)}")
+        if returning_id and self.returning:
+            query += ' RETURNING id'
+        return query
+
+    def _upserted_id(self, cursor, table, columns, keys, params):
+        # 命中已有行时lastrowid不是该行ID，按唯一键查询
+        values = dict(zip(columns, params))
+        cursor.execute(self._prepare(f"SELECT id FROM {table} WHERE {' AND '.join(f'{key} = %s' for key in keys)}"),
+                       [values[key] for key in keys])
+        row = cursor.fetchone()
+        return row['id'] if row else None
+
+def create_database(config_name='default'):
+    """根据配置中的DB_ENGINE创建存储后端"""
+    engine = config[config_name].DB_ENGINE.lower()
+    if engine == 'sqlite':
+        return SQLiteDatabase(config_name)
+    if engine == 'mysql':
+        return MySQLDatabase(config_name)
+    raise ValueError(f'不支持的存储后端: {engine}')
+
 # 创建数据库实例
-db = Database()
+db = create_database(CONFIG_NAME)
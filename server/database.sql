@@ -24,7 +24,8 @@ CREATE TABLE IF NOT EXISTS clients (
     status ENUM('online', 'offline') DEFAULT 'offline',
     last_heartbeat TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_client_identity (hostname, ip_address, port)
 );
 
 -- 系统数据表
@@ -35,20 +36,113 @@ CREATE TABLE IF NOT EXISTS system_data (
     memory_usage FLOAT NOT NULL,
     disk_usage FLOAT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_system_data_client_time (client_id, created_at),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 系统数据1分钟汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_1m (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 系统数据5分钟汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_5m (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
     FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
 );
 
+-- 系统数据1小时汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_1h (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 命令任务表（一次批量下发对应一个任务，各状态数量随命令结果增量更新）
+CREATE TABLE IF NOT EXISTS command_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    command_type ENUM('shell', 'script_update', 'file_operation') NOT NULL,
+    command_content TEXT NOT NULL,
+    selector TEXT NULL,
+    total_count INT NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    dispatched_count INT NOT NULL DEFAULT 0,
+    executed_count INT NOT NULL DEFAULT 0,
+    failed_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- 命令表
 CREATE TABLE IF NOT EXISTS commands (
     id INT AUTO_INCREMENT PRIMARY KEY,
     client_id INT NOT NULL,
     command_type ENUM('shell', 'script_update', 'file_operation') NOT NULL,
     command_content TEXT NOT NULL,
-    status ENUM('pending', 'executed', 'failed') DEFAULT 'pending',
-    result TEXT,
+    status ENUM('pending', 'dispatched', 'executed', 'failed') DEFAULT 'pending',
+    result MEDIUMTEXT,
+    output_size BIGINT NOT NULL DEFAULT 0,
+    result_blob CHAR(64) NULL,
+    result_size BIGINT NULL,
+    job_id INT NULL,
+    claim_token VARCHAR(32) NULL,
+    lease_expires_at TIMESTAMP NULL,
+    attempts INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     executed_at TIMESTAMP NULL,
-    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+    INDEX idx_commands_client_time (client_id, created_at),
+    INDEX idx_commands_time (created_at),
+    INDEX idx_commands_client_status_time (client_id, status, created_at),
+    INDEX idx_commands_status_time (status, created_at),
+    INDEX idx_commands_type_time (command_type, created_at),
+    INDEX idx_commands_job_time (job_id, created_at),
+    INDEX idx_commands_status_lease (status, lease_expires_at),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE,
+    FOREIGN KEY (job_id) REFERENCES command_jobs(id) ON DELETE SET NULL
+);
+
+-- 截图文件索引表（按内容哈希存储，相同截图只存一份，ref_count为引用该文件的截图数）
+CREATE TABLE IF NOT EXISTS screenshot_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    file_size INT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_screenshot_blobs_ref_count (ref_count)
 );
 
 -- 截图表
@@ -56,8 +150,17 @@ CREATE TABLE IF NOT EXISTS screenshots (
     id INT AUTO_INCREMENT PRIMARY KEY,
     client_id INT NOT NULL,
     file_path VARCHAR(255) NOT NULL,
+    content_hash CHAR(64) NULL,
+    base_hash CHAR(64) NULL,
+    tiles TEXT NULL,
     file_size INT NOT NULL,
+    fingerprint CHAR(16) NULL,
+    upload_id CHAR(32) NULL,
+    last_seen_at TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_screenshots_upload (upload_id),
+    INDEX idx_screenshots_client (client_id),
+    INDEX idx_screenshots_client_time (client_id, created_at),
     FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
 );
 
@@ -0,0 +1,204 @@
+-- SQLite数据库初始化脚本（DB_ENGINE=sqlite时由服务端在新建数据库时自动执行；已有数据库按server/migrations/sqlite中的脚本升级）
+
+-- 用户表
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    role TEXT NOT NULL DEFAULT 'inspector' CHECK (role IN ('admin', 'inspector', 'maintainer', 'repairer')),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- 客户端表
+CREATE TABLE IF NOT EXISTS clients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hostname VARCHAR(100) NOT NULL,
+    ip_address VARCHAR(50) NOT NULL,
+    port INT NOT NULL,
+    status TEXT DEFAULT 'offline' CHECK (status IN ('online', 'offline')),
+    last_heartbeat TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_client_identity ON clients (hostname, ip_address, port);
+
+-- 系统数据表
+CREATE TABLE IF NOT EXISTS system_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INT NOT NULL,
+    cpu_usage FLOAT NOT NULL,
+    memory_usage FLOAT NOT NULL,
+    disk_usage FLOAT NOT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_system_data_client_time ON system_data (client_id, created_at);
+
+-- 系统数据1分钟汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_1m (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 系统数据5分钟汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_5m (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 系统数据1小时汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_1h (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 命令任务表（一次批量下发对应一个任务，各状态数量随命令结果增量更新）
+CREATE TABLE IF NOT EXISTS command_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command_type TEXT NOT NULL CHECK (command_type IN ('shell', 'script_update', 'file_operation')),
+    command_content TEXT NOT NULL,
+    selector TEXT NULL,
+    total_count INT NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    dispatched_count INT NOT NULL DEFAULT 0,
+    executed_count INT NOT NULL DEFAULT 0,
+    failed_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- 命令表
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INT NOT NULL,
+    command_type TEXT NOT NULL CHECK (command_type IN ('shell', 'script_update', 'file_operation')),
+    command_content TEXT NOT NULL,
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'dispatched', 'executed', 'failed')),
+    result TEXT,
+    output_size BIGINT NOT NULL DEFAULT 0,
+    result_blob CHAR(64) NULL,
+    result_size BIGINT NULL,
+    job_id INT NULL REFERENCES command_jobs(id) ON DELETE SET NULL,
+    claim_token VARCHAR(32) NULL,
+    lease_expires_at TIMESTAMP NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    executed_at TIMESTAMP NULL,
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_commands_client_time ON commands (client_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_time ON commands (created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_client_status_time ON commands (client_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_status_time ON commands (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_type_time ON commands (command_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_job_time ON commands (job_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_status_lease ON commands (status, lease_expires_at);
+
+-- 截图文件索引表（按内容哈希存储，相同截图只存一份，ref_count为引用该文件的截图数）
+CREATE TABLE IF NOT EXISTS screenshot_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    file_size INT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_screenshot_blobs_ref_count ON screenshot_blobs (ref_count);
+
+-- 截图表
+CREATE TABLE IF NOT EXISTS screenshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INT NOT NULL,
+    file_path VARCHAR(255) NOT NULL,
+    content_hash CHAR(64) NULL,
+    base_hash CHAR(64) NULL,
+    tiles TEXT NULL,
+    file_size INT NOT NULL,
+    fingerprint CHAR(16) NULL,
+    upload_id CHAR(32) NULL,
+    last_seen_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_screenshots_upload ON screenshots (upload_id);
+CREATE INDEX IF NOT EXISTS idx_screenshots_client ON screenshots (client_id);
+CREATE INDEX IF NOT EXISTS idx_screenshots_client_time ON screenshots (client_id, created_at);
+
+-- 文件操作表
+CREATE TABLE IF NOT EXISTS file_operations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INT NOT NULL,
+    operation_type TEXT NOT NULL CHECK (operation_type IN ('upload', 'download', 'copy', 'chmod')),
+    file_path VARCHAR(255) NOT NULL,
+    file_permission VARCHAR(10) NULL,
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'failed')),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    completed_at TIMESTAMP NULL,
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 预设命令表
+CREATE TABLE IF NOT EXISTS preset_commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    command TEXT NOT NULL,
+    description VARCHAR(255) NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- 插入默认预设命令（指定ID，重复执行时忽略）
+INSERT OR IGNORE INTO preset_commands (id, name, command, description) VALUES
+(1, '查看磁盘利用情况', 'df -h', '查看系统磁盘使用情况'),
+(2, '重启客户端服务器', 'reboot', '重启客户端服务器'),
+(3, '重启cipp.service', 'systemctl restart cipp.service', '重启cipp.service服务'),
+(4, '重启h5ss.service', 'systemctl restart h5ss.service', '重启h5ss.service服务'),
+(5, '重启sitestart.service', 'systemctl restart sitestart.service', '重启sitestart.service服务'),
+(6, '查看/opt/h5ss/logs目录大小', 'du -sh /opt/h5ss/logs', '查看/opt/h5ss/logs目录大小'),
+(7, '查看/opt/h5ss/www/mediastore/snapshot目录大小', 'du -sh /opt/h5ss/www/mediastore/snapshot', '查看/opt/h5ss/www/mediastore/snapshot目录大小'),
+(8, '查看/opt/site/runlog.log文件大小', 'ls -lh /opt/site/runlog.log', '查看/opt/site/runlog.log文件大小'),
+(9, '删除/opt/h5ss/logs目录', 'rm -rf /opt/h5ss/logs/*', '删除/opt/h5ss/logs目录下的所有文件'),
+(10, '删除/opt/h5ss/www/mediastore/snapshot目录', 'rm -rf /opt/h5ss/www/mediastore/snapshot/*', '删除/opt/h5ss/www/mediastore/snapshot目录下的所有文件');
+
+-- 插入默认管理员用户
+INSERT OR IGNORE INTO users (username, password, role) VALUES
+('admin', 'admin123', 'admin');
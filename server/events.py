@@ -0,0 +1,84 @@
+# 服务端事件推送模块
+
+import json
+import queue
+import threading
+from collections import deque
+
+class EventBroker:
+    """进程内事件分发器：每个订阅者一个有界队列，发布时只做内存拷贝，不访问数据库"""
+
+    def __init__(self, queue_size=1000, history_size=1000):
+        self._queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)  # 最近的事件，供断线重连的订阅者补发
+        self._next_id = 1
+
+    def publish(self, event_type, data):
+        """向所有订阅者发布一个事件，返回事件ID；不会阻塞发布者"""
+        with self._lock:
+            event = (self._next_id, event_type, data)
+            self._next_id += 1
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # 订阅者消费过慢：丢弃积压的事件，通知其重新加载全量数据
+                self._reset(subscriber, event[0])
+        return event[0]
+
+    def _reset(self, subscriber, event_id):
+        """清空订阅者队列并放入reset事件"""
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.put_nowait((event_id, 'reset', {}))
+        except queue.Full:
+            pass
+
+    def subscribe(self, last_event_id=None):
+        """新增订阅者并返回其队列；指定last_event_id时补发之后的事件，无法补全时先放入reset事件"""
+        subscriber = queue.Queue(self._queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                missed = [event for event in self._history if event[0] > last_event_id]
+                oldest = self._history[0][0] if self._history else self._next_id
+                if last_event_id + 1 < oldest or len(missed) > self._queue_size:
+                    subscriber.put_nowait((self._next_id - 1, 'reset', {}))
+                else:
+                    for event in missed:
+                        subscriber.put_nowait(event)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """移除订阅者"""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        """返回当前订阅者数量"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, subscriber, keepalive, dumps=json.dumps):
+        """生成text/event-stream格式的事件流，空闲时定期发送注释行保持连接，连接断开时自动退订"""
+        try:
+            # 建议浏览器断线后的重连间隔（毫秒）
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event_id, event_type, data = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {dumps(data)}\n\n'
+        finally:
+            self.unsubscribe(subscriber)
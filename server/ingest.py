@@ -0,0 +1,343 @@
+# 截图异步写入模块
+
+import os
+import json
+import uuid
+import queue
+import hashlib
+import tempfile
+import threading
+from server.cache import LRUCache
+
+# 截图行的列（差分截图才有base_hash和tiles；upload_id唯一，重复写入同一上传时不会插入第二行）
+SCREENSHOT_COLUMNS = ('client_id', 'file_path', 'content_hash', 'base_hash', 'tiles', 'file_size', 'fingerprint',
+                      'upload_id')
+
+class UploadTooLarge(Exception):
+    """上传的截图超过大小上限"""
+
+class IngestQueueFull(Exception):
+    """写入队列已满"""
+
+class InsertedIds(list):
+    """写入的截图ID列表，existing为其中此前已写入的ID"""
+    existing = ()
+
+class PendingScreenshot:
+    """已持久化到临时文件、等待写入的截图；写入线程完成后设置done，成功时id为截图ID
+
+    upload_id为返回给客户端的上传凭据，客户端凭此查询截图ID；
+    temp_path为None表示文件已移动到内容寻址目录（重启前已移动但截图行尚未写入）。
+    """
+
+    def __init__(self, temp_path, content_hash, file_size, row, upload_id=None):
+        self.temp_path = temp_path
+        self.content_hash = content_hash
+        self.file_size = file_size
+        self.row = row
+        self.upload_id = upload_id or uuid.uuid4().hex
+        self.sidecar = None
+        self.id = None
+        self.done = threading.Event()
+
+class ScreenshotIngest:
+    """截图异步写入：请求线程把上传内容流式写入临时文件，边读边检查大小并计算内容哈希，fsync后交给写入队列；
+    后台写入线程把一批截图原子重命名到内容寻址目录，在一个事务中增加引用数并插入截图行
+
+    on_stored(rows)在写入线程中调用，rows为写入成功的截图行（含id）。
+    临时文件位于截图目录下的.incoming目录（与目标文件在同一文件系统，重命名是原子的）。
+    提交时在临时文件旁写入记录截图行其余列的.json描述文件，截图行写入后删除；数据库写入失败时保留描述文件并重试
+    （已移动的文件由描述文件记录，直到截图行提交；截图行按upload_id去重，重复写入不会重复插入或增加引用数）；
+    启动时按描述文件重新提交上次退出时尚未写入的截图，删除没有描述文件的临时文件。
+    最近result_size次上传的结果保存在内存中，供客户端按上传凭据查询截图ID。
+    """
+
+    def __init__(self, database, store, max_size, queue_size=1000, batch_size=100, on_stored=None, result_size=10000,
+                 retry_interval=1.0):
+        self._db = database
+        self._store = store
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._on_stored = on_stored
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._retry_interval = retry_interval
+        self._stopping = threading.Event()
+        self._uploads = {}  # 上传凭据 -> 等待写入的PendingScreenshot
+        self._results = LRUCache(result_size)  # 上传凭据 -> 已写入（或写入失败）的PendingScreenshot
+        self._lock = threading.Lock()
+        self._incoming = os.path.join(store.blobs.root, '.incoming')
+        os.makedirs(self._incoming, exist_ok=True)
+        self._replay()
+
+    def receive(self, stream, chunk_size=64 * 1024):
+        """把上传流写入临时文件并fsync，返回(临时文件路径, 内容哈希, 字节数)；超过大小上限时抛出UploadTooLarge"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self._incoming, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self._max_size:
+                        raise UploadTooLarge()
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            self.discard(temp_path)
+            raise
+        return temp_path, digest.hexdigest(), size
+
+    def submit(self, temp_path, content_hash, file_size, row):
+        """提交receive写好的截图，row为其余列的值：先持久化描述文件再放入写入队列，返回PendingScreenshot；
+        队列已满时删除临时文件并抛出IngestQueueFull
+        """
+        pending = PendingScreenshot(temp_path, content_hash, file_size, row)
+        try:
+            self._write_sidecar(pending)
+        except BaseException:
+            self.discard(temp_path)
+            raise
+        with self._lock:
+            self._uploads[pending.upload_id] = pending
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._lock:
+                self._uploads.pop(pending.upload_id, None)
+            self.discard(temp_path)
+            raise IngestQueueFull()
+        return pending
+
+    def lookup(self, upload_id):
+        """按上传凭据返回PendingScreenshot（done未设置表示尚未写入），未知或已过期的凭据返回None"""
+        with self._lock:
+            pending = self._uploads.get(upload_id)
+        return pending or self._results.get(upload_id)
+
+    def pending(self):
+        """返回队列中等待写入的截图数"""
+        return self._queue.qsize()
+
+    def _write_sidecar(self, pending):
+        """在临时文件旁原子写入描述文件并fsync，重启后据此重新提交"""
+        sidecar = pending.temp_path + '.json'
+        part = sidecar + '.part'
+        try:
+            with open(part, 'w') as f:
+                json.dump({'upload_id': pending.upload_id, 'content_hash': pending.content_hash,
+                           'file_size': pending.file_size, 'row': pending.row}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(part, sidecar)
+        except BaseException:
+            self._remove(part)
+            raise
+        self._sync_directories([self._incoming])
+        pending.sidecar = sidecar
+
+    def _replay(self):
+        """重新提交上次退出时已持久化但截图行尚未写入的截图，清理不完整的临时文件"""
+        names = set(os.listdir(self._incoming))
+        for name in sorted(names):
+            path = os.path.join(self._incoming, name)
+            if name.endswith('.part') or (not name.endswith('.json') and name + '.json' not in names):
+                # 写到一半的描述文件，或提交前中断的上传
+                self._remove(path)
+                continue
+            if not name.endswith('.json'):
+                continue
+            temp_path = path[:-len('.json')]
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+                pending = PendingScreenshot(temp_path, meta['content_hash'], meta['file_size'], meta['row'],
+                                            meta['upload_id'])
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"读取截图描述文件失败: {name} {e}")
+                self.discard(temp_path)
+                continue
+            pending.sidecar = path
+            if name[:-len('.json')] not in names:
+                # 文件已移动到内容寻址目录、截图行尚未写入；文件也不存在时无法恢复
+                if not os.path.exists(self._store.blobs.path(pending.content_hash) or ''):
+                    self._remove(path)
+                    continue
+                pending.temp_path = None
+            try:
+                self._queue.put_nowait(pending)
+            except queue.Full:
+                # 留在磁盘上，下次启动时再提交
+                break
+            self._uploads[pending.upload_id] = pending
+
+    def _write(self, batch):
+        """写入一批截图：移动文件、增加引用数、插入截图行，提交后删除描述文件并唤醒等待的请求
+
+        数据库写入失败时返回False，描述文件保留，由调用方稍后重试；其余情况返回True
+        """
+        stored = []
+        directories = set()
+        for pending in batch:
+            try:
+                if pending.temp_path is None:
+                    path = self._store.blobs.path(pending.content_hash)
+                    os.utime(path, None)
+                else:
+                    path = self._store.blobs.adopt(pending.temp_path, pending.content_hash)
+                    # 文件已移动，重试或重启恢复时不再移动
+                    pending.temp_path = None
+            except OSError as e:
+                print(f"保存截图失败: {e}")
+                self._release_bases([pending])
+                self._finish(pending)
+                continue
+            directories.add(os.path.dirname(path))
+            stored.append(pending)
+        self._sync_directories(directories)
+        if not stored:
+            return True
+
+        rows = []
+        for pending in stored:
+            row = dict(pending.row, file_path=self._store.blobs.relative_path(pending.content_hash),
+                       content_hash=pending.content_hash, file_size=pending.file_size, upload_id=pending.upload_id)
+            rows.append({column: row.get(column) for column in SCREENSHOT_COLUMNS})
+        ids = self._db.transaction(lambda tx: self._insert(tx, stored, rows))
+        if ids is None:
+            return False
+
+        for pending, row, screenshot_id in zip(stored, rows, ids):
+            pending.id = row['id'] = screenshot_id
+        try:
+            # 重启前已写入的截图（只是描述文件未删除）不再发布
+            rows = [row for row in rows if row['id'] not in ids.existing]
+            if self._on_stored and rows:
+                self._on_stored(rows)
+        finally:
+            for pending in stored:
+                self._finish(pending)
+        return True
+
+    def _insert(self, tx, stored, rows):
+        """在一个事务中增加引用数并插入截图行，返回与stored对应的截图ID列表（existing属性为此前已写入的ID）
+
+        按upload_id跳过此前已写入的截图（如写入后、删除描述文件前进程退出），不重复插入也不重复增加引用数
+        """
+        placeholders = ', '.join(['%s'] * len(stored))
+        existing = {row['upload_id']: row['id'] for row in tx.execute_query(
+            f"SELECT id, upload_id FROM screenshots WHERE upload_id IN ({placeholders})",
+            [pending.upload_id for pending in stored])}
+
+        refs = {}
+        for pending in stored:
+            if pending.upload_id not in existing:
+                refs[pending.content_hash] = (pending.file_size, refs.get(pending.content_hash, (0, 0))[1] + 1)
+        if refs and not self._store.add_refs(refs, tx):
+            raise RuntimeError('增加截图引用数失败')
+
+        query = (f"INSERT INTO screenshots ({', '.join(SCREENSHOT_COLUMNS)}) "
+                 f"VALUES ({', '.join(['%s'] * len(SCREENSHOT_COLUMNS))})")
+        ids = InsertedIds(existing[pending.upload_id] if pending.upload_id in existing
+                          else tx.execute_insert(query, tuple(row.values()))
+                          for pending, row in zip(stored, rows))
+        ids.existing = set(existing.values())
+        return ids
+
+    def _finish(self, pending):
+        """结束一张截图的写入：删除临时文件和描述文件，把结果移入结果缓存并唤醒等待者（可重复调用）"""
+        if pending.done.is_set():
+            return
+        self.discard(pending.temp_path)
+        self._remove(pending.sidecar)
+        self._results.put(pending.upload_id, pending)
+        with self._lock:
+            self._uploads.pop(pending.upload_id, None)
+        pending.done.set()
+
+    def _release_bases(self, batch):
+        """释放写入失败的差分截图持有的关键帧引用"""
+        counts = {}
+        for pending in batch:
+            base_hash = pending.row.get('base_hash')
+            if base_hash:
+                counts[base_hash] = counts.get(base_hash, 0) + 1
+        if counts:
+            self._store.release(counts)
+
+    def _sync_directories(self, directories):
+        """fsync目录，使重命名在写入数据库前持久化（不支持目录fsync的平台跳过）"""
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    def discard(self, temp_path):
+        """删除临时文件及其描述文件"""
+        if temp_path:
+            self._remove(temp_path)
+            self._remove(temp_path + '.json')
+
+    def _remove(self, path):
+        """删除文件，不存在时忽略"""
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _run(self):
+        """后台写入循环：每次取出队列中已有的截图（最多batch_size张）一起写入，收到None时写完当前批次后退出"""
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            # 数据库写入失败时每隔retry_interval秒重试同一批，停止时未写入的截图留待重启后按描述文件恢复
+            while batch:
+                try:
+                    if self._write(batch):
+                        break
+                except Exception as e:
+                    print(f"截图写入错误: {e}")
+                if self._stopping.wait(self._retry_interval):
+                    break
+            if stopping:
+                return
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='screenshot_ingest')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台写入线程（写完队列中已有的截图，数据库不可用时不再重试）"""
+        self._stopping.set()
+        try:
+            self._queue.put(None, timeout=5)
+        except queue.Full:
+            pass
+        if self._thread:
+            self._thread.join(timeout=10)
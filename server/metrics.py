@@ -0,0 +1,109 @@
+# 系统数据（监控指标）写入与查询模块
+
+import datetime
+
+# system_data表写入列
+SAMPLE_COLUMNS = ('client_id', 'cpu_usage', 'memory_usage', 'disk_usage', 'created_at')
+
+# 汇总的指标
+METRICS = ('cpu', 'memory', 'disk')
+
+# 汇总表，按粒度从粗到细排列：(粒度秒数, 表名)
+ROLLUPS = (
+    (3600, 'system_data_1h'),
+    (300, 'system_data_5m'),
+    (60, 'system_data_1m'),
+)
+
+# 汇总表写入列
+ROLLUP_COLUMNS = ('client_id', 'bucket', 'samples') + tuple(
+    f'{metric}_{field}' for metric in METRICS for field in ('min', 'sum', 'max'))
+
+def parse_timestamp(value):
+    """解析采样时间：支持Unix时间戳和ISO格式字符串，缺省为当前时间"""
+    if value is None or value == '':
+        return datetime.datetime.now()
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    return datetime.datetime.fromisoformat(str(value))
+
+def parse_sample(sample, default_client_id=None):
+    """将一条上报的采样转换为system_data行，数据不合法时抛出ValueError"""
+    if not isinstance(sample, dict):
+        raise ValueError('sample must be an object')
+
+    client_id = sample.get('client_id', default_client_id)
+    values = [sample.get('cpu_usage'), sample.get('memory_usage'), sample.get('disk_usage')]
+    if client_id is None or any(value is None for value in values):
+        raise ValueError('Missing required fields')
+
+    try:
+        return (int(client_id),) + tuple(float(value) for value in values) + (parse_timestamp(sample.get('timestamp')),)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('Invalid field value')
+
+def _bucket_start(created_at, resolution):
+    """返回采样时间所在时间桶的起始时间"""
+    epoch = created_at.timestamp()
+    return datetime.datetime.fromtimestamp(epoch - epoch % resolution)
+
+def aggregate_rollups(rows, resolution):
+    """将一批采样按(client_id, 时间桶)聚合为汇总表行"""
+    buckets = {}
+    for client_id, cpu_usage, memory_usage, disk_usage, created_at in rows:
+        key = (client_id, _bucket_start(created_at, resolution))
+        bucket = buckets.get(key)
+        values = (cpu_usage, memory_usage, disk_usage)
+        if bucket is None:
+            buckets[key] = [1] + [stat for value in values for stat in (value, value, value)]
+        else:
+            bucket[0] += 1
+            for index, value in enumerate(values):
+                offset = 1 + index * 3
+                bucket[offset] = min(bucket[offset], value)
+                bucket[offset + 1] += value
+                bucket[offset + 2] = max(bucket[offset + 2], value)
+    return [key + tuple(bucket) for key, bucket in buckets.items()]
+
+def update_rollups(database, rows):
+    """将一批采样增量合并到各粒度的汇总表"""
+    updates = {'samples': 'samples + {new}'}
+    for metric in METRICS:
+        updates[f'{metric}_min'] = f'{database.least}({metric}_min, {{new}})'
+        updates[f'{metric}_sum'] = f'{metric}_sum + {{new}}'
+        updates[f'{metric}_max'] = f'{database.greatest}({metric}_max, {{new}})'
+
+    for resolution, table in ROLLUPS:
+        database.execute_upsert_many(table, ROLLUP_COLUMNS, ('client_id', 'bucket'), updates,
+                                     aggregate_rollups(rows, resolution))
+
+def insert_samples(database, rows):
+    """用一条多行INSERT语句写入一批采样并更新汇总表，返回写入行数"""
+    inserted = database.insert_rows('system_data', SAMPLE_COLUMNS, rows)
+    if inserted:
+        update_rollups(database, rows)
+    return inserted
+
+def choose_resolution(start, end, points):
+    """选择仍能提供至少points个数据点的最粗粒度，返回(粒度秒数, 表名)，原始数据粒度为0"""
+    span = (end - start).total_seconds()
+    for resolution, table in ROLLUPS:
+        if span / resolution >= points:
+            return resolution, table
+    return 0, 'system_data'
+
+def query_series(database, client_id, start, end, points):
+    """按时间范围查询系统数据，自动选择合适粒度，返回(粒度秒数, 数据点列表)"""
+    resolution, table = choose_resolution(start, end, points)
+
+    if resolution == 0:
+        query = ("SELECT created_at, cpu_usage, memory_usage, disk_usage FROM system_data "
+                 "WHERE client_id = %s AND created_at >= %s AND created_at < %s ORDER BY created_at ASC")
+    else:
+        averages = ', '.join(f'{metric}_sum / samples AS {metric}_usage, {metric}_min, {metric}_max'
+                             for metric in METRICS)
+        query = (f"SELECT bucket AS created_at, samples, {averages} FROM {table} "
+                 f"WHERE client_id = %s AND bucket >= %s AND bucket < %s ORDER BY bucket ASC")
+
+    series = database.execute_query(query, (client_id, start, end))
+    return resolution, series
@@ -0,0 +1,22 @@
+-- 升级脚本：客户端身份唯一键（心跳原子upsert依赖此约束）
+-- 先将重复客户端的关联数据合并到ID最小的记录，再删除重复记录并添加唯一键
+
+CREATE TEMPORARY TABLE client_duplicates AS
+SELECT c.id, k.keep_id
+FROM clients c
+JOIN (
+    SELECT hostname, ip_address, port, MIN(id) AS keep_id
+    FROM clients
+    GROUP BY hostname, ip_address, port
+) k ON c.hostname = k.hostname AND c.ip_address = k.ip_address AND c.port = k.port
+WHERE c.id <> k.keep_id;
+
+UPDATE system_data s JOIN client_duplicates d ON s.client_id = d.id SET s.client_id = d.keep_id;
+UPDATE commands c JOIN client_duplicates d ON c.client_id = d.id SET c.client_id = d.keep_id;
+UPDATE screenshots s JOIN client_duplicates d ON s.client_id = d.id SET s.client_id = d.keep_id;
+UPDATE file_operations f JOIN client_duplicates d ON f.client_id = d.id SET f.client_id = d.keep_id;
+DELETE c FROM clients c JOIN client_duplicates d ON c.id = d.id;
+
+DROP TEMPORARY TABLE client_duplicates;
+
+ALTER TABLE clients ADD UNIQUE KEY uk_client_identity (hostname, ip_address, port);
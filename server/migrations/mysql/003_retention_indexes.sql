@@ -0,0 +1,4 @@
+-- 升级脚本：数据清理任务按客户端删除过期数据所用的索引
+
+ALTER TABLE screenshots ADD INDEX idx_screenshots_client_time (client_id, created_at);
+ALTER TABLE commands ADD INDEX idx_commands_client_time (client_id, created_at);
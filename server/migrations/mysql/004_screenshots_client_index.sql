@@ -0,0 +1,4 @@
+-- 升级脚本：截图列表按客户端分页的索引
+-- 外键自动建立的client_id索引在添加(client_id, created_at)索引后可能被MySQL删除，这里显式建立
+
+ALTER TABLE screenshots ADD INDEX idx_screenshots_client (client_id);
@@ -0,0 +1,19 @@
+-- 升级脚本：批量下发命令的任务表
+
+-- 命令任务表（一次批量下发对应一个任务，各状态数量随命令结果增量更新）
+CREATE TABLE IF NOT EXISTS command_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    command_type ENUM('shell', 'script_update', 'file_operation') NOT NULL,
+    command_content TEXT NOT NULL,
+    selector TEXT NULL,
+    total_count INT NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    executed_count INT NOT NULL DEFAULT 0,
+    failed_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE commands
+    ADD COLUMN job_id INT NULL,
+    ADD INDEX idx_commands_job (job_id),
+    ADD FOREIGN KEY (job_id) REFERENCES command_jobs(id) ON DELETE SET NULL;
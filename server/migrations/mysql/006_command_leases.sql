@@ -0,0 +1,10 @@
+-- 升级脚本：命令领取与租约（dispatched状态、租约到期时间、领取令牌）
+
+ALTER TABLE commands
+    MODIFY status ENUM('pending', 'dispatched', 'executed', 'failed') DEFAULT 'pending',
+    ADD COLUMN claim_token VARCHAR(32) NULL AFTER job_id,
+    ADD COLUMN lease_expires_at TIMESTAMP NULL AFTER claim_token,
+    ADD COLUMN attempts INT NOT NULL DEFAULT 0 AFTER lease_expires_at,
+    ADD INDEX idx_commands_status_lease (status, lease_expires_at);
+
+ALTER TABLE command_jobs ADD COLUMN dispatched_count INT NOT NULL DEFAULT 0 AFTER pending_count;
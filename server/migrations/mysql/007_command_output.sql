@@ -0,0 +1,5 @@
+-- 升级脚本：命令输出增量上报（结果列扩大为MEDIUMTEXT，记录已接收的输出长度）
+
+ALTER TABLE commands
+    MODIFY result MEDIUMTEXT,
+    ADD COLUMN output_size BIGINT NOT NULL DEFAULT 0 AFTER result;
@@ -0,0 +1,9 @@
+-- 升级脚本：命令历史查询索引（等值过滤列 + created_at，按时间倒序键集分页）
+
+ALTER TABLE commands
+    ADD INDEX idx_commands_time (created_at),
+    ADD INDEX idx_commands_client_status_time (client_id, status, created_at),
+    ADD INDEX idx_commands_status_time (status, created_at),
+    ADD INDEX idx_commands_type_time (command_type, created_at),
+    ADD INDEX idx_commands_job_time (job_id, created_at),
+    DROP INDEX idx_commands_job;
@@ -0,0 +1,5 @@
+-- 升级脚本：差分截图（只上传相对关键帧变化的图块，请求时再合成完整画面）
+
+ALTER TABLE screenshots
+    ADD COLUMN base_hash CHAR(64) NULL AFTER content_hash,
+    ADD COLUMN tiles TEXT NULL AFTER base_hash;
@@ -0,0 +1,20 @@
+-- 升级脚本：客户端身份唯一键（心跳原子upsert依赖此约束）
+-- 先将重复客户端的关联数据合并到ID最小的记录，再删除重复记录并添加唯一索引
+
+CREATE TEMP TABLE client_duplicates AS
+SELECT c.id, (
+    SELECT MIN(k.id) FROM clients k
+    WHERE k.hostname = c.hostname AND k.ip_address = c.ip_address AND k.port = c.port
+) AS keep_id
+FROM clients c;
+DELETE FROM client_duplicates WHERE id = keep_id;
+
+UPDATE system_data SET client_id = (SELECT keep_id FROM client_duplicates WHERE id = client_id) WHERE client_id IN (SELECT id FROM client_duplicates);
+UPDATE commands SET client_id = (SELECT keep_id FROM client_duplicates WHERE id = client_id) WHERE client_id IN (SELECT id FROM client_duplicates);
+UPDATE screenshots SET client_id = (SELECT keep_id FROM client_duplicates WHERE id = client_id) WHERE client_id IN (SELECT id FROM client_duplicates);
+UPDATE file_operations SET client_id = (SELECT keep_id FROM client_duplicates WHERE id = client_id) WHERE client_id IN (SELECT id FROM client_duplicates);
+DELETE FROM clients WHERE id IN (SELECT id FROM client_duplicates);
+
+DROP TABLE client_duplicates;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_client_identity ON clients (hostname, ip_address, port);
@@ -0,0 +1,58 @@
+-- 升级脚本：系统数据汇总表及按时间范围查询的索引
+-- 注意：汇总表只包含升级之后写入的数据
+
+CREATE INDEX IF NOT EXISTS idx_system_data_client_time ON system_data (client_id, created_at);
+
+-- 系统数据1分钟汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_1m (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 系统数据5分钟汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_5m (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+-- 系统数据1小时汇总表（每个时间桶的采样数及各指标的最小值/总和/最大值）
+CREATE TABLE IF NOT EXISTS system_data_1h (
+    client_id INT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INT NOT NULL,
+    cpu_min FLOAT NOT NULL,
+    cpu_sum DOUBLE NOT NULL,
+    cpu_max FLOAT NOT NULL,
+    memory_min FLOAT NOT NULL,
+    memory_sum DOUBLE NOT NULL,
+    memory_max FLOAT NOT NULL,
+    disk_min FLOAT NOT NULL,
+    disk_sum DOUBLE NOT NULL,
+    disk_max FLOAT NOT NULL,
+    PRIMARY KEY (client_id, bucket),
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
@@ -0,0 +1,4 @@
+-- 升级脚本：数据清理任务按客户端删除过期数据所用的索引
+
+CREATE INDEX IF NOT EXISTS idx_screenshots_client_time ON screenshots (client_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_client_time ON commands (client_id, created_at);
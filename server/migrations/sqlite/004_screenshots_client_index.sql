@@ -0,0 +1,3 @@
+-- 升级脚本：截图列表按客户端分页的索引
+
+CREATE INDEX IF NOT EXISTS idx_screenshots_client ON screenshots (client_id);
@@ -0,0 +1,18 @@
+-- 升级脚本：批量下发命令的任务表
+
+-- 命令任务表（一次批量下发对应一个任务，各状态数量随命令结果增量更新）
+CREATE TABLE IF NOT EXISTS command_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command_type TEXT NOT NULL CHECK (command_type IN ('shell', 'script_update', 'file_operation')),
+    command_content TEXT NOT NULL,
+    selector TEXT NULL,
+    total_count INT NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    executed_count INT NOT NULL DEFAULT 0,
+    failed_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+ALTER TABLE commands ADD COLUMN job_id INT NULL REFERENCES command_jobs(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_commands_job ON commands (job_id);
@@ -0,0 +1,30 @@
+-- 升级脚本：命令领取与租约（dispatched状态、租约到期时间、领取令牌）
+-- SQLite不支持修改CHECK约束，通过重建commands表实现
+
+CREATE TABLE commands_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INT NOT NULL,
+    command_type TEXT NOT NULL CHECK (command_type IN ('shell', 'script_update', 'file_operation')),
+    command_content TEXT NOT NULL,
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'dispatched', 'executed', 'failed')),
+    result TEXT,
+    job_id INT NULL REFERENCES command_jobs(id) ON DELETE SET NULL,
+    claim_token VARCHAR(32) NULL,
+    lease_expires_at TIMESTAMP NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    executed_at TIMESTAMP NULL,
+    FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE
+);
+
+INSERT INTO commands_new (id, client_id, command_type, command_content, status, result, job_id, created_at, executed_at)
+SELECT id, client_id, command_type, command_content, status, result, job_id, created_at, executed_at FROM commands;
+
+DROP TABLE commands;
+ALTER TABLE commands_new RENAME TO commands;
+
+CREATE INDEX IF NOT EXISTS idx_commands_client_time ON commands (client_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_job ON commands (job_id);
+CREATE INDEX IF NOT EXISTS idx_commands_status_lease ON commands (status, lease_expires_at);
+
+ALTER TABLE command_jobs ADD COLUMN dispatched_count INT NOT NULL DEFAULT 0;
@@ -0,0 +1,3 @@
+-- 升级脚本：命令输出增量上报（记录已接收的输出长度）
+
+ALTER TABLE commands ADD COLUMN output_size BIGINT NOT NULL DEFAULT 0;
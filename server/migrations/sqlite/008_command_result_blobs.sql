@@ -0,0 +1,4 @@
+-- 升级脚本：大命令结果存入内容寻址文件存储（表中只保留预览和文件摘要）
+
+ALTER TABLE commands ADD COLUMN result_blob CHAR(64) NULL;
+ALTER TABLE commands ADD COLUMN result_size BIGINT NULL;
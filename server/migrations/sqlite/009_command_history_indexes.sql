@@ -0,0 +1,8 @@
+-- 升级脚本：命令历史查询索引（等值过滤列 + created_at，按时间倒序键集分页）
+
+CREATE INDEX IF NOT EXISTS idx_commands_time ON commands (created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_client_status_time ON commands (client_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_status_time ON commands (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_type_time ON commands (command_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_job_time ON commands (job_id, created_at);
+DROP INDEX IF EXISTS idx_commands_job;
@@ -0,0 +1,4 @@
+-- 升级脚本：截图变化检测（画面指纹，画面未变化时只更新最后确认时间）
+
+ALTER TABLE screenshots ADD COLUMN fingerprint CHAR(16) NULL;
+ALTER TABLE screenshots ADD COLUMN last_seen_at TIMESTAMP NULL;
@@ -0,0 +1,10 @@
+-- 升级脚本：截图按内容哈希存储（相同截图只存一份，记录每个文件的引用数）
+
+CREATE TABLE IF NOT EXISTS screenshot_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    file_size INT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+ALTER TABLE screenshots ADD COLUMN content_hash CHAR(64) NULL;
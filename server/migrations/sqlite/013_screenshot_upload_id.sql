@@ -0,0 +1,4 @@
+-- 升级脚本：截图行记录上传凭据（唯一），重启后按描述文件重新写入时不会重复插入或重复增加引用数
+
+ALTER TABLE screenshots ADD COLUMN upload_id CHAR(32) NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS uk_screenshots_upload ON screenshots (upload_id);
@@ -0,0 +1,3 @@
+-- 升级脚本：回收截图文件时按引用数查找不再被引用的文件（ref_count <= 0）的索引
+
+CREATE INDEX IF NOT EXISTS idx_screenshot_blobs_ref_count ON screenshot_blobs (ref_count);
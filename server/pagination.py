@@ -0,0 +1,85 @@
+# 列表分页与条件请求模块
+
+import base64
+import datetime
+import hashlib
+import json
+from flask import request, jsonify, current_app
+
+def encode_cursor(row_id, key=None):
+    """将最后一行的ID（及排序键）编码为不透明的游标"""
+    payload = {'id': row_id}
+    if key is not None:
+        payload['key'] = key.isoformat() if hasattr(key, 'isoformat') else key
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """解析游标，返回上一页最后一行的ID，游标不合法时抛出ValueError"""
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['id'])
+    except (TypeError, KeyError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+def decode_time_cursor(cursor):
+    """解析按(时间, ID)排序的游标，返回上一页最后一行的(时间, ID)，游标不合法时抛出ValueError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.datetime.fromisoformat(payload['key']), int(payload['id'])
+    except (TypeError, KeyError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+def parse_page_args(allowed_fields, default_limit=None, max_limit=None, time_cursor=False):
+    """解析limit、cursor和fields参数，返回(列名列表, 每页行数, 游标ID)
+
+    fields为逗号分隔的列名，只能取allowed_fields中的列，id总会包含在内；参数不合法时抛出ValueError。
+    time_cursor为True时游标按(时间, ID)解析，返回的游标为(时间, ID)元组
+    """
+    default_limit = default_limit or current_app.config['PAGE_DEFAULT_LIMIT']
+    max_limit = max_limit or current_app.config['PAGE_MAX_LIMIT']
+
+    limit = int(request.args.get('limit', default_limit))
+    if limit <= 0:
+        raise ValueError('Invalid limit')
+    limit = min(limit, max_limit)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        after_id = decode_time_cursor(cursor) if time_cursor else decode_cursor(cursor)
+    else:
+        after_id = None
+
+    fields = request.args.get('fields')
+    if fields:
+        columns = [field.strip() for field in fields.split(',') if field.strip()]
+        if not columns or any(column not in allowed_fields for column in columns):
+            raise ValueError('Invalid fields')
+        if 'id' not in columns:
+            columns.insert(0, 'id')
+    else:
+        columns = list(allowed_fields)
+
+    return columns, limit, after_id
+
+def next_cursor(rows, limit, key=None):
+    """本页已满时返回下一页游标，否则返回None；key为与ID共同排序的列名"""
+    if rows and len(rows) >= limit:
+        return encode_cursor(rows[-1]['id'], rows[-1][key] if key else None)
+    return None
+
+def make_etag(*parts):
+    """根据数据版本和请求参数生成ETag"""
+    return hashlib.sha1(repr(parts + (request.path, request.query_string)).encode('utf-8')).hexdigest()[:24]
+
+def not_modified(etag):
+    """If-None-Match命中时返回304，否则返回None"""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def json_with_etag(payload, etag):
+    """返回带ETag的JSON响应"""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response
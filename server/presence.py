@@ -0,0 +1,213 @@
+# 客户端在线状态注册表模块
+
+import datetime
+import threading
+from collections import OrderedDict
+from server.cache import LRUCache
+
+class PresenceRegistry:
+    """进程内客户端在线状态注册表：心跳在内存中应答，变更定期批量写回clients表"""
+
+    def __init__(self, database, timeout, flush_interval, identity_cache_size=10000, events=None):
+        self._db = database
+        self._events = events  # 可选的EventBroker，在线状态变化时发布client_status事件
+        self._timeout = datetime.timedelta(seconds=timeout)
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._identities = LRUCache(identity_cache_size)  # (hostname, ip_address, port) -> client_id
+        self._heartbeats = {}  # client_id -> last_heartbeat
+        self._online = OrderedDict()  # 在线客户端，按最后心跳从旧到新排列：client_id -> last_heartbeat
+        self._dirty = {}  # 尚未写回数据库的心跳：client_id -> last_heartbeat
+        self._went_offline = set()  # 尚未写回数据库的下线客户端
+        self._loaded = False
+        self._version = 0  # 新增客户端或在线状态变化时递增
+        self._heartbeat_version = 0  # 每次心跳递增
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _ensure_loaded(self):
+        """首次使用时从数据库加载已有客户端，加载失败时下次重试"""
+        if self._loaded:
+            return
+        rows = self._db.execute_query("SELECT id, hostname, ip_address, port, status, last_heartbeat FROM clients")
+        if rows is None:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            cutoff = datetime.datetime.now() - self._timeout
+            for row in sorted(rows, key=lambda row: row['last_heartbeat'] or datetime.datetime.min):
+                self._identities.put((row['hostname'], row['ip_address'], row['port']), row['id'])
+                # 内存中较新的心跳优先
+                if row['id'] in self._heartbeats:
+                    continue
+                self._heartbeats[row['id']] = row['last_heartbeat']
+                if row['last_heartbeat'] is not None and row['last_heartbeat'] >= cutoff:
+                    self._online[row['id']] = row['last_heartbeat']
+                elif row['status'] == 'online':
+                    # 服务端停止期间超时的客户端，由写回线程更正状态
+                    self._went_offline.add(row['id'])
+            self._version += 1
+            self._loaded = True
+
+    def _register(self, key, now):
+        """身份缓存未命中：按唯一键原子upsert并返回客户端ID（一次写入，无需查询）"""
+        client_id = self._db.execute_upsert(
+            'clients',
+            ('hostname', 'ip_address', 'port', 'status', 'last_heartbeat'),
+            ('hostname', 'ip_address', 'port'),
+            {'status': '{new}', 'last_heartbeat': '{new}'},
+            key + ('online', now),
+            returning_id=True
+        )
+        if client_id is not None:
+            self._identities.put(key, client_id)
+            with self._lock:
+                self._version += 1
+        return client_id
+
+    def heartbeat(self, hostname, ip_address, port):
+        """记录一次心跳，返回客户端ID；身份缓存命中时不访问数据库"""
+        self._ensure_loaded()
+        key = (hostname, ip_address, port)
+        now = datetime.datetime.now()
+
+        client_id = self._identities.get(key)
+        if client_id is None:
+            client_id = self._register(key, now)
+            if client_id is None:
+                return None
+
+        with self._lock:
+            self._expire(now)
+            self._heartbeats[client_id] = now
+            if client_id in self._online:
+                self._online.move_to_end(client_id)
+                self._online[client_id] = now
+            else:
+                # 离线 -> 在线
+                self._online[client_id] = now
+                self._went_offline.discard(client_id)
+                self._version += 1
+                self._publish_status(client_id, 'online')
+            self._dirty[client_id] = now
+            self._heartbeat_version += 1
+        return client_id
+
+    def _expire(self, now):
+        """将心跳超时的客户端移出在线集合（调用方需持有锁），只检查队首已超时的客户端"""
+        cutoff = now - self._timeout
+        while self._online:
+            client_id, last_heartbeat = next(iter(self._online.items()))
+            if last_heartbeat >= cutoff:
+                break
+            # 在线 -> 离线
+            self._online.popitem(last=False)
+            self._went_offline.add(client_id)
+            self._version += 1
+            self._publish_status(client_id, 'offline')
+
+    def _publish_status(self, client_id, status):
+        """发布在线状态变化事件，附带最新的在线/离线数量（调用方需持有锁）"""
+        if self._events is None:
+            return
+        online_count = len(self._online)
+        self._events.publish('client_status', {
+            'client_id': client_id,
+            'status': status,
+            'last_heartbeat': self._heartbeats.get(client_id),
+            'online_count': online_count,
+            'offline_count': len(self._heartbeats) - online_count
+        })
+
+    def last_heartbeat(self, client_id):
+        """返回客户端最后心跳时间，未知客户端返回None"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._heartbeats.get(client_id)
+
+    def status(self, client_id):
+        """根据内存中的最后心跳时间判断客户端状态"""
+        last_heartbeat = self.last_heartbeat(client_id)
+        if last_heartbeat is None or datetime.datetime.now() - last_heartbeat > self._timeout:
+            return 'offline'
+        return 'online'
+
+    def stats(self):
+        """返回在线和离线客户端数量，由增量维护的在线集合得出，不访问数据库"""
+        self._ensure_loaded()
+        with self._lock:
+            self._expire(datetime.datetime.now())
+            online_count = len(self._online)
+            return online_count, len(self._heartbeats) - online_count
+
+    def online_clients(self):
+        """返回当前在线的客户端ID列表"""
+        self._ensure_loaded()
+        with self._lock:
+            self._expire(datetime.datetime.now())
+            return list(self._online)
+
+    def version(self, include_heartbeats=False):
+        """返回客户端列表的数据版本，用于生成ETag"""
+        self._ensure_loaded()
+        with self._lock:
+            self._expire(datetime.datetime.now())
+            if include_heartbeats:
+                return self._version, self._heartbeat_version
+            return self._version
+
+    def flush(self):
+        """将积累的心跳和下线状态在一个事务中批量写回clients表，返回写回的客户端数；
+        写回失败时放回待写回集合（保留较新的心跳），下次写回时重试，返回0
+        """
+        with self._lock:
+            self._expire(datetime.datetime.now())
+            dirty, self._dirty = self._dirty, {}
+            went_offline, self._went_offline = self._went_offline, set()
+        if not dirty and not went_offline:
+            return 0
+
+        def write(tx):
+            # 先写心跳再写下线状态，写回间隔内先心跳后超时的客户端最终为离线
+            if dirty:
+                tx.execute_many("UPDATE clients SET last_heartbeat = %s, status = 'online' WHERE id = %s",
+                                [(last_heartbeat, client_id) for client_id, last_heartbeat in dirty.items()])
+            if went_offline:
+                tx.execute_many("UPDATE clients SET status = 'offline' WHERE id = %s",
+                                [(client_id,) for client_id in went_offline])
+            return True
+
+        if self._db.transaction(write) is None:
+            with self._lock:
+                for client_id, last_heartbeat in dirty.items():
+                    if self._dirty.get(client_id, last_heartbeat) <= last_heartbeat:
+                        self._dirty[client_id] = last_heartbeat
+                # 期间重新上线的客户端不再写回下线状态
+                self._went_offline.update(client_id for client_id in went_offline if client_id not in self._online)
+            return 0
+        return len(dirty) + len(went_offline)
+
+    def _run(self):
+        """后台写回循环"""
+        while not self._stop_event.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"心跳写回错误: {e}")
+
+    def start(self):
+        """启动后台写回线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='presence_flusher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台写回线程并写回剩余心跳"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(self._flush_interval)
+        self.flush()
@@ -0,0 +1,96 @@
+# 预设命令目录缓存模块
+
+import json
+import time
+import datetime
+import hashlib
+import threading
+
+# 预设命令可写入的列
+PRESET_FIELDS = ('name', 'command', 'description')
+
+class PresetCatalog:
+    """进程内预设命令目录：整表缓存在内存中，按ID的查找为O(1)，通过本类修改时立即失效
+
+    版本号为目录内容的摘要，服务端重启后内容不变则版本不变；直接修改数据库的变更在ttl秒后生效。
+    """
+
+    def __init__(self, database, ttl=300):
+        self._db = database
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._presets = None  # 按ID排序的预设命令列表
+        self._by_id = {}
+        self._version = None
+        self._loaded_at = 0
+
+    def _load(self):
+        """从数据库加载整个目录，加载失败时保留旧的缓存（调用方持有锁）"""
+        rows = self._db.execute_query("SELECT * FROM preset_commands ORDER BY id ASC")
+        if rows is None:
+            return
+        digest = hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode('utf-8'))
+        self._presets = rows
+        self._by_id = {row['id']: row for row in rows}
+        self._version = digest.hexdigest()[:16]
+        self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        """缓存为空或已过期时重新加载（调用方持有锁）"""
+        if self._presets is None or time.monotonic() - self._loaded_at > self._ttl:
+            self._load()
+
+    def snapshot(self):
+        """返回(版本号, 预设命令列表)，数据库不可用且无缓存时返回(None, None)"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._version, self._presets
+
+    def version(self):
+        """返回当前目录版本号"""
+        return self.snapshot()[0]
+
+    def get(self, preset_id):
+        """按ID返回预设命令，不存在时返回None"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._by_id.get(preset_id)
+
+    def invalidate(self):
+        """目录已变化，下次访问时重新加载"""
+        with self._lock:
+            self._presets = None
+
+    def create(self, values):
+        """新增预设命令，返回新ID"""
+        columns = [field for field in PRESET_FIELDS if field in values]
+        preset_id = self._db.execute_insert(
+            f"INSERT INTO preset_commands ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            [values[column] for column in columns]
+        )
+        self.invalidate()
+        return preset_id
+
+    def update(self, preset_id, values):
+        """修改预设命令，返回是否找到该预设命令；数据库出错时返回None"""
+        columns = [field for field in PRESET_FIELDS if field in values]
+        assignments = ', '.join(f'{column} = %s' for column in columns)
+
+        def write(tx):
+            updated = tx.execute_update(
+                f"UPDATE preset_commands SET {assignments}, updated_at = %s WHERE id = %s",
+                [values[column] for column in columns] + [datetime.datetime.now(), preset_id]
+            )
+            # MySQL对内容未变化的行返回0，按ID确认是否存在
+            return bool(updated or tx.execute_query("SELECT id FROM preset_commands WHERE id = %s", (preset_id,)))
+
+        found = self._db.transaction(write)
+        self.invalidate()
+        return found
+
+    def delete(self, preset_id):
+        """删除预设命令，返回是否找到该预设命令；数据库出错时返回None"""
+        deleted = self._db.transaction(
+            lambda tx: bool(tx.execute_update("DELETE FROM preset_commands WHERE id = %s", (preset_id,))))
+        self.invalidate()
+        return deleted
@@ -0,0 +1,187 @@
+# 数据保留策略模块
+
+import os
+import datetime
+import threading
+import time
+
+class RetentionJob:
+    """后台数据清理任务：按保留天数逐个客户端分小批删除过期数据及其引用的截图文件
+
+    提供blobs时，每轮清理后回收不再被命令结果引用的内容寻址文件；
+    提供screenshots时，按内容哈希存储的截图减少引用数，引用数为0时删除文件；
+    每轮清理后回收引用数为0时因未到最短保留时间而保留的截图文件。
+    """
+
+    def __init__(self, database, app_config, blobs=None, screenshots=None):
+        self._db = database
+        self._blobs = blobs
+        self._screenshots = screenshots
+        self._blob_min_age = app_config['BLOB_GC_MIN_AGE']
+        self._interval = app_config['RETENTION_INTERVAL']
+        self._batch_size = app_config['RETENTION_BATCH_SIZE']
+        self._screenshot_dir = os.path.abspath(app_config['SCREENSHOT_DIR'])
+        # (表名, 保留天数)，天数为0表示永久保留
+        self._policies = (
+            ('system_data', app_config['RETENTION_SYSTEM_DATA_DAYS']),
+            ('system_data_1m', app_config['RETENTION_ROLLUP_1M_DAYS']),
+            ('system_data_5m', app_config['RETENTION_ROLLUP_5M_DAYS']),
+            ('system_data_1h', app_config['RETENTION_ROLLUP_1H_DAYS']),
+            ('screenshots', app_config['RETENTION_SCREENSHOTS_DAYS']),
+            ('commands', app_config['RETENTION_COMMANDS_DAYS']),
+        )
+        self.last_report = None
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        """执行一轮清理，返回各表回收的行数、分区数、文件数和字节数"""
+        with self._run_lock:
+            now = now or datetime.datetime.now()
+            started = time.monotonic()
+            tables = {}
+
+            for table, days in self._policies:
+                if days <= 0:
+                    continue
+                cutoff = now - datetime.timedelta(days=days)
+                reclaimed = {'rows': 0, 'partitions': 0, 'files': 0, 'bytes': 0}
+
+                # 支持分区的后端先整体删除系统数据已过期的时间分区；截图和命令逐行删除，
+                # 以便释放截图文件引用、跳过未完成的命令并更新任务计数
+                if table.startswith('system_data'):
+                    partitions, rows = self._db.drop_expired_partitions(table, cutoff)
+                    reclaimed['partitions'] += partitions
+                    reclaimed['rows'] += rows
+
+                if table.startswith('system_data_'):
+                    reclaimed['rows'] += self._prune_rollup(table, cutoff)
+                else:
+                    self._prune_table(table, cutoff, reclaimed)
+                tables[table] = reclaimed
+                if table == 'commands':
+                    tables['command_jobs'] = {'rows': self._prune_jobs(cutoff), 'partitions': 0, 'files': 0, 'bytes': 0}
+
+            report = {
+                'started_at': now,
+                'duration_ms': 0,
+                'tables': tables
+            }
+            if self._blobs is not None:
+                report['blobs'] = self._collect_blobs()
+            if self._screenshots is not None:
+                files, freed = self._screenshots.collect()
+                report['screenshot_blobs'] = {'files': files, 'bytes': freed}
+            report['duration_ms'] = round((time.monotonic() - started) * 1000, 3)
+            self.last_report = report
+            return report
+
+    def _prune_table(self, table, cutoff, reclaimed):
+        """按客户端沿(client_id, created_at)索引分批删除过期行"""
+        columns = 'id, file_path, content_hash, base_hash' if table == 'screenshots' else 'id'
+        # 仍在等待执行或执行中的命令不删除
+        condition = " AND status NOT IN ('pending', 'dispatched')" if table == 'commands' else ''
+        query = (f"SELECT {columns} FROM {table} WHERE client_id = %s AND created_at < %s{condition} "
+                 f"ORDER BY created_at ASC LIMIT %s")
+
+        for client in self._db.execute_query("SELECT id FROM clients") or []:
+            while True:
+                rows = self._db.execute_query(query, (client['id'], cutoff, self._batch_size))
+                if not rows:
+                    break
+
+                placeholders = ', '.join(['%s'] * len(rows))
+                deleted = self._db.execute_update(f"DELETE FROM {table} WHERE id IN ({placeholders})",
+                                                  [row['id'] for row in rows])
+                reclaimed['rows'] += deleted
+                if table == 'screenshots' and deleted:
+                    self._release_screenshots(rows, reclaimed)
+
+                if not deleted or len(rows) < self._batch_size:
+                    break
+
+    def _prune_jobs(self, cutoff):
+        """分批删除已过期且不再有命令的任务，返回删除的行数"""
+        query = ("SELECT id FROM command_jobs WHERE created_at < %s AND NOT EXISTS "
+                 "(SELECT 1 FROM commands WHERE commands.job_id = command_jobs.id) ORDER BY id ASC LIMIT %s")
+        deleted = 0
+        while True:
+            rows = self._db.execute_query(query, (cutoff, self._batch_size))
+            if not rows:
+                return deleted
+            placeholders = ', '.join(['%s'] * len(rows))
+            count = self._db.execute_update(f"DELETE FROM command_jobs WHERE id IN ({placeholders})",
+                                            [row['id'] for row in rows])
+            deleted += count
+            if not count or len(rows) < self._batch_size:
+                return deleted
+
+    def _prune_rollup(self, table, cutoff):
+        """按客户端分别删除汇总表中的过期时间桶（使用主键前缀）"""
+        clients = self._db.execute_query("SELECT id FROM clients") or []
+        deleted = 0
+        for client in clients:
+            deleted += self._db.execute_update(f"DELETE FROM {table} WHERE client_id = %s AND bucket < %s",
+                                               (client['id'], cutoff))
+        return deleted
+
+    def _collect_blobs(self):
+        """删除不再被命令结果引用的文件，返回回收的文件数和字节数；查询失败时跳过本轮"""
+        rows = self._db.execute_query("SELECT DISTINCT result_blob FROM commands WHERE result_blob IS NOT NULL")
+        if rows is None:
+            return {'files': 0, 'bytes': 0}
+        files, freed = self._blobs.collect({row['result_blob'] for row in rows}, self._blob_min_age)
+        return {'files': files, 'bytes': freed}
+
+    def _release_screenshots(self, rows, reclaimed):
+        """释放已删除截图行引用的文件：按内容哈希存储的减少引用数（差分截图同时释放关键帧），旧版本按文件名保存的直接删除"""
+        counts = {}
+        for row in rows:
+            if row['content_hash'] and self._screenshots is not None:
+                for digest in (row['content_hash'], row['base_hash']):
+                    if digest:
+                        counts[digest] = counts.get(digest, 0) + 1
+            elif not row['content_hash']:
+                self._remove_file(row['file_path'], reclaimed)
+        if counts:
+            files, freed = self._screenshots.release(counts)
+            reclaimed['files'] += files
+            reclaimed['bytes'] += freed
+
+    def _remove_file(self, file_path, reclaimed):
+        """删除截图目录下的文件并累计回收的空间"""
+        path = os.path.abspath(file_path)
+        if not path.startswith(self._screenshot_dir + os.sep):
+            return
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        reclaimed['files'] += 1
+        reclaimed['bytes'] += size
+
+    def _run(self):
+        """后台清理循环"""
+        while not self._stop_event.wait(self._interval):
+            try:
+                report = self.run_once()
+                total_rows = sum(item['rows'] for item in report['tables'].values())
+                total_bytes = sum(item['bytes'] for item in report['tables'].values())
+                print(f"数据清理完成: 删除{total_rows}行，回收截图{total_bytes}字节，耗时{report['duration_ms']}毫秒")
+            except Exception as e:
+                print(f"数据清理错误: {e}")
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='retention_job')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
@@ -0,0 +1,112 @@
+# 截图存储模块
+
+import os
+import json
+from server.blobs import BlobStore
+
+# 差分截图单次上传的最大图块数
+MAX_TILES = 65536
+
+class ScreenshotStore:
+    """截图存储：按内容哈希存入两级分片目录，相同截图只存一份，screenshot_blobs表记录每个文件的引用数
+
+    截图行的content_hash指向文件；引用数降为0且文件超过min_age未修改时删除文件和索引行，
+    未到时间的保留引用数为0的索引行，由collect定期回收。
+    """
+
+    def __init__(self, database, root, min_age=3600):
+        self._db = database
+        self.blobs = BlobStore(root, depth=2)
+        self._min_age = min_age  # 引用数降为0后，文件至少保留的未修改时间（秒）
+
+    def add_refs(self, entries, database=None):
+        """按{内容哈希: (文件大小, 新增引用数)}增加引用数（文件须已写入），返回是否成功；
+        database为Transaction时在该事务中执行
+        """
+        # 先写文件再增加引用，与回收并发时不会删除刚被引用的文件
+        return bool((database or self._db).execute_upsert_many(
+            'screenshot_blobs', ('content_hash', 'file_size', 'ref_count'), ('content_hash',),
+            {'ref_count': 'ref_count + {new}'},
+            [(digest, file_size, count) for digest, (file_size, count) in entries.items()]
+        ))
+
+    def retain(self, digest):
+        """增加已有文件的引用数（差分截图引用关键帧），文件已无引用或已被回收时返回False"""
+        return bool(self._db.execute_update(
+            "UPDATE screenshot_blobs SET ref_count = ref_count + 1 WHERE content_hash = %s AND ref_count > 0", (digest,)))
+
+    def release(self, counts):
+        """按{内容哈希: 删除的截图行数}减少引用数，删除不再被引用的文件，返回(删除的文件数, 释放的字节数)"""
+        for digest, count in counts.items():
+            self._db.execute_update(
+                "UPDATE screenshot_blobs SET ref_count = ref_count - %s WHERE content_hash = %s", (count, digest))
+        return self.collect(list(counts))
+
+    def collect(self, digests=None, now=None):
+        """回收引用数为0且超过min_age未修改的文件及其索引行（digests为None时检查所有引用数为0的索引行），
+        返回(删除的文件数, 释放的字节数)
+        """
+        if digests is None:
+            rows = self._db.execute_query("SELECT content_hash FROM screenshot_blobs WHERE ref_count <= 0") or []
+            digests = [row['content_hash'] for row in rows]
+        files = freed = 0
+        for digest in digests:
+            rows = self._db.execute_query(
+                "SELECT content_hash FROM screenshot_blobs WHERE content_hash = %s AND ref_count <= 0", (digest,))
+            if not rows:
+                continue
+            # 未到时间的文件连同索引行保留到下次回收；文件已不存在时只删除索引行
+            path = self.blobs.path(digest)
+            size = self.blobs.delete_if_idle(digest, self._min_age, now)
+            if not size and path and os.path.exists(path):
+                continue
+            # 以引用数为条件删除，并发上传相同截图时索引行保留（上传会先重新写入文件）
+            self._db.execute_update("DELETE FROM screenshot_blobs WHERE content_hash = %s AND ref_count <= 0", (digest,))
+            if size:
+                files += 1
+                freed += size
+        return files, freed
+
+    def resolve(self, name):
+        """根据下载名（内容哈希，可带扩展名）查索引返回文件路径，不是内容哈希或索引中不存在时返回None"""
+        digest = name.split('.', 1)[0]
+        path = self.blobs.path(digest)
+        if path is None:
+            return None
+        rows = self._db.execute_query(
+            "SELECT content_hash FROM screenshot_blobs WHERE content_hash = %s AND ref_count > 0", (digest,))
+        return path if rows else None
+
+def parse_tiles(text):
+    """解析差分截图的图块描述，返回{'tile': 图块边长, 'cols': 拼图列数, 'boxes': [[x, y, 宽, 高], ...]}
+
+    第i个图块在上传的拼图中位于(i % cols * tile, i // cols * tile)，合成时贴到关键帧的(x, y)；格式不合法时抛出ValueError
+    """
+    try:
+        tiles = json.loads(text or '')
+    except ValueError:
+        raise ValueError('Invalid tiles')
+    if not isinstance(tiles, dict):
+        raise ValueError('Invalid tiles')
+    tile, cols, boxes = tiles.get('tile'), tiles.get('cols'), tiles.get('boxes')
+    if not isinstance(tile, int) or not 8 <= tile <= 1024 or not isinstance(cols, int) or cols < 1:
+        raise ValueError('Invalid tile layout')
+    if not isinstance(boxes, list) or not 0 < len(boxes) <= MAX_TILES:
+        raise ValueError('Invalid tile count')
+    for box in boxes:
+        if (not isinstance(box, list) or len(box) != 4 or not all(isinstance(value, int) for value in box)
+                or box[0] < 0 or box[1] < 0 or not 0 < box[2] <= tile or not 0 < box[3] <= tile):
+            raise ValueError('Invalid tile box')
+    return {'tile': tile, 'cols': cols, 'boxes': boxes}
+
+def image_mimetype(path):
+    """根据文件头判断截图格式"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    if header.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if header.startswith(b'\x89PNG'):
+        return 'image/png'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
@@ -0,0 +1,218 @@
+# 截图缩略图模块
+
+import os
+import queue
+import tempfile
+import threading
+from io import BytesIO
+from collections import OrderedDict
+
+# Pillow为可选依赖，未安装时不生成缩略图
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 缩略图规格：名称 -> 最长边像素数（full为原图）
+RENDITIONS = {'small': 320, 'medium': 1280}
+
+# 差分截图合成的完整画面的JPEG质量
+FRAME_QUALITY = 95
+
+class ThumbnailCache:
+    """截图缩略图缓存：上传后由后台线程生成各规格的JPEG缩略图，保存在有界的磁盘缓存中
+
+    缩略图按规格和内容哈希存放（root/规格/ab/哈希.jpg），内容不会变化；缓存总大小超过max_bytes时
+    淘汰最久未访问的文件，被淘汰或尚未生成的缩略图在请求时同步生成。
+    差分截图合成的完整画面也保存在缓存中（规格为frame）。
+    """
+
+    def __init__(self, root, max_bytes, quality=80, queue_size=1000):
+        self.root = os.path.abspath(root)
+        self._max_bytes = max_bytes
+        self._quality = quality
+        self._entries = OrderedDict()  # 路径 -> 字节数，按访问顺序排列
+        self._total = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._load()
+
+    @property
+    def available(self):
+        """是否可以生成缩略图（已安装Pillow）"""
+        return Image is not None
+
+    def path(self, size, digest):
+        """返回缩略图文件路径"""
+        return os.path.join(self.root, size, digest[:2], digest + '.jpg')
+
+    def get(self, size, source_path, digest):
+        """返回缩略图路径，缓存中没有时同步生成；无法生成时返回None"""
+        path = self.path(size, digest)
+        if self._cached(path):
+            return path
+        return self._render(size, source_path, digest)
+
+    def frame(self, key, base_path, delta_path, tiles):
+        """返回差分截图合成的完整画面路径，缓存中没有时把拼图中的图块贴到关键帧上生成；无法生成时返回None"""
+        path = self.path('frame', key)
+        if self._cached(path):
+            return path
+        if not self.available:
+            return None
+        tile, cols = tiles['tile'], tiles['cols']
+        try:
+            with Image.open(base_path) as base, Image.open(delta_path) as atlas:
+                image = base.convert('RGB')
+                atlas = atlas.convert('RGB')
+                for index, (x, y, width, height) in enumerate(tiles['boxes']):
+                    left, top = index % cols * tile, index // cols * tile
+                    image.paste(atlas.crop((left, top, left + width, top + height)), (x, y))
+        except (OSError, ValueError) as e:
+            print(f"合成差分截图失败: {key} {e}")
+            return None
+        return self._save(path, image, FRAME_QUALITY)
+
+    def submit(self, source_path, digest):
+        """提交一张新截图，由后台线程生成各规格缩略图；队列已满时跳过，请求时再生成"""
+        if not self.available:
+            return
+        try:
+            self._queue.put_nowait((source_path, digest))
+        except queue.Full:
+            pass
+
+    def stats(self):
+        """返回缓存指标"""
+        with self._lock:
+            return {'files': len(self._entries), 'bytes': self._total, 'max_bytes': self._max_bytes,
+                    'pending': self._queue.qsize()}
+
+    def _render(self, size, source_path, digest):
+        """生成一个规格的缩略图并加入缓存，返回路径；原图无法解码时返回None"""
+        if not self.available or size not in RENDITIONS:
+            return None
+        limit = RENDITIONS[size]
+        try:
+            with Image.open(source_path) as image:
+                # JPEG按目标尺寸缩小解码，避免先解码全尺寸原图
+                image.draft('RGB', (limit, limit))
+                image = image.convert('RGB')
+                image.thumbnail((limit, limit), Image.LANCZOS)
+        except (OSError, ValueError) as e:
+            print(f"生成缩略图失败: {digest} {size} {e}")
+            return None
+        return self._save(self.path(size, digest), image, self._quality)
+
+    def _cached(self, path):
+        """缓存中是否有该文件，有时将其移到最近访问的位置"""
+        with self._lock:
+            cached = path in self._entries
+            if cached:
+                self._entries.move_to_end(path)
+        return cached and os.path.isfile(path)
+
+    def _save(self, path, image, quality):
+        """把图片编码为JPEG写入缓存，返回路径"""
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self._add(path, buffer.tell())
+        return path
+
+    def _add(self, path, size):
+        """记录缓存文件，超出上限时淘汰最久未访问的文件（至少保留刚写入的文件）"""
+        evicted = []
+        with self._lock:
+            self._total += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self._total > self._max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def _load(self):
+        """启动时扫描已有的缩略图，按修改时间恢复访问顺序"""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.startswith('.tmp-'):
+                    # 上次退出时未完成的临时文件
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._add(path, size)
+
+    def _run(self):
+        """后台生成循环，收到None时退出"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            source_path, digest = item
+            for size in RENDITIONS:
+                try:
+                    self.get(size, source_path, digest)
+                except Exception as e:
+                    print(f"生成缩略图错误: {e}")
+
+    def start(self):
+        """启动后台生成线程"""
+        if not self.available or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name='thumbnail_worker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台生成线程"""
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+def rendition_urls(screenshot, url, frame_url):
+    """返回截图各规格的地址，url(filename, size)生成下载地址，frame_url(截图ID, size)生成差分截图的合成画面地址；
+    旧版本截图只有原图
+    """
+    if screenshot.get('base_hash') and screenshot.get('id'):
+        urls = {size: frame_url(screenshot['id'], size) for size in RENDITIONS}
+        urls['full'] = frame_url(screenshot['id'], None)
+        return urls
+    content_hash = screenshot.get('content_hash')
+    if not content_hash:
+        file_path = screenshot.get('file_path')
+        if not file_path:
+            return None
+        full = url(os.path.basename(file_path), None)
+        return {'small': full, 'medium': full, 'full': full}
+    urls = {size: url(content_hash, size) for size in RENDITIONS}
+    urls['full'] = url(content_hash, None)
+    return urls
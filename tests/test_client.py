@@ -3,13 +3,22 @@
 import unittest
 import sys
 import os
+import io
+import time
+import threading
+from unittest import mock
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from client.system_info import SystemInfo
-from client.screenshot import Screenshot
+from client.screenshot import Screenshot, CaptureSession
 from client.logger import logger
+from client.metric_buffer import MetricBuffer
+from client.lease_keeper import LeaseKeeper
+from client.command_pool import CommandPool
+from client.output_stream import OutputStreamer
+from client.command_executor import CommandExecutor
 
 class TestClientModules(unittest.TestCase):
     """客户端模块测试类"""
@@ -42,6 +51,101 @@ class TestClientModules(unittest.TestCase):
         self.assertGreaterEqual(system_data['disk_usage'], 0)
         self.assertLessEqual(system_data['disk_usage'], 100)
     
+    def test_screenshot_fingerprint(self):
+        """测试画面指纹：相同画面指纹相同，细微变化相差很少的位数，画面切换相差很多位"""
+        try:
+            from PIL import Image, ImageDraw
+        except ImportError:
+            self.skipTest('Pillow未安装')
+        
+        def render(text, shade):
+            image = Image.new('RGB', (640, 480), (shade, shade, shade))
+            draw = ImageDraw.Draw(image)
+            draw.rectangle((0, 0, 320, 480), fill=(255 - shade, 40, 40))
+            draw.text((500, 460), text, fill=(0, 0, 0))
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG')
+            return buffer.getvalue()
+        
+        base = Screenshot.fingerprint(render('12:00', 200))
+        self.assertEqual(base, Screenshot.fingerprint(render('12:00', 200)))
+        self.assertLessEqual(Screenshot.fingerprint_distance(base, Screenshot.fingerprint(render('12:01', 200))), 4)
+        self.assertGreater(Screenshot.fingerprint_distance(base, Screenshot.fingerprint(render('12:00', 30))), 4)
+    
+    def test_capture_session_fallback(self):
+        """测试截图失败的后端移到末尾，之后的截图直接使用成功的后端"""
+        class Backend:
+            def __init__(self, name, result):
+                self.name = name
+                self.result = result
+                self.calls = 0
+            
+            def capture(self):
+                self.calls += 1
+                if isinstance(self.result, Exception):
+                    raise self.result
+                return self.result
+        
+        broken = Backend('pyqt5', RuntimeError('no display'))
+        scrot = Backend('scrot', b'image')
+        session = CaptureSession([broken, scrot])
+        self.assertEqual(session.capture(), b'image')
+        self.assertEqual(session.backends, ['scrot', 'pyqt5'])
+        self.assertEqual(session.capture(), b'image')
+        self.assertEqual((broken.calls, scrot.calls), (1, 2))
+        
+        # 所有后端都失败时返回None
+        scrot.result = b''
+        self.assertIsNone(session.capture())
+    
+    def test_screenshot_tiles(self):
+        """测试图块差分：只有变化区域所在的图块被打包，坐标与画面中的位置一致"""
+        try:
+            from PIL import Image, ImageDraw
+        except ImportError:
+            self.skipTest('Pillow未安装')
+        
+        def render(clock):
+            image = Image.new('RGB', (200, 130), (30, 60, 90))
+            ImageDraw.Draw(image).rectangle((150, 100, 199, 129), fill=clock)
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG')
+            return buffer.getvalue()
+        
+        size, base = Screenshot.tile_digests(render((0, 0, 0)), 64)
+        self.assertEqual((size, len(base)), ((200, 130), 12))
+        frame = render((255, 255, 255))
+        changed = Screenshot.changed_tiles(Screenshot.tile_digests(frame, 64)[1], base)
+        self.assertEqual(changed, [6, 7, 10, 11])
+        
+        data, tiles = Screenshot.pack_tiles(frame, changed, 64)
+        self.assertEqual(tiles['cols'], 2)
+        self.assertEqual(tiles['boxes'], [[128, 64, 64, 64], [192, 64, 8, 64], [128, 128, 64, 2], [192, 128, 8, 2]])
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (128, 128))
+    
+    def test_compress_image_budget(self):
+        """测试压缩结果不超过大小上限：质量足够时保持原分辨率，最低质量仍超限时缩小分辨率"""
+        try:
+            from PIL import Image
+        except ImportError:
+            self.skipTest('Pillow未安装')
+        
+        image = Image.effect_noise((800, 600), 60).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        Screenshot._last_quality, Screenshot._last_scale = None, 1.0
+        
+        data = Screenshot.compress_image(buffer.getvalue(), max_size=200 * 1024)
+        self.assertLessEqual(len(data), 200 * 1024)
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (800, 600))
+        
+        data = Screenshot.compress_image(buffer.getvalue(), max_size=20 * 1024)
+        self.assertLessEqual(len(data), 20 * 1024)
+        width, height = Image.open(io.BytesIO(data)).size
+        self.assertLess(width, 800)
+        self.assertAlmostEqual(width / height, 800 / 600, places=1)
+        Screenshot._last_quality, Screenshot._last_scale = None, 1.0
+    
     def test_screenshot(self):
         """测试截图模块"""
         # 注意：截图功能需要在有图形界面的环境下测试
@@ -72,5 +176,112 @@ class TestClientModules(unittest.TestCase):
             self.assertGreaterEqual(int(part), 0)
             self.assertLessEqual(int(part), 255)
 
+    def test_metric_buffer(self):
+        """测试系统数据缓冲按条数触发上传，失败时保留采样"""
+        buffer = MetricBuffer(batch_size=3, max_age=300, max_size=4)
+        buffer.add(1, 10.0, 20.0, 30.0)
+        buffer.add(1, 11.0, 21.0, 31.0)
+        self.assertFalse(buffer.should_flush())
+        buffer.add(1, 12.0, 22.0, 32.0)
+        self.assertTrue(buffer.should_flush())
+        
+        self.assertFalse(buffer.flush(lambda samples: False))
+        self.assertEqual(len(buffer), 3)
+        
+        uploaded = []
+        self.assertTrue(buffer.flush(lambda samples: uploaded.extend(samples) or True))
+        self.assertEqual([sample['cpu_usage'] for sample in uploaded], [10.0, 11.0, 12.0])
+        self.assertEqual(len(buffer), 0)
+    
+    def test_metric_buffer_age(self):
+        """测试系统数据缓冲按时间触发上传"""
+        buffer = MetricBuffer(batch_size=100, max_age=60, max_size=100)
+        buffer.add(1, 10.0, 20.0, 30.0, timestamp=1000)
+        self.assertFalse(buffer.should_flush(now=1030))
+        self.assertTrue(buffer.should_flush(now=1060))
+    
+    def test_lease_keeper(self):
+        """测试到期续约，租约失效时放弃命令，请求失败时保留等待重试"""
+        results = {1: True, 2: False, 3: None}
+        renewed = []
+        keeper = LeaseKeeper(lambda command_id, token: renewed.append(command_id) or results[command_id])
+        for command_id in results:
+            keeper.add(command_id, f'token-{command_id}', 30)
+        
+        self.assertEqual(keeper.renew_due(now=0), [])
+        self.assertEqual(renewed, [])
+        self.assertEqual(keeper.renew_due(now=time.time() + 10), [2])
+        self.assertEqual(sorted(renewed), [1, 2, 3])
+        self.assertTrue(keeper.holds(1))
+        self.assertFalse(keeper.holds(2))
+        self.assertTrue(keeper.holds(3))
+        
+        keeper.remove(1)
+        self.assertFalse(keeper.holds(1))
+    
+    def test_command_pool(self):
+        """测试命令并发执行、按完成顺序上报，独占命令不与其他命令同时执行"""
+        lock = threading.Lock()
+        running = []
+        overlaps = []
+        reported = []
+        
+        def execute(command):
+            with lock:
+                running.append(command['command_type'])
+                if 'script_update' in running and len(running) > 1:
+                    overlaps.append(list(running))
+            time.sleep(command['duration'])
+            with lock:
+                running.remove(command['command_type'])
+            return 'executed', str(command['id'])
+        
+        pool = CommandPool(execute, lambda command, status, result: reported.append(command['id']), 4,
+                           {'shell': 2, 'script_update': 1}, exclusive_types=('script_update',))
+        commands = [
+            {'id': 1, 'command_type': 'shell', 'duration': 0.3},
+            {'id': 2, 'command_type': 'shell', 'duration': 0.05},
+            {'id': 3, 'command_type': 'script_update', 'duration': 0.05},
+            {'id': 4, 'command_type': 'shell', 'duration': 0.05},
+        ]
+        for command in commands:
+            pool.submit(command)
+        self.assertTrue(pool.wait_idle(timeout=5))
+        pool.shutdown()
+        
+        self.assertEqual(reported, [2, 1, 3, 4])
+        self.assertEqual(overlaps, [])
+    
+    def test_output_streamer(self):
+        """测试shell命令输出边执行边上报，超时时保留已产生的输出，响应丢失后不重复上报"""
+        received = []
+        lose_response = [True]
+        
+        def send(offset, data):
+            accepted = offset == len(''.join(received))
+            if accepted:
+                received.append(data)
+            if lose_response[0]:
+                # 第一次请求已写入但响应丢失
+                lose_response[0] = False
+                return None
+            return accepted, len(''.join(received))
+        
+        output = OutputStreamer(send, chunk_size=4)
+        result = CommandExecutor._execute_shell_command('echo start; sleep 5; echo end', timeout=1, output=output)
+        self.assertEqual(''.join(received), 'start\n')
+        self.assertEqual(result, '\n命令执行超时（1秒）')
+        
+        result = CommandExecutor._execute_shell_command('echo out; exit 3', timeout=5)
+        self.assertEqual(result, '命令执行失败，退出码: 3，输出: out')
+
+    def test_unflushed_output_goes_into_result(self):
+        """测试最后的输出多次上报失败时放入命令结果，不丢失"""
+        output = OutputStreamer(lambda offset, data: None)
+        with mock.patch('client.command_executor.time.sleep'):
+            result = CommandExecutor._execute_shell_command('echo out; exit 3', timeout=5, output=output)
+        self.assertEqual(result, 'out\n\n命令执行失败，退出码: 3')
+        self.assertEqual(output.drain(100), '')
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,12 +3,49 @@
 import unittest
 import sys
 import os
+import threading
+import time
+import datetime
+import io
+import gzip
+import json
+import tempfile
+from unittest import mock
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# 使用测试配置（默认为嵌入式SQLite，无需MySQL服务）
+os.environ.setdefault('SERVER_CONFIG', 'testing')
+
+from server.config import config
+if config['testing'].DB_ENGINE == 'sqlite':
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(config['testing'].SQLITE_PATH + suffix):
+            os.remove(config['testing'].SQLITE_PATH + suffix)
+
 from server.app import app
-from server.database import db
+from server.database import db, ConnectionPool, PoolTimeoutError, SQLiteDatabase
+from server.presence import PresenceRegistry
+from server.blobs import BlobStore
+from server.screenshots import ScreenshotStore
+from server.ingest import ScreenshotIngest, UploadTooLarge
+from server.thumbnails import ThumbnailCache, Image
+from server.cache import LRUCache
+from server.retention import RetentionJob
+from server.events import EventBroker
+from server.commands import (CommandNotifier, LeaseReaper, create_job, spill_result, discard_result,
+                             record_result)
+
+def wait_for_upload(client, response, timeout=5):
+    """按上传接口返回的凭据等待截图写入数据库，返回查询结果（含截图ID）"""
+    upload_id = response.get_json()['upload_id']
+    deadline = time.monotonic() + timeout
+    while True:
+        result = client.get(f'/api/screenshots/uploads/{upload_id}')
+        if result.status_code != 202 or time.monotonic() > deadline:
+            return result.get_json()
+        time.sleep(0.01)
 
 class TestServerAPI(unittest.TestCase):
     """服务端API测试类"""
@@ -18,8 +55,7 @@ class TestServerAPI(unittest.TestCase):
         app.config['TESTING'] = True
         self.client = app.test_client()
         
-        # 初始化数据库
-        # 注意：实际测试中应该使用测试数据库
+        # 初始化数据库（测试配置使用独立的测试数据库）
         db.connect()
     
     def tearDown(self):
@@ -63,6 +99,59 @@ class TestServerAPI(unittest.TestCase):
         self.assertEqual(data['status'], 'ok')
         self.assertIsInstance(data['clients'], list)
     
+    def test_get_clients_pagination(self):
+        """测试客户端列表的游标分页和列投影"""
+        for index in range(3):
+            self.client.post('/api/heartbeat', json={
+                'hostname': f'page-host-{index}',
+                'ip_address': '127.0.0.1',
+                'port': 5000
+            })
+        
+        seen = []
+        url = '/api/clients?limit=2&fields=hostname,status'
+        while url:
+            data = self.client.get(url).get_json()
+            self.assertLessEqual(len(data['clients']), 2)
+            for client in data['clients']:
+                self.assertEqual(set(client), {'id', 'hostname', 'status'})
+            seen.extend(client['id'] for client in data['clients'])
+            url = f"/api/clients?limit=2&fields=hostname,status&cursor={data['next_cursor']}" if data['next_cursor'] else None
+        
+        self.assertEqual(seen, sorted(set(seen)))
+        self.assertEqual(self.client.get('/api/clients?fields=password').status_code, 400)
+        self.assertEqual(self.client.get('/api/clients?cursor=bad').status_code, 400)
+    
+    def test_conditional_get(self):
+        """测试列表未变化时返回304"""
+        heartbeat_response = self.client.post('/api/heartbeat', json={
+            'hostname': 'etag-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        })
+        client_id = heartbeat_response.get_json()['client_id']
+        
+        response = self.client.get(f'/api/screenshots/{client_id}')
+        etag = response.headers['ETag']
+        response = self.client.get(f'/api/screenshots/{client_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        response = self.client.get('/api/clients?fields=hostname,status')
+        etag = response.headers['ETag']
+        response = self.client.get('/api/clients?fields=hostname,status', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        self.client.post('/api/system_data', json={
+            'client_id': client_id, 'cpu_usage': 1.0, 'memory_usage': 2.0, 'disk_usage': 3.0
+        })
+        response = self.client.get(f'/api/system_data/{client_id}')
+        etag = response.headers['ETag']
+        self.client.post('/api/system_data', json={
+            'client_id': client_id, 'cpu_usage': 1.0, 'memory_usage': 2.0, 'disk_usage': 3.0
+        })
+        response = self.client.get(f'/api/system_data/{client_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+    
     def test_upload_system_data(self):
         """测试上传系统数据接口"""
         # 先发送一个心跳，获取客户端ID
@@ -85,6 +174,63 @@ class TestServerAPI(unittest.TestCase):
         data = response.get_json()
         self.assertEqual(data['status'], 'ok')
     
+    def test_upload_system_data_batch(self):
+        """测试批量上传系统数据接口"""
+        heartbeat_response = self.client.post('/api/heartbeat', json={
+            'hostname': 'test-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        })
+        client_id = heartbeat_response.get_json()['client_id']
+        
+        samples = [{'cpu_usage': i, 'memory_usage': 50.0, 'disk_usage': 60.0, 'timestamp': 1700000000 + i * 30}
+                   for i in range(20)]
+        samples.append({'cpu_usage': 1.0})
+        response = self.client.post('/api/system_data/batch', json={'client_id': client_id, 'samples': samples})
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['inserted'], 20)
+        self.assertEqual(data['rejected'], 1)
+        
+        rows = db.execute_query("SELECT COUNT(*) AS count FROM system_data WHERE client_id = %s AND created_at = %s",
+                                (client_id, datetime.datetime.fromtimestamp(1700000000)))
+        self.assertEqual(rows[0]['count'], 1)
+    
+    def test_system_data_rollups(self):
+        """测试汇总表增量更新及按时间范围选择粒度"""
+        heartbeat_response = self.client.post('/api/heartbeat', json={
+            'hostname': 'rollup-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        })
+        client_id = heartbeat_response.get_json()['client_id']
+        
+        # 2小时内每30秒一条采样，分两批上传
+        base = 1700006400
+        samples = [{'cpu_usage': i % 10, 'memory_usage': 50.0, 'disk_usage': 60.0, 'timestamp': base + i * 30}
+                   for i in range(240)]
+        self.client.post('/api/system_data/batch', json={'client_id': client_id, 'samples': samples[:100]})
+        self.client.post('/api/system_data/batch', json={'client_id': client_id, 'samples': samples[100:]})
+        
+        rows = db.execute_query("SELECT SUM(samples) AS samples, MIN(cpu_min) AS cpu_min, MAX(cpu_max) AS cpu_max "
+                                "FROM system_data_5m WHERE client_id = %s", (client_id,))
+        self.assertEqual(rows[0]['samples'], 240)
+        self.assertEqual(rows[0]['cpu_min'], 0)
+        self.assertEqual(rows[0]['cpu_max'], 9)
+        
+        response = self.client.get(f'/api/system_data/{client_id}?start={base}&end={base + 7200}&points=20')
+        data = response.get_json()
+        self.assertEqual(data['resolution'], 300)
+        self.assertEqual(len(data['system_data']), 24)
+        self.assertEqual(data['system_data'][0]['samples'], 10)
+        self.assertAlmostEqual(data['system_data'][0]['cpu_usage'], 4.5)
+        
+        response = self.client.get(f'/api/system_data/{client_id}?start={base}&end={base + 600}&points=100')
+        data = response.get_json()
+        self.assertEqual(data['resolution'], 0)
+        self.assertEqual(len(data['system_data']), 20)
+    
     def test_get_client_stats(self):
         """测试获取客户端统计接口"""
         # 先发送一个心跳，添加一个客户端
@@ -102,6 +248,413 @@ class TestServerAPI(unittest.TestCase):
         self.assertIn('online_count', data)
         self.assertIn('offline_count', data)
     
+    def test_event_stream(self):
+        """测试事件流推送新的系统数据点"""
+        heartbeat_response = self.client.post('/api/heartbeat', json={
+            'hostname': 'events-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        })
+        client_id = heartbeat_response.get_json()['client_id']
+        
+        response = self.client.get('/api/events', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        
+        self.client.post('/api/system_data', json={
+            'client_id': client_id, 'cpu_usage': 1.0, 'memory_usage': 2.0, 'disk_usage': 3.0
+        })
+        frame = next(stream).decode('utf-8')
+        self.assertIn('event: system_data', frame)
+        self.assertIn(f'"client_id": {client_id}', frame)
+        response.close()
+    
+    def test_long_poll_pending_commands(self):
+        """测试长轮询请求在下发命令后立即返回，超时返回空列表"""
+        heartbeat_response = self.client.post('/api/heartbeat', json={
+            'hostname': 'long-poll-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        })
+        client_id = heartbeat_response.get_json()['client_id']
+        
+        started = time.monotonic()
+        response = self.client.get(f'/api/commands/pending/{client_id}?wait=0.2')
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(response.get_json()['commands'], [])
+        for wait in ('nan', 'inf', 'abc'):
+            self.assertEqual(self.client.get(f'/api/commands/pending/{client_id}?wait={wait}').status_code, 400)
+        
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            app.test_client().get(f'/api/commands/pending/{client_id}?wait=10').get_json()))
+        started = time.monotonic()
+        waiter.start()
+        time.sleep(0.1)
+        self.client.post('/api/commands', json={
+            'client_id': client_id, 'command_type': 'shell', 'command_content': 'echo hi'
+        })
+        waiter.join()
+        
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([command['command_content'] for command in results[0]['commands']], ['echo hi'])
+    
+    def test_command_batch_job(self):
+        """测试批量下发命令创建任务，任务计数随执行结果更新"""
+        client_ids = [self.client.post('/api/heartbeat', json={
+            'hostname': f'fleet_host-{index}',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id'] for index in range(3)]
+        
+        response = self.client.post('/api/commands/batch', json={
+            'command_type': 'shell', 'command_content': 'uptime',
+            'selector': {'hostname': 'fleet_host-*', 'online': True}
+        })
+        self.assertEqual(response.status_code, 201)
+        job_id = response.get_json()['job_id']
+        self.assertEqual(response.get_json()['total_count'], 3)
+        
+        commands = self.client.get(f'/api/commands/pending/{client_ids[0]}').get_json()['commands']
+        command_id = [command['id'] for command in commands if command['job_id'] == job_id][0]
+        self.client.post(f'/api/commands/result/{command_id}', json={'status': 'executed', 'result': 'ok'})
+        self.client.post(f'/api/commands/result/{command_id}', json={'status': 'executed', 'result': 'ok'})
+        
+        job = self.client.get(f'/api/commands/jobs/{job_id}').get_json()['job']
+        self.assertEqual((job['total_count'], job['pending_count'], job['executed_count'], job['failed_count']),
+                         (3, 2, 1, 0))
+        
+        response = self.client.post('/api/commands/batch', json={
+            'command_type': 'shell', 'command_content': 'uptime', 'client_ids': client_ids[1:] + [-1]
+        })
+        self.assertEqual(response.get_json()['total_count'], 2)
+        self.assertEqual(self.client.post('/api/commands/batch', json={
+            'command_type': 'shell', 'command_content': 'uptime', 'selector': {'hostname': 'fleet-none-*'}
+        }).status_code, 404)
+    
+    def test_create_job_rollback(self):
+        """测试写入命令失败时任务行随之回滚，不留下没有命令的任务"""
+        client_id = PresenceRegistry(db, 60, 3600).heartbeat('rollback-host', '10.0.0.9', 1)
+        before = db.execute_query("SELECT COUNT(*) AS count FROM command_jobs")[0]['count']
+        with mock.patch('server.database.Transaction.insert_rows', side_effect=db.errors[0]('disk I/O error')):
+            self.assertEqual(create_job(db, 'shell', 'echo lost', [client_id]), (None, 0))
+        self.assertEqual(db.execute_query("SELECT COUNT(*) AS count FROM command_jobs")[0]['count'], before)
+    
+    def test_claim_and_lease(self):
+        """测试领取命令只交付一次，续约、结果令牌校验及到期回收"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'lease-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        job_id = self.client.post('/api/commands/batch', json={
+            'command_type': 'shell', 'command_content': 'sleep 1', 'client_ids': [client_id]
+        }).get_json()['job_id']
+        
+        claimed = self.client.post(f'/api/commands/claim/{client_id}').get_json()
+        self.assertEqual(len(claimed['commands']), 1)
+        self.assertEqual(self.client.post(f'/api/commands/claim/{client_id}').get_json()['commands'], [])
+        command = claimed['commands'][0]
+        self.assertEqual(command['status'], 'dispatched')
+        
+        response = self.client.post(f"/api/commands/lease/{command['id']}", json={'claim_token': command['claim_token']})
+        self.assertTrue(response.get_json()['renewed'])
+        response = self.client.post(f"/api/commands/result/{command['id']}",
+                                    json={'status': 'executed', 'claim_token': 'other'})
+        self.assertEqual(response.status_code, 409)
+        
+        # 租约到期后重新排队，原领取失效
+        reaper = LeaseReaper(db, dict(app.config, COMMAND_MAX_ATTEMPTS=2))
+        self.assertEqual(reaper.run_once(datetime.datetime.now() + datetime.timedelta(hours=1)), (1, 0))
+        response = self.client.post(f"/api/commands/lease/{command['id']}", json={'claim_token': command['claim_token']})
+        self.assertFalse(response.get_json()['renewed'])
+        job = self.client.get(f'/api/commands/jobs/{job_id}').get_json()['job']
+        self.assertEqual((job['pending_count'], job['dispatched_count']), (1, 0))
+        
+        # 达到最大尝试次数后标记为失败
+        command = self.client.post(f'/api/commands/claim/{client_id}').get_json()['commands'][0]
+        self.assertEqual(reaper.run_once(datetime.datetime.now() + datetime.timedelta(hours=1)), (0, 1))
+        job = self.client.get(f'/api/commands/jobs/{job_id}').get_json()['job']
+        self.assertEqual((job['pending_count'], job['dispatched_count'], job['failed_count']), (0, 0, 1))
+        response = self.client.post(f"/api/commands/result/{command['id']}",
+                                    json={'status': 'executed', 'claim_token': command['claim_token']})
+        self.assertEqual(response.status_code, 409)
+    
+    def test_late_result_after_reap(self):
+        """测试租约到期重新排队后，原领取迟到的结果被拒绝，命令仍可被重新领取"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'late-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        job_id = self.client.post('/api/commands/batch', json={
+            'command_type': 'shell', 'command_content': 'sleep 2', 'client_ids': [client_id]
+        }).get_json()['job_id']
+        command = self.client.post(f'/api/commands/claim/{client_id}').get_json()['commands'][0]
+        
+        reaper = LeaseReaper(db, app.config)
+        self.assertEqual(reaper.run_once(datetime.datetime.now() + datetime.timedelta(hours=1)), (1, 0))
+        response = self.client.post(f"/api/commands/result/{command['id']}",
+                                    json={'status': 'executed', 'result': 'late', 'claim_token': command['claim_token']})
+        self.assertEqual(response.status_code, 409)
+        
+        detail = self.client.get(f"/api/commands/{command['id']}").get_json()['command']
+        self.assertEqual(detail['status'], 'pending')
+        job = self.client.get(f'/api/commands/jobs/{job_id}').get_json()['job']
+        self.assertEqual((job['pending_count'], job['executed_count']), (1, 0))
+        self.assertEqual(len(self.client.post(f'/api/commands/claim/{client_id}').get_json()['commands']), 1)
+    
+    def test_unapplied_result_blob_discarded(self):
+        """测试结果只写入一次文件，重试后更新仍未生效时删除写入的文件"""
+        client_id = PresenceRegistry(db, 60, 3600).heartbeat('spill-host', '10.0.0.10', 1)
+        job_id, _ = create_job(db, 'shell', 'cat big', [client_id])
+        command_id = db.execute_query("SELECT id FROM commands WHERE job_id = %s", (job_id,))[0]['id']
+        blobs = BlobStore(tempfile.mkdtemp())
+        spills = []
+        def store(text):
+            spills.append(spill_result(blobs, text, 16, 8))
+            return spills[-1]
+        
+        with mock.patch.object(db, 'execute_update', return_value=0):
+            outcome = record_result(db, command_id, 'executed', 'x' * 1000, datetime.datetime.now(), store=store,
+                                    discard=lambda digest: discard_result(db, blobs, digest))
+        self.assertEqual(outcome, 'conflict')
+        self.assertEqual(len(spills), 1)
+        self.assertIsNotNone(spills[0][1])
+        self.assertIsNone(blobs.size(spills[0][1]))
+    
+    def test_command_output_stream(self):
+        """测试按偏移追加命令输出、重复片段不重复写入及只保留最新输出"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'output-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        self.client.post('/api/commands', json={
+            'client_id': client_id, 'command_type': 'shell', 'command_content': 'tail -f log'
+        })
+        command = self.client.post(f'/api/commands/claim/{client_id}').get_json()['commands'][0]
+        url = f"/api/commands/output/{command['id']}"
+        
+        data = self.client.post(url, json={'claim_token': command['claim_token'], 'offset': 0, 'data': 'abc'}).get_json()
+        self.assertEqual((data['accepted'], data['output_size']), (True, 3))
+        # 重发已接收的片段
+        data = self.client.post(url, json={'claim_token': command['claim_token'], 'offset': 0, 'data': 'abc'}).get_json()
+        self.assertEqual((data['accepted'], data['output_size']), (False, 3))
+        response = self.client.post(url, json={'claim_token': 'other', 'offset': 3, 'data': 'x'})
+        self.assertEqual(response.status_code, 409)
+        
+        output_max, app.config['COMMAND_OUTPUT_MAX'] = app.config['COMMAND_OUTPUT_MAX'], 5
+        try:
+            self.client.post(url, json={'claim_token': command['claim_token'], 'offset': 3, 'data': 'defg'})
+            self.assertEqual(self.client.get(f"/api/commands/{command['id']}").get_json()['command']['result'], 'cdefg')
+            self.client.post(f"/api/commands/result/{command['id']}",
+                             json={'status': 'executed', 'result': '\nok', 'claim_token': command['claim_token']})
+        finally:
+            app.config['COMMAND_OUTPUT_MAX'] = output_max
+        detail = self.client.get(f"/api/commands/{command['id']}").get_json()['command']
+        self.assertEqual((detail['status'], detail['result'], detail['output_size']), ('executed', 'fg\nok', 7))
+    
+    def test_large_result_spills_to_blob(self):
+        """测试gzip上传的大结果压缩存入文件，表中只保留预览，读取时流式返回，不再引用后被回收"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'blob-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        self.client.post('/api/commands', json={
+            'client_id': client_id, 'command_type': 'shell', 'command_content': 'cat big.log'
+        })
+        command = self.client.post(f'/api/commands/claim/{client_id}').get_json()['commands'][0]
+        
+        result = 'line of output\n' * 10000
+        body = gzip.compress(json.dumps({'status': 'executed', 'result': result,
+                                         'claim_token': command['claim_token']}).encode('utf-8'))
+        response = self.client.post(f"/api/commands/result/{command['id']}", data=body,
+                                    headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        
+        detail = self.client.get(f"/api/commands/{command['id']}").get_json()['command']
+        self.assertEqual(len(detail['result']), app.config['COMMAND_RESULT_PREVIEW'])
+        self.assertEqual(detail['result_size'], len(result))
+        self.assertEqual(self.client.get(f"/api/commands/{command['id']}/result").get_data(as_text=True), result)
+        response = self.client.get(f"/api/commands/{command['id']}/result", headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.get_data()).decode('utf-8'), result)
+        
+        # 命令删除后文件不再被引用
+        blobs = BlobStore(app.config['BLOB_DIR'])
+        self.assertIsNotNone(blobs.size(detail['result_blob']))
+        db.execute_update("DELETE FROM commands WHERE id = %s", (command['id'],))
+        referenced = {row['result_blob'] for row in db.execute_query(
+            "SELECT result_blob FROM commands WHERE result_blob IS NOT NULL")}
+        blobs.collect(referenced, min_age=0)
+        self.assertIsNone(blobs.size(detail['result_blob']))
+    
+    def test_command_history(self):
+        """测试按条件过滤命令历史、按(时间, ID)键集翻页及按任务和客户端汇总状态"""
+        client_ids = [self.client.post('/api/heartbeat', json={
+            'hostname': f'history-host-{index}',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id'] for index in range(2)]
+        job_id = self.client.post('/api/commands/batch', json={
+            'command_type': 'shell', 'command_content': 'uptime', 'client_ids': client_ids
+        }).get_json()['job_id']
+        for _ in range(3):
+            self.client.post('/api/commands', json={
+                'client_id': client_ids[0], 'command_type': 'shell', 'command_content': 'date'
+            })
+        command = self.client.post(f'/api/commands/claim/{client_ids[1]}').get_json()['commands'][0]
+        self.client.post(f"/api/commands/result/{command['id']}",
+                         json={'status': 'failed', 'result': 'boom', 'claim_token': command['claim_token']})
+        
+        # 逐页读取客户端0的命令，不重复不遗漏
+        seen, cursor = [], None
+        while True:
+            params = {'client_id': client_ids[0], 'limit': 2, 'fields': 'id,status'}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get('/api/commands', query_string=params).get_json()
+            self.assertTrue(all('command_content' not in row for row in data['commands']))
+            seen.extend(row['id'] for row in data['commands'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+        
+        data = self.client.get('/api/commands', query_string={'job_id': job_id, 'status': 'failed'}).get_json()
+        self.assertEqual([row['client_id'] for row in data['commands']], [client_ids[1]])
+        self.assertEqual(self.client.get('/api/commands', query_string={'status': 'bogus'}).status_code, 400)
+        
+        groups = self.client.get('/api/commands', query_string={'aggregate': 'job', 'job_id': job_id}).get_json()['groups']
+        self.assertEqual((groups[0]['counts']['pending'], groups[0]['counts']['failed'], groups[0]['total']), (1, 1, 2))
+        groups = self.client.get('/api/commands', query_string={'aggregate': 'client', 'job_id': job_id,
+                                                                'status': 'failed'}).get_json()['groups']
+        self.assertEqual([(group['hostname'], group['counts']['failed']) for group in groups], [('history-host-1', 1)])
+        
+        # 两种汇总都按分组键分页，不重复不遗漏
+        for params in ({'aggregate': 'client', 'job_id': job_id}, {'aggregate': 'job'},
+                       {'aggregate': 'job', 'client_id': client_ids[0]}):
+            key = 'client_id' if params['aggregate'] == 'client' else 'job_id'
+            seen, cursor = [], None
+            while True:
+                page = dict(params, limit=1, **({'cursor': cursor} if cursor else {}))
+                data = self.client.get('/api/commands', query_string=page).get_json()
+                self.assertLessEqual(len(data['groups']), 1)
+                seen.extend(group[key] for group in data['groups'])
+                cursor = data['next_cursor']
+                if not cursor:
+                    break
+            everything = self.client.get('/api/commands', query_string=dict(params, limit=1000)).get_json()
+            self.assertEqual(seen, [group[key] for group in everything['groups']])
+            self.assertIsNone(everything['next_cursor'])
+        self.assertIn(None, seen)
+    
+    def test_screenshot_unchanged(self):
+        """测试画面未变化时只更新上一张截图的确认时间，不新增截图"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'unchanged-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        response = self.client.post('/api/screenshots', data={
+            'client_id': str(client_id), 'fingerprint': '0f0f0f0f0f0f0f0f', 'file': (io.BytesIO(b'jpeg'), 'screen.jpg')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 202)
+        screenshot_id = wait_for_upload(self.client, response)['id']
+        
+        response = self.client.post(f'/api/screenshots/{screenshot_id}/unchanged', json={'client_id': client_id})
+        self.assertEqual(response.status_code, 200)
+        screenshots = self.client.get(f'/api/screenshots/{client_id}').get_json()['screenshots']
+        self.assertEqual(len(screenshots), 1)
+        self.assertEqual(screenshots[0]['fingerprint'], '0f0f0f0f0f0f0f0f')
+        self.assertIsNotNone(screenshots[0]['last_seen_at'])
+        
+        # 截图不属于该客户端或已被删除时返回404，客户端改为上传完整截图
+        response = self.client.post(f'/api/screenshots/{screenshot_id}/unchanged', json={'client_id': client_id + 1})
+        self.assertEqual(response.status_code, 404)
+    
+    @unittest.skipIf(Image is None, '未安装Pillow')
+    def test_screenshot_renditions(self):
+        """测试列表返回各规格地址，缩略图按最长边缩小为JPEG"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'thumbnail-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        image = io.BytesIO()
+        Image.new('RGB', (1920, 1080), (40, 80, 120)).save(image, format='PNG')
+        image.seek(0)
+        wait_for_upload(self.client, self.client.post('/api/screenshots', data={
+            'client_id': str(client_id), 'file': (image, 'screen.png')
+        }, content_type='multipart/form-data'))
+        
+        screenshot = self.client.get(f'/api/screenshots/latest/{client_id}').get_json()['screenshot']
+        self.assertEqual(set(screenshot['urls']), {'small', 'medium', 'full'})
+        response = self.client.get(screenshot['urls']['small'])
+        self.assertEqual((response.status_code, response.mimetype), (200, 'image/jpeg'))
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (320, 180))
+        response.close()
+        response = self.client.get(screenshot['urls']['full'])
+        self.assertEqual(response.mimetype, 'image/png')
+        response.close()
+        
+        response = self.client.get(f"/api/screenshots/download/{screenshot['content_hash']}?size=huge")
+        self.assertEqual(response.status_code, 400)
+    
+    @unittest.skipIf(Image is None, '未安装Pillow')
+    def test_screenshot_delta(self):
+        """测试差分截图：只上传变化的图块，请求时贴到关键帧上合成完整画面，并持有关键帧文件的引用"""
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'delta-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        image = io.BytesIO()
+        Image.new('RGB', (256, 128), (0, 0, 255)).save(image, format='PNG')
+        image.seek(0)
+        keyframe = wait_for_upload(self.client, self.client.post('/api/screenshots', data={
+            'client_id': str(client_id), 'file': (image, 'screen.png')
+        }, content_type='multipart/form-data'))
+        
+        atlas = io.BytesIO()
+        Image.new('RGB', (64, 64), (255, 0, 0)).save(atlas, format='PNG')
+        atlas = atlas.getvalue()
+        tiles = json.dumps({'tile': 64, 'cols': 1, 'boxes': [[64, 0, 64, 64]]})
+        response = self.client.post(f"/api/screenshots/{keyframe['id']}/delta", data={
+            'client_id': str(client_id), 'tiles': tiles, 'file': (io.BytesIO(atlas), 'delta.png')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 202)
+        delta_id = wait_for_upload(self.client, response)['id']
+        rows = db.execute_query("SELECT ref_count FROM screenshot_blobs WHERE content_hash = %s", (keyframe['filename'],))
+        self.assertEqual(rows[0]['ref_count'], 2)
+        
+        screenshot = self.client.get(f'/api/screenshots/latest/{client_id}').get_json()['screenshot']
+        self.assertEqual(screenshot['id'], delta_id)
+        response = self.client.get(screenshot['urls']['full'])
+        self.assertEqual((response.status_code, response.mimetype), (200, 'image/jpeg'))
+        frame = Image.open(io.BytesIO(response.data))
+        response.close()
+        self.assertEqual(frame.size, (256, 128))
+        red, green, blue = frame.getpixel((96, 32))
+        self.assertTrue(red > 200 and blue < 50)
+        red, green, blue = frame.getpixel((16, 32))
+        self.assertTrue(blue > 200 and red < 50)
+        
+        # 差分截图不能作为关键帧，图块描述不合法时返回400
+        response = self.client.post(f'/api/screenshots/{delta_id}/delta', data={
+            'client_id': str(client_id), 'tiles': tiles, 'file': (io.BytesIO(atlas), 'delta.png')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f"/api/screenshots/{keyframe['id']}/delta", data={
+            'client_id': str(client_id), 'tiles': json.dumps({'tile': 64, 'cols': 1, 'boxes': [[0, 0, 65, 64]]}),
+            'file': (io.BytesIO(atlas), 'delta.png')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+    
     def test_get_preset_commands(self):
         """测试获取预设命令接口"""
         response = self.client.get('/api/preset_commands')
@@ -109,6 +662,569 @@ class TestServerAPI(unittest.TestCase):
         data = response.get_json()
         self.assertEqual(data['status'], 'ok')
         self.assertIsInstance(data['preset_commands'], list)
+    
+    def test_preset_catalog_version(self):
+        """测试预设命令目录版本号、未变化时返回304、修改后失效及按预设ID下发"""
+        data = self.client.get('/api/preset_commands').get_json()
+        version = data['version']
+        response = self.client.get('/api/preset_commands', headers={'If-None-Match': f'"{version}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/preset_commands', query_string={'version': version}).status_code, 304)
+        
+        response = self.client.post('/api/preset_commands', json={'name': 'uptime', 'command': 'uptime'})
+        self.assertEqual(response.status_code, 201)
+        preset_id = response.get_json()['id']
+        self.assertNotEqual(response.get_json()['version'], version)
+        response = self.client.get('/api/preset_commands', headers={'If-None-Match': f'"{version}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(preset_id, [preset['id'] for preset in response.get_json()['preset_commands']])
+        
+        client_id = self.client.post('/api/heartbeat', json={
+            'hostname': 'preset-host',
+            'ip_address': '127.0.0.1',
+            'port': 5000
+        }).get_json()['client_id']
+        command_id = self.client.post('/api/commands', json={'client_id': client_id, 'preset_id': preset_id}
+                                      ).get_json()['command_id']
+        command = self.client.get(f'/api/commands/{command_id}').get_json()['command']
+        self.assertEqual((command['command_type'], command['command_content']), ('shell', 'uptime'))
+        
+        self.assertEqual(self.client.put(f'/api/preset_commands/{preset_id}', json={'command': 'uptime -p'}
+                                         ).status_code, 200)
+        batch = self.client.post('/api/commands/batch', json={'preset_id': preset_id, 'client_ids': [client_id]})
+        self.assertEqual(batch.status_code, 201)
+        self.assertEqual(self.client.delete(f'/api/preset_commands/{preset_id}').status_code, 200)
+        response = self.client.post('/api/commands', json={'client_id': client_id, 'preset_id': preset_id})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/preset_commands/{preset_id}').status_code, 404)
+    
+    def test_preset_write_failure(self):
+        """测试修改或删除预设命令时数据库出错返回500，而不是404"""
+        preset_id = self.client.post('/api/preset_commands', json={'name': 'df', 'command': 'df -h'}).get_json()['id']
+        with mock.patch.object(db, 'transaction', return_value=None):
+            self.assertEqual(self.client.put(f'/api/preset_commands/{preset_id}', json={'command': 'df'}
+                                             ).status_code, 500)
+            self.assertEqual(self.client.delete(f'/api/preset_commands/{preset_id}').status_code, 500)
+        self.assertEqual(self.client.put(f'/api/preset_commands/{preset_id}', json={'command': 'df -h'}
+                                         ).status_code, 200)
+
+class TestPresenceRegistry(unittest.TestCase):
+    """客户端在线状态注册表测试类"""
+
+    def setUp(self):
+        self.registry = PresenceRegistry(db, 60, 3600)
+
+    def test_heartbeat_from_memory(self):
+        """测试已知客户端的心跳不新增记录，并在写回后更新数据库"""
+        client_id = self.registry.heartbeat('presence-host', '10.0.0.2', 1)
+        self.assertIsNotNone(client_id)
+        self.assertEqual(self.registry.heartbeat('presence-host', '10.0.0.2', 1), client_id)
+
+        rows = db.execute_query("SELECT COUNT(*) AS count FROM clients WHERE hostname = %s", ('presence-host',))
+        self.assertEqual(rows[0]['count'], 1)
+
+        self.assertEqual(self.registry.flush(), 1)
+        self.assertEqual(self.registry.flush(), 0)
+        rows = db.execute_query("SELECT last_heartbeat FROM clients WHERE id = %s", (client_id,))
+        self.assertEqual(rows[0]['last_heartbeat'], self.registry.last_heartbeat(client_id))
+
+    def test_concurrent_registration(self):
+        """测试新客户端并发心跳只产生一条记录"""
+        results = []
+        registries = [PresenceRegistry(db, 60, 3600) for _ in range(4)]
+        threads = [threading.Thread(target=lambda r=r: results.append(r.heartbeat('upsert-host', '10.0.0.4', 1)))
+                   for r in registries]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(results)), 1)
+        rows = db.execute_query("SELECT COUNT(*) AS count FROM clients WHERE hostname = %s", ('upsert-host',))
+        self.assertEqual(rows[0]['count'], 1)
+
+    def test_status_and_stats(self):
+        """测试状态和统计来自注册表"""
+        client_id = self.registry.heartbeat('presence-stats', '10.0.0.3', 1)
+        self.assertEqual(self.registry.status(client_id), 'online')
+        online_count, offline_count = self.registry.stats()
+        self.assertGreaterEqual(online_count, 1)
+        self.assertEqual(self.registry.status(-1), 'offline')
+
+    def test_timeout_transition_persisted(self):
+        """测试心跳超时后计数随之变化，下线状态由写回持久化"""
+        registry = PresenceRegistry(db, 0.05, 3600)
+        client_id = registry.heartbeat('presence-timeout', '10.0.0.6', 1)
+        registry.flush()
+        online_count, offline_count = registry.stats()
+        version = registry.version()
+
+        time.sleep(0.1)
+        self.assertEqual(registry.stats(), (0, online_count + offline_count))
+        self.assertNotEqual(registry.version(), version)
+        rows = db.execute_query("SELECT status FROM clients WHERE id = %s", (client_id,))
+        self.assertEqual(rows[0]['status'], 'online')
+
+        registry.flush()
+        rows = db.execute_query("SELECT status FROM clients WHERE id = %s", (client_id,))
+        self.assertEqual(rows[0]['status'], 'offline')
+
+    def test_flush_failure_retried(self):
+        """测试写回失败时心跳放回待写回集合，下次写回时保留较新的心跳"""
+        client_id = self.registry.heartbeat('presence-retry', '10.0.0.8', 1)
+        self.registry.flush()
+        self.registry.heartbeat('presence-retry', '10.0.0.8', 1)
+        with mock.patch.object(db, 'transaction', return_value=None):
+            self.assertEqual(self.registry.flush(), 0)
+        self.registry.heartbeat('presence-retry', '10.0.0.8', 1)
+        latest = self.registry.last_heartbeat(client_id)
+        
+        self.assertEqual(self.registry.flush(), 1)
+        rows = db.execute_query("SELECT last_heartbeat FROM clients WHERE id = %s", (client_id,))
+        self.assertEqual(rows[0]['last_heartbeat'], latest)
+
+class TestEventBroker(unittest.TestCase):
+    """事件分发器测试类"""
+
+    def test_publish_and_replay(self):
+        """测试发布的事件到达所有订阅者，重连时补发错过的事件"""
+        broker = EventBroker(queue_size=10, history_size=10)
+        first, second = broker.subscribe(), broker.subscribe()
+        event_id = broker.publish('screenshot', {'id': 1})
+        self.assertEqual(first.get_nowait(), (event_id, 'screenshot', {'id': 1}))
+        self.assertEqual(second.get_nowait(), (event_id, 'screenshot', {'id': 1}))
+
+        broker.publish('screenshot', {'id': 2})
+        resumed = broker.subscribe(last_event_id=event_id)
+        self.assertEqual(resumed.get_nowait()[2], {'id': 2})
+
+        broker.unsubscribe(first)
+        self.assertEqual(broker.subscriber_count(), 2)
+
+    def test_slow_subscriber_reset(self):
+        """测试订阅者积压超出上限时收到reset事件，重连位置过旧时同样收到reset"""
+        broker = EventBroker(queue_size=2, history_size=2)
+        subscriber = broker.subscribe()
+        for index in range(3):
+            broker.publish('system_data', {'index': index})
+        self.assertEqual(subscriber.get_nowait()[1], 'reset')
+        self.assertTrue(subscriber.empty())
+        self.assertEqual(broker.subscribe(last_event_id=0).get_nowait()[1], 'reset')
+
+    def test_presence_status_events(self):
+        """测试客户端上线和超时下线时发布状态事件"""
+        broker = EventBroker()
+        subscriber = broker.subscribe()
+        registry = PresenceRegistry(db, 0.05, 3600, events=broker)
+        client_id = registry.heartbeat('events-presence', '10.0.0.7', 1)
+        registry.heartbeat('events-presence', '10.0.0.7', 1)
+
+        time.sleep(0.1)
+        registry.stats()
+        statuses = [event[2]['status'] for event in list(subscriber.queue) if event[2]['client_id'] == client_id]
+        self.assertEqual(statuses, ['online', 'offline'])
+
+class TestCommandNotifier(unittest.TestCase):
+    """命令下发通知测试类"""
+
+    def test_notify_wakes_waiter(self):
+        """测试下发命令唤醒等待者，且使“无待执行命令”的记录失效"""
+        notifier = CommandNotifier()
+        self.assertTrue(notifier.may_have_pending(1))
+        generation = notifier.generation(1)
+        notifier.mark_empty(1, generation)
+        self.assertFalse(notifier.may_have_pending(1))
+        self.assertFalse(notifier.wait(1, generation, 0.05))
+
+        timer = threading.Timer(0.05, notifier.notify, (1,))
+        timer.start()
+        self.assertTrue(notifier.wait(1, generation, 5))
+        self.assertTrue(notifier.may_have_pending(1))
+
+        # 查询期间有新命令时不记录为空
+        notifier.mark_empty(1, generation)
+        self.assertTrue(notifier.may_have_pending(1))
+
+class TestRetentionJob(unittest.TestCase):
+    """数据保留任务测试类"""
+
+    def test_drop_partitions_only_for_system_data(self):
+        """测试只对系统数据表整体删除分区，截图和命令逐行删除"""
+        tables = []
+        def drop_expired_partitions(table, cutoff):
+            tables.append(table)
+            return 0, 0
+        with mock.patch.object(db, 'drop_expired_partitions', drop_expired_partitions):
+            RetentionJob(db, dict(app.config, RETENTION_SCREENSHOTS_DAYS=7, RETENTION_COMMANDS_DAYS=7,
+                                  RETENTION_SYSTEM_DATA_DAYS=7)).run_once()
+        self.assertIn('system_data', tables)
+        self.assertNotIn('screenshots', tables)
+        self.assertNotIn('commands', tables)
+
+    def test_prune_expired_rows_and_files(self):
+        """测试分批删除过期数据及截图文件，保留未过期数据和待执行命令"""
+        client_id = PresenceRegistry(db, 60, 3600).heartbeat('retention-host', '10.0.0.5', 1)
+        now = datetime.datetime.now()
+        old = now - datetime.timedelta(days=400)
+        
+        os.makedirs(app.config['SCREENSHOT_DIR'], exist_ok=True)
+        old_file = os.path.join(app.config['SCREENSHOT_DIR'], 'retention_old.png')
+        with open(old_file, 'wb') as f:
+            f.write(b'x' * 10)
+        
+        db.insert_rows('system_data', ('client_id', 'cpu_usage', 'memory_usage', 'disk_usage', 'created_at'),
+                       [(client_id, 1, 1, 1, old)] * 5 + [(client_id, 1, 1, 1, now)])
+        db.execute_insert("INSERT INTO screenshots (client_id, file_path, file_size, created_at) VALUES (%s, %s, %s, %s)",
+                          (client_id, old_file, 10, old))
+        db.execute_insert("INSERT INTO commands (client_id, command_type, command_content, status, created_at) "
+                          "VALUES (%s, 'shell', 'ls', 'pending', %s)", (client_id, old))
+        
+        config = dict(app.config, RETENTION_BATCH_SIZE=2, RETENTION_SYSTEM_DATA_DAYS=30,
+                      RETENTION_SCREENSHOTS_DAYS=7, RETENTION_COMMANDS_DAYS=180)
+        report = RetentionJob(db, config).run_once(now)
+        
+        self.assertGreaterEqual(report['tables']['system_data']['rows'], 5)
+        self.assertGreaterEqual(report['tables']['screenshots']['files'], 1)
+        self.assertFalse(os.path.exists(old_file))
+        
+        rows = db.execute_query("SELECT COUNT(*) AS count FROM system_data WHERE client_id = %s", (client_id,))
+        self.assertEqual(rows[0]['count'], 1)
+        rows = db.execute_query("SELECT COUNT(*) AS count FROM commands WHERE client_id = %s", (client_id,))
+        self.assertEqual(rows[0]['count'], 1)
+
+    def test_prune_jobs_without_commands(self):
+        """测试删除过期命令后一并删除不再有命令的任务，仍有命令的任务保留"""
+        client_id = PresenceRegistry(db, 60, 3600).heartbeat('retention-job-host', '10.0.0.7', 1)
+        now = datetime.datetime.now()
+        old = now - datetime.timedelta(days=400)
+        finished_job, _ = create_job(db, 'shell', 'echo done', [client_id])
+        waiting_job, _ = create_job(db, 'shell', 'echo wait', [client_id])
+        db.execute_update("UPDATE commands SET status = 'executed' WHERE job_id = %s", (finished_job,))
+        db.execute_update("UPDATE commands SET created_at = %s WHERE job_id IN (%s, %s)", (old, finished_job, waiting_job))
+        db.execute_update("UPDATE command_jobs SET created_at = %s WHERE id IN (%s, %s)", (old, finished_job, waiting_job))
+        
+        report = RetentionJob(db, dict(app.config, RETENTION_COMMANDS_DAYS=30)).run_once(now)
+        self.assertGreaterEqual(report['tables']['command_jobs']['rows'], 1)
+        rows = db.execute_query("SELECT id FROM command_jobs WHERE id IN (%s, %s)", (finished_job, waiting_job))
+        self.assertEqual([row['id'] for row in rows], [waiting_job])
+
+    def test_release_deduplicated_screenshots(self):
+        """测试相同截图只存一份，按引用数回收：所有引用的截图行删除后才删除文件"""
+        client_id = PresenceRegistry(db, 60, 3600).heartbeat('dedup-host', '10.0.0.6', 1)
+        client = app.test_client()
+        names = []
+        for _ in range(2):
+            response = client.post('/api/screenshots', data={
+                'client_id': str(client_id), 'file': (io.BytesIO(b'\xff\xd8same-image'), 'screen.jpg')
+            }, content_type='multipart/form-data')
+            names.append(wait_for_upload(client, response)['filename'])
+        self.assertEqual(names[0], names[1])
+        
+        response = client.get(f'/api/screenshots/download/{names[0]}')
+        self.assertEqual((response.status_code, response.mimetype, response.data), (200, 'image/jpeg', b'\xff\xd8same-image'))
+        response.close()
+        rows = db.execute_query("SELECT ref_count FROM screenshot_blobs WHERE content_hash = %s", (names[0],))
+        self.assertEqual(rows[0]['ref_count'], 2)
+        
+        # 只有一行过期时保留文件，两行都过期后删除文件和索引行
+        store = ScreenshotStore(db, app.config['SCREENSHOT_DIR'], min_age=0)
+        path = store.blobs.path(names[0])
+        now = datetime.datetime.now()
+        ids = [row['id'] for row in db.execute_query(
+            "SELECT id FROM screenshots WHERE client_id = %s ORDER BY id ASC", (client_id,))]
+        config = dict(app.config, RETENTION_SCREENSHOTS_DAYS=7)
+        db.execute_update("UPDATE screenshots SET created_at = %s WHERE id = %s", (now - datetime.timedelta(days=400), ids[0]))
+        RetentionJob(db, config, screenshots=store).run_once(now)
+        self.assertTrue(os.path.exists(path))
+        db.execute_update("UPDATE screenshots SET created_at = %s WHERE id = %s", (now - datetime.timedelta(days=400), ids[1]))
+        report = RetentionJob(db, config, screenshots=store).run_once(now)
+        self.assertEqual(report['tables']['screenshots']['files'], 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(db.execute_query("SELECT * FROM screenshot_blobs WHERE content_hash = %s", (names[0],)), [])
+
+    def test_collect_unreferenced_screenshot_after_min_age(self):
+        """测试引用数降为0时未到最短保留时间的文件连同索引行保留，超过后由清理任务回收"""
+        store = ScreenshotStore(db, app.config['SCREENSHOT_DIR'], min_age=3600)
+        digest = store.blobs.put(b'young-screenshot')
+        store.add_refs({digest: (16, 1)})
+        self.assertEqual(store.release({digest: 1}), (0, 0))
+        self.assertTrue(os.path.exists(store.blobs.path(digest)))
+        rows = db.execute_query("SELECT ref_count FROM screenshot_blobs WHERE content_hash = %s", (digest,))
+        self.assertEqual(rows[0]['ref_count'], 0)
+        self.assertIsNone(store.resolve(digest))
+        
+        report = RetentionJob(db, dict(app.config), screenshots=store).run_once()
+        self.assertEqual(report['screenshot_blobs'], {'files': 0, 'bytes': 0})
+        self.assertEqual(store.collect(now=time.time() + 7200), (1, 16))
+        self.assertFalse(os.path.exists(store.blobs.path(digest)))
+        self.assertEqual(db.execute_query("SELECT * FROM screenshot_blobs WHERE content_hash = %s", (digest,)), [])
+
+@unittest.skipIf(Image is None, '未安装Pillow')
+class TestThumbnailCache(unittest.TestCase):
+    """截图缩略图缓存测试类"""
+
+    def test_evict_least_recently_used(self):
+        """测试缓存超过上限时删除最久未访问的缩略图，被删除的缩略图请求时重新生成"""
+        root = tempfile.mkdtemp()
+        sources = []
+        for index in range(3):
+            path = os.path.join(root, f'source-{index}.png')
+            Image.new('RGB', (64, 64), (index * 80, 0, 0)).save(path)
+            sources.append((path, f'{index:064x}'))
+        
+        cache = ThumbnailCache(os.path.join(root, 'thumbnails'), max_bytes=1)
+        first = cache.get('small', *sources[0])
+        second = cache.get('small', *sources[1])
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        self.assertEqual(cache.stats()['files'], 1)
+        self.assertEqual(cache.get('small', *sources[0]), first)
+        self.assertTrue(os.path.exists(first))
+        
+        # 重启后按修改时间恢复已有的缩略图
+        self.assertEqual(ThumbnailCache(cache.root, max_bytes=1 << 20).stats()['files'], 1)
+
+class TestScreenshotIngest(unittest.TestCase):
+    """截图异步写入测试类"""
+
+    def setUp(self):
+        db.connect()
+        self.client_id = PresenceRegistry(db, 60, 3600).heartbeat('ingest-host', '10.0.0.7', 1)
+        self.store = ScreenshotStore(db, tempfile.mkdtemp())
+        self.batches = []
+        self.ingest = ScreenshotIngest(db, self.store, max_size=64, on_stored=self.batches.append)
+
+    def tearDown(self):
+        self.ingest.stop()
+        db.disconnect()
+
+    def test_reject_oversized_upload(self):
+        """测试超过大小上限时停止读取并删除临时文件"""
+        with self.assertRaises(UploadTooLarge):
+            self.ingest.receive(io.BytesIO(b'x' * 100), chunk_size=16)
+        self.assertEqual(os.listdir(os.path.join(self.store.blobs.root, '.incoming')), [])
+
+    def test_reject_oversized_chunked_upload(self):
+        """测试没有Content-Length的分块上传超过截图大小上限时，解析表单时停止读取并返回413"""
+        body = (b'--boundary\r\nContent-Disposition: form-data; name="client_id"\r\n\r\n1\r\n'
+                b'--boundary\r\nContent-Disposition: form-data; name="file"; filename="screen.jpg"\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + b'x' * (256 * 1024) + b'\r\n--boundary--\r\n')
+        limit = app.config['MAX_SCREENSHOT_SIZE']
+        app.config['MAX_SCREENSHOT_SIZE'] = 1024
+        try:
+            response = app.test_client().post('/api/screenshots', input_stream=io.BytesIO(body),
+                                              content_type='multipart/form-data; boundary=boundary',
+                                              headers={'Transfer-Encoding': 'chunked'},
+                                              environ_overrides={'wsgi.input_terminated': True})
+        finally:
+            app.config['MAX_SCREENSHOT_SIZE'] = limit
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.get_json()['message'], 'Screenshot too large')
+
+    def test_write_batch(self):
+        """测试队列中的截图在一个批次中写入，相同内容只存一份并按行数增加引用"""
+        pendings = []
+        for data in (b'\xff\xd8ingest-a', b'\xff\xd8ingest-b', b'\xff\xd8ingest-a'):
+            upload = self.ingest.receive(io.BytesIO(data))
+            pendings.append(self.ingest.submit(*upload, {'client_id': self.client_id}))
+        self.ingest.start()
+        for pending in pendings:
+            self.assertTrue(pending.done.wait(5))
+        
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual([row['id'] for row in self.batches[0]], [pending.id for pending in pendings])
+        self.assertEqual(len(set(pending.id for pending in pendings)), 3)
+        digest = pendings[0].content_hash
+        self.assertTrue(os.path.exists(self.store.blobs.path(digest)))
+        rows = db.execute_query("SELECT ref_count FROM screenshot_blobs WHERE content_hash = %s", (digest,))
+        self.assertEqual(rows[0]['ref_count'], 2)
+
+    def test_retry_after_database_failure(self):
+        """测试数据库写入失败时保留描述文件并重试，写入成功后才结束上传"""
+        ingest = ScreenshotIngest(db, self.store, max_size=64, retry_interval=0.05)
+        add_refs = self.store.add_refs
+        failures = []
+        def failing_add_refs(entries, database=None):
+            if not failures:
+                failures.append(entries)
+                return False
+            return add_refs(entries, database)
+        upload = ingest.receive(io.BytesIO(b'\xff\xd8retried'))
+        pending = ingest.submit(*upload, {'client_id': self.client_id})
+        with mock.patch.object(self.store, 'add_refs', failing_add_refs):
+            ingest.start()
+            try:
+                self.assertTrue(pending.done.wait(5))
+            finally:
+                ingest.stop()
+        self.assertEqual(len(failures), 1)
+        self.assertIsNotNone(pending.id)
+        self.assertEqual(os.listdir(os.path.join(self.store.blobs.root, '.incoming')), [])
+
+    def test_replay_after_restart(self):
+        """测试已返回上传凭据、尚未写入数据库的截图在重启后按描述文件重新写入，没有描述文件的临时文件被清理"""
+        upload = self.ingest.receive(io.BytesIO(b'\xff\xd8replayed'))
+        pending = self.ingest.submit(*upload, {'client_id': self.client_id, 'fingerprint': 'ffff0000ffff0000'})
+        orphan = self.ingest.receive(io.BytesIO(b'\xff\xd8orphan'))[0]
+        
+        # 模拟进程在写入前退出：新的实例从.incoming目录恢复
+        ingest = ScreenshotIngest(db, self.store, max_size=64, on_stored=self.batches.append)
+        self.assertFalse(os.path.exists(orphan))
+        ingest.start()
+        try:
+            replayed = ingest.lookup(pending.upload_id)
+            self.assertTrue(replayed.done.wait(5))
+        finally:
+            ingest.stop()
+        self.assertIsNotNone(replayed.id)
+        self.assertEqual(self.batches[0][0]['fingerprint'], 'ffff0000ffff0000')
+        self.assertEqual(os.listdir(os.path.join(self.store.blobs.root, '.incoming')), [])
+        self.assertTrue(os.path.exists(self.store.blobs.path(pending.content_hash)))
+
+    def test_replay_after_commit(self):
+        """测试截图行已提交、描述文件未删除时重启，重新写入返回原截图ID，不重复插入也不重复增加引用数"""
+        upload = self.ingest.receive(io.BytesIO(b'\xff\xd8committed'))
+        pending = self.ingest.submit(*upload, {'client_id': self.client_id})
+        with open(pending.sidecar) as f:
+            sidecar = f.read()
+        self.ingest.start()
+        self.assertTrue(pending.done.wait(5))
+        self.ingest.stop()
+        
+        # 模拟进程在提交后、删除描述文件前退出
+        with open(pending.sidecar, 'w') as f:
+            f.write(sidecar)
+        ingest = ScreenshotIngest(db, self.store, max_size=64, on_stored=self.batches.append)
+        ingest.start()
+        try:
+            replayed = ingest.lookup(pending.upload_id)
+            self.assertTrue(replayed.done.wait(5))
+        finally:
+            ingest.stop()
+        self.assertEqual(replayed.id, pending.id)
+        self.assertEqual(len(self.batches), 1)
+        rows = db.execute_query("SELECT COUNT(*) AS count FROM screenshots WHERE upload_id = %s", (pending.upload_id,))
+        self.assertEqual(rows[0]['count'], 1)
+        rows = db.execute_query("SELECT ref_count FROM screenshot_blobs WHERE content_hash = %s", (pending.content_hash,))
+        self.assertEqual(rows[0]['ref_count'], 1)
+        self.assertEqual(os.listdir(os.path.join(self.store.blobs.root, '.incoming')), [])
+
+class TestLRUCache(unittest.TestCase):
+    """LRU缓存测试类"""
+
+    def test_evict_least_recently_used(self):
+        """测试超出容量时淘汰最久未使用的项"""
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+class FakeConnection:
+    """测试用的假连接"""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestConnectionPool(unittest.TestCase):
+    """连接池测试类"""
+
+    def test_reuse_connection(self):
+        """测试归还的连接会被复用"""
+        pool = ConnectionPool(FakeConnection, 2, 1)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_bounded_size(self):
+        """测试连接池耗尽时等待超时"""
+        pool = ConnectionPool(FakeConnection, 1, 0.05)
+        pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_wait_for_release(self):
+        """测试等待中的请求在连接归还后获得连接"""
+        pool = ConnectionPool(FakeConnection, 1, 2)
+        conn = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, (conn,))
+        timer.start()
+        self.assertIs(pool.acquire(), conn)
+        timer.join()
+        self.assertGreater(pool.stats()['max_wait_ms'], 0)
+
+    def test_discard_connection(self):
+        """测试丢弃失效连接后释放名额"""
+        pool = ConnectionPool(FakeConnection, 1, 1)
+        conn = pool.acquire()
+        pool.release(conn, discard=True)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.acquire(), conn)
+
+    def test_replace_stale_idle_connection(self):
+        """测试空闲较久的连接借出前检查，已断开的连接关闭后换成新连接，名额不变"""
+        pool = ConnectionPool(FakeConnection, 1, 1, validate=lambda conn: False, idle_check=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual((pool.stats()['created'], pool.stats()['stale']), (1, 1))
+        
+        pool = ConnectionPool(FakeConnection, 1, 1, validate=lambda conn: False, idle_check=60)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+
+@unittest.skipUnless(isinstance(db, SQLiteDatabase), '仅在SQLite后端下运行')
+class TestSQLiteDatabase(unittest.TestCase):
+    """SQLite存储后端测试类"""
+
+    def test_insert_and_query(self):
+        """测试%s占位符转换、插入ID和时间类型"""
+        now = datetime.datetime.now().replace(microsecond=0)
+        client_id = db.execute_insert(
+            "INSERT INTO clients (hostname, ip_address, port, status, last_heartbeat) VALUES (%s, %s, %s, 'online', %s)",
+            ('sqlite-host', '10.0.0.1', 1, now)
+        )
+        self.assertIsNotNone(client_id)
+
+        rows = db.execute_query("SELECT * FROM clients WHERE id = %s", (client_id,))
+        self.assertEqual(rows[0]['hostname'], 'sqlite-host')
+        self.assertEqual(rows[0]['last_heartbeat'], now)
+        self.assertIsInstance(rows[0]['created_at'], datetime.datetime)
+
+    def test_upsert_without_returning(self):
+        """测试SQLite不支持RETURNING时，插入或更新仍返回插入或命中的行ID"""
+        columns, keys = ('hostname', 'ip_address', 'port', 'status'), ('hostname', 'ip_address', 'port')
+        with mock.patch.object(db, 'returning', False):
+            self.assertNotIn('RETURNING', db._build_upsert('clients', columns, keys, {'status': '{new}'}, True))
+            client_id = db.execute_upsert('clients', columns, keys, {'status': '{new}'},
+                                          ('upsert-old-host', '10.0.0.11', 1, 'online'), returning_id=True)
+            db.execute_insert("INSERT INTO clients (hostname, ip_address, port, status) VALUES (%s, %s, %s, %s)",
+                              ('upsert-other-host', '10.0.0.12', 1, 'online'))
+            self.assertEqual(db.execute_upsert('clients', columns, keys, {'status': '{new}'},
+                                               ('upsert-old-host', '10.0.0.11', 1, 'offline'), returning_id=True),
+                             client_id)
+        self.assertIsNotNone(client_id)
+
+    def test_wal_mode(self):
+        """测试SQLite使用WAL模式"""
+        rows = db.execute_query("PRAGMA journal_mode")
+        self.assertEqual(rows[0]['journal_mode'], 'wal')
 
 if __name__ == '__main__':
     unittest.main()